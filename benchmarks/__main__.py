@@ -0,0 +1,5 @@
+from .suite import main
+
+
+if __name__ == "__main__":
+    main()
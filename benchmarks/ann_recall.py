@@ -0,0 +1,52 @@
+"""
+Recall@k and latency of the "ann" search engine mode against exhaustive search
+
+Usage: python -m benchmarks.ann_recall --size 2000 --n-probe 1 2 4 8 16
+"""
+import argparse
+import time
+
+import numpy as np
+
+from himpy.executor import Parser
+from utils.search_engine import SearchEngine, ApproximateIndex
+from .corpus import create_evaluator, load_corpus, generate_sample_histograms
+from .ranking import recall_at_k
+
+
+def main(args=None):
+    arg_parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    arg_parser.add_argument("--size", type=int, default=2000, help="number of documents")
+    arg_parser.add_argument("--queries", type=int, default=20, help="number of sample queries")
+    arg_parser.add_argument("--top-n", type=int, default=30)
+    arg_parser.add_argument("--n-probe", type=int, nargs="+", default=[1, 2, 4, 8, 16])
+    arg_parser.add_argument("--shortlist", type=int, default=200)
+    arg_parser.add_argument("--cache-dir", default=None, help="directory to cache generated corpora")
+    args = arg_parser.parse_args(args)
+
+    parser = Parser()
+    evaluator = create_evaluator(parser)
+    hists = load_corpus(args.size, cache_dir=args.cache_dir)
+    queries = generate_sample_histograms(args.queries)
+
+    exact_engine = SearchEngine(hists, parser, evaluator)
+    reference = [exact_engine.retrieve(query, top_n=args.top_n) for query in queries]
+
+    start_time = time.perf_counter()
+    ann_engine = ApproximateIndex(hists, parser, evaluator, shortlist=args.shortlist, random_state=0)
+    print("Indexing time (ann) in milliseconds: {:.1f}".format((time.perf_counter() - start_time) * 1000))
+
+    print("{:>8} {:>12} {:>14}".format("n_probe", "recall@{}".format(args.top_n), "latency, ms"))
+    for n_probe in args.n_probe:
+        ann_engine.n_probe = n_probe
+        recalls, latencies = [], []
+        for query, exact in zip(queries, reference):
+            start_time = time.perf_counter()
+            ranked = ann_engine.retrieve(query, top_n=args.top_n)
+            latencies.append((time.perf_counter() - start_time) * 1000)
+            recalls.append(recall_at_k(ranked, exact, args.top_n))
+        print("{:>8} {:>12.3f} {:>14.2f}".format(n_probe, np.mean(recalls), np.mean(latencies)))
+
+
+if __name__ == "__main__":
+    main()
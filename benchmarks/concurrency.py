@@ -0,0 +1,72 @@
+"""
+Query throughput of threads sharing one native index
+
+Every thread issues the same number of queries against a single "dll" or "native" engine,
+retrieve calls run without the GIL under the shared lock of the index. Candidates of a call
+are scored in --index-threads threads (1 by default, so the Python threads are the only
+parallelism and throughput should scale up to the number of cores).
+
+Usage: python -m benchmarks.concurrency --size 5000 --engines dll native --threads 1 2 4 8
+"""
+import argparse
+import os
+import threading
+import time
+
+from himpy.executor import Parser
+from .corpus import KINDS, QUERIES, create_evaluator, generate_sample_histograms, high_level_elements, load_corpus
+
+
+def throughput(engine, queries, threads, per_thread, top_n):
+    """Queries per second of threads each retrieving per_thread queries"""
+    barrier = threading.Barrier(threads + 1)
+
+    def work():
+        barrier.wait()
+        for i in range(per_thread):
+            engine.retrieve(queries[i % len(queries)], top_n=top_n)
+
+    workers = [threading.Thread(target=work) for _ in range(threads)]
+    for worker in workers:
+        worker.start()
+    barrier.wait()
+    start_time = time.perf_counter()
+    for worker in workers:
+        worker.join()
+    return threads * per_thread / (time.perf_counter() - start_time)
+
+
+def main(args=None):
+    arg_parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    arg_parser.add_argument("--size", type=int, default=5000, help="number of documents")
+    arg_parser.add_argument("--corpus", choices=KINDS, default="position")
+    arg_parser.add_argument("--engines", nargs="+", choices=["dll", "native"], default=["dll", "native"])
+    arg_parser.add_argument("--threads", type=int, nargs="+", default=[1, 2, 4, 8])
+    arg_parser.add_argument("--index-threads", type=int, default=1, help="threads of a retrieve call, 0 for all cores")
+    arg_parser.add_argument("--queries", type=int, default=20, help="queries per thread")
+    arg_parser.add_argument("--top-n", type=int, default=30)
+    arg_parser.add_argument("--cache-dir", default=None, help="directory to cache generated corpora")
+    args = arg_parser.parse_args(args)
+
+    from utils.search_engine import SearchEngine
+
+    parser = Parser()
+    evaluator = create_evaluator(parser, args.corpus)
+    rules = high_level_elements(parser, args.corpus)[1]
+    hists = load_corpus(args.size, args.corpus, cache_dir=args.cache_dir)
+    queries = generate_sample_histograms(10, args.corpus) + list(QUERIES[args.corpus].values())
+    print("CPU cores: {}".format(os.cpu_count()))
+
+    print("{:>8} {:>8} {:>14} {:>10}".format("engine", "threads", "queries/s", "speedup"))
+    for name in args.engines:
+        engine = SearchEngine(hists, parser, evaluator, mode=name, rules=rules, threads=args.index_threads or None)
+        throughput(engine, queries, 1, len(queries), args.top_n)
+        single = None
+        for threads in args.threads:
+            result = throughput(engine, queries, threads, args.queries, args.top_n)
+            single = single or result
+            print("{:>8} {:>8} {:>14.1f} {:>10.2f}".format(name, threads, result, result / single))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+"""
+Synthetic corpora of histograms used by the benchmarks
+
+Two kinds of corpora are supported:
+
+    position    (position, color) histograms of 100x100 images with 10x10 blocks on a 5x5 grid
+    color       color histograms of 100x100 images with 20x20 blocks
+"""
+import os
+import pickle
+
+from himpy.executor import Parser, Evaluator
+from himpy.histogram import operations, expressionOperations
+from himpy.utils import E
+from utils.datasets import ColorImageGenerator, BlockHistogramGenerator
+from utils.feature_extraction import ColorSetTransformer, create_histogram, create_position_histogram
+
+
+KINDS = ("position", "color")
+
+# Grid params: 5 splits along Y, and 5 along X
+GRID = (5, 5)
+
+IMAGE_SHAPE = (100, 100)
+IMAGE_STEPS = {"position": (10, 10), "color": (20, 20)}
+NORMAL_ELEMENT_IDS = {"e1", "e10", "e11", "e12", "e31", "e32", "e33", "e34"}
+
+COLOR_ELEMENTS = [
+    ("green", E("e1+e2+e3+e4+e5+e6+e7+e8+e9+e10+e11+e12+e13+e14+e15+e16+e17+e18+e19+e20")),
+    ("yellow_green", E("e2+e3+e21+e22+e23+e24+e25+e26+e27+e28+e29+e30")),
+    ("red", E("e31+e32+e33+e34+e35+e36+e37+e38+e39+e40")),
+    ("rose", E("e32+e35+e36+e39+e40")),
+    ("any", E("+".join("e{}".format(i) for i in range(1, 41))))
+]
+
+POSITION_ELEMENTS = [
+    ("top", E("1+2+3+4+5+6+7+8+9+10")),
+    ("bottom", E("16+17+18+19+20+21+22+23+24+25")),
+    ("left", E("1+2+6+7+11+12+16+17+21+22")),
+    ("right", E("4+5+9+10+14+15+19+20+24+25")),
+    ("center", E("7+8+9+12+13+14+17+18+19")),
+    ("any", E("+".join(str(i) for i in range(1, 26))))
+]
+
+# Expression queries: a selective one and a wide one
+QUERIES = {
+    "position": {
+        "query": E("top", "green") * E("center", "yellow_green"),
+        "query_big": E("top", "green") + E("any", "red")
+    },
+    "color": {
+        "query": E("green") * E("yellow_green"),
+        "query_big": (E("green") + E("red")).Sub(E("rose"))
+    }
+}
+
+
+def high_level_elements(parser: Parser, kind="position"):
+    """
+    High-level elements of the corpus kind
+
+    Returns
+    -------
+    elements for Evaluator and rules for the "dll" mode
+    """
+    color_set = {name: parser.parse_set(element.value) for name, element in COLOR_ELEMENTS}
+    if kind == "color":
+        return color_set, color_set
+    position_set = {name: parser.parse_set(element.value) for name, element in POSITION_ELEMENTS}
+    return {0: position_set, 1: color_set}, [position_set, color_set]
+
+
+def create_evaluator(parser: Parser, kind="position"):
+    return Evaluator(operations, expressionOperations, high_level_elements=high_level_elements(parser, kind)[0])
+
+
+def generate_images(size, kind="position", random_state=0, n_jobs=1):
+    """Images of the corpus kind, about a half of position images has normally distributed elements"""
+    batches = ColorImageGenerator().iter_batches(
+        size, IMAGE_SHAPE, steps=IMAGE_STEPS[kind],
+        normal_element_ids=NORMAL_ELEMENT_IDS if kind == "position" else None, normal_share=0.5,
+        n_jobs=n_jobs, random_state=random_state)
+    return [image for batch in batches for image in batch]
+
+
+def create_histograms(images, kind="position"):
+    color_transformer = ColorSetTransformer()
+    hists = list()
+    for indx, image in enumerate(images):
+        color_image = color_transformer.transform(image)
+        if kind == "color":
+            hist = create_histogram((color_image,))
+        else:
+            hist = create_position_histogram(color_image, GRID)
+        hists.append((indx, hist))
+    return hists
+
+
+def generate_sample_histograms(count, kind="position", random_state=1_000_000):
+    """Query-by-example histograms of images that are not in the corpora"""
+    return BlockHistogramGenerator(GRID if kind == "position" else None).generate(
+        count, IMAGE_SHAPE, steps=IMAGE_STEPS[kind], normal_element_ids={"e33", "e34"}, normal_share=0.5,
+        random_state=random_state)
+
+
+def generate_histograms(size, kind="position", random_state=0, n_jobs=1):
+    """Histograms of generate_images computed without painting the images"""
+    batches = BlockHistogramGenerator(GRID if kind == "position" else None).iter_batches(
+        size, IMAGE_SHAPE, steps=IMAGE_STEPS[kind],
+        normal_element_ids=NORMAL_ELEMENT_IDS if kind == "position" else None, normal_share=0.5,
+        n_jobs=n_jobs, random_state=random_state)
+    return list(enumerate(hist for batch in batches for hist in batch))
+
+
+def corpus_path(cache_dir, size, kind="position", random_state=0):
+    return os.path.join(cache_dir, "corpus_{}_{}_{}.pkcl".format(kind, size, random_state))
+
+
+def load_corpus(size, kind="position", cache_dir=None, random_state=0, n_jobs=1):
+    """Histograms of a generated corpus, cached in cache_dir if provided"""
+    path = None
+    if cache_dir is not None:
+        path = corpus_path(cache_dir, size, kind, random_state)
+        if os.path.exists(path):
+            with open(path, "rb") as f:
+                return pickle.load(f)
+    hists = generate_histograms(size, kind, random_state=random_state, n_jobs=n_jobs)
+    if path is not None:
+        os.makedirs(cache_dir, exist_ok=True)
+        with open(path, "wb") as f:
+            pickle.dump(hists, f)
+    return hists
@@ -0,0 +1,90 @@
+"""
+Cross-bin quadratic-form similarity against histogram intersection for query by histogram
+
+    intersection    "classic" mode, posting lists of the query elements
+    widened         "classic" mode with queries spread over similar elements (A q), the manual
+                    way to match adjacent cells and close colors with the intersection
+    crossbin        "crossbin" mode, sparse products of all documents with A q
+
+Overlap@k is measured against the crossbin ranking.
+
+Usage: python -m benchmarks.cross_bin --size 10000 --corpus position
+"""
+import argparse
+import time
+
+import numpy as np
+
+from himpy.executor import Parser
+from himpy.histogram import Histogram, HElement
+from utils.feature_extraction import color_element_similarity, position_element_similarity
+from utils.similarity import ElementSimilarity, QuadraticFormSimilarity
+from utils.tracing import QueryStats
+from .corpus import GRID, KINDS, create_evaluator, generate_sample_histograms, load_corpus
+from .ranking import recall_at_k
+
+
+def element_similarity(kind="position", max_distance=0.4, neighbour_weight=0.5) -> ElementSimilarity:
+    """Similarity of elements of the corpus kind: close colors and, for "position", adjacent grid cells"""
+    color = ElementSimilarity(color_element_similarity(max_distance=max_distance))
+    if kind == "color":
+        return color
+    return ElementSimilarity.product(ElementSimilarity(position_element_similarity(GRID, neighbour_weight)), color)
+
+
+def widen(query: Histogram, similarity: ElementSimilarity) -> Histogram:
+    """Query histogram spread over similar elements"""
+    spread = QuadraticFormSimilarity(similarity).spread(query)
+    hist = Histogram(data=None)
+    hist._histogram_elements = {element: HElement(element, value) for element, value in spread.items()}
+    return hist
+
+
+def main(args=None):
+    arg_parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    arg_parser.add_argument("--size", type=int, default=10000, help="number of documents")
+    arg_parser.add_argument("--corpus", choices=KINDS, default="position")
+    arg_parser.add_argument("--queries", type=int, default=10, help="number of sample queries")
+    arg_parser.add_argument("--top-n", type=int, default=30)
+    arg_parser.add_argument("--max-distance", type=float, default=0.4, help="of color_element_similarity")
+    arg_parser.add_argument("--neighbour-weight", type=float, default=0.5, help="of position_element_similarity")
+    arg_parser.add_argument("--cache-dir", default=None, help="directory to cache generated corpora")
+    args = arg_parser.parse_args(args)
+
+    from utils.search_engine import InvertedIndex, CrossBinIndex
+
+    parser = Parser()
+    evaluator = create_evaluator(parser, args.corpus)
+    hists = load_corpus(args.size, args.corpus, cache_dir=args.cache_dir)
+    queries = generate_sample_histograms(args.queries, args.corpus)
+    similarity = element_similarity(args.corpus, args.max_distance, args.neighbour_weight)
+
+    engines = dict()
+    for name, create in (("intersection", lambda: InvertedIndex(hists, parser, evaluator)),
+                         ("crossbin", lambda: CrossBinIndex(hists, parser, evaluator, element_similarity=similarity))):
+        start_time = time.perf_counter()
+        engines[name] = create()
+        print("Indexing time ({}) in milliseconds: {:.1f}".format(name, (time.perf_counter() - start_time) * 1000))
+    settings = [("intersection", engines["intersection"], queries),
+                ("widened", engines["intersection"], [widen(query, similarity) for query in queries]),
+                ("crossbin", engines["crossbin"], queries)]
+    reference = [engines["crossbin"].retrieve(query, top_n=args.top_n) for query in queries]
+
+    print("{:>14} {:>16} {:>14} {:>12} {:>12}".format(
+        "similarity", "query elements", "latency, ms", "candidates", "overlap@{}".format(args.top_n)))
+    for name, engine, engine_queries in settings:
+        latencies, candidates, overlaps = [], [], []
+        for query, exact in zip(engine_queries, reference):
+            stats = QueryStats()
+            start_time = time.perf_counter()
+            ranked = engine.retrieve(query, top_n=args.top_n, stats=stats)
+            latencies.append((time.perf_counter() - start_time) * 1000)
+            candidates.append(stats.candidates)
+            overlaps.append(recall_at_k(ranked, exact, args.top_n))
+        print("{:>14} {:>16.1f} {:>14.2f} {:>12.0f} {:>12.3f}".format(
+            name, np.mean([len(query) for query in engine_queries]), np.mean(latencies), np.mean(candidates),
+            np.mean(overlaps)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+"""
+Ingest time and ranking quality of histograms of downsampled images
+
+Rankings of an index of downsampled histograms are compared to full-resolution ones
+by overlap@k and Kendall tau of the full-resolution top k.
+
+Usage: python -m benchmarks.downsampling --size 200 --shape 400 --factors 1 2 4 8
+"""
+import argparse
+import time
+
+import numpy as np
+
+from himpy.executor import Parser
+from utils.datasets import ColorImageGenerator
+from utils.ingest import HistogramExtractor, extract_histograms
+from utils.search_engine import SearchEngine
+from .corpus import GRID, NORMAL_ELEMENT_IDS, QUERIES, create_evaluator
+from .ranking import recall_at_k, kendall_tau_at_k
+
+
+def rankings(hists, queries, parser, evaluator):
+    """Rankings of all documents for every query"""
+    search_engine = SearchEngine(hists, parser, evaluator, mode="classic")
+    return [search_engine.retrieve(query, top_n=len(hists), threshold=0.0) for query in queries]
+
+
+def main(args=None):
+    arg_parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    arg_parser.add_argument("--size", type=int, default=200, help="number of documents")
+    arg_parser.add_argument("--shape", type=int, default=400, help="height and width of images")
+    arg_parser.add_argument("--steps", type=int, default=37, help="height and width of color blocks")
+    arg_parser.add_argument("--queries", type=int, default=10, help="number of sample queries")
+    arg_parser.add_argument("--top-n", type=int, default=30)
+    arg_parser.add_argument("--factors", type=int, nargs="+", default=[1, 2, 4, 8])
+    arg_parser.add_argument("--methods", nargs="+", choices=["stride", "area"], default=["stride", "area"])
+    arg_parser.add_argument("--n-jobs", type=int, default=1)
+    args = arg_parser.parse_args(args)
+
+    parser = Parser()
+    evaluator = create_evaluator(parser)
+    image_generator = ColorImageGenerator()
+    options = dict(steps=(args.steps, args.steps), normal_element_ids=NORMAL_ELEMENT_IDS, normal_share=0.5)
+    images = image_generator.generate_batch(args.size, (args.shape, args.shape), random_state=0, **options)
+    samples = image_generator.generate_batch(args.queries, (args.shape, args.shape), random_state=1_000_000, **options)
+
+    def measure(factor, method):
+        extractor = HistogramExtractor(GRID, downsample=factor, downsample_method=method)
+        start_time = time.perf_counter()
+        hists = list(extract_histograms(images, extractor, n_jobs=args.n_jobs))
+        elapsed = (time.perf_counter() - start_time) * 1000 / args.size
+        queries = [extractor(sample) for sample in samples] + list(QUERIES["position"].values())
+        return elapsed, rankings(hists, queries, parser, evaluator)
+
+    full_time, reference = measure(1, "stride")
+    print("{:>7} {:>7} {:>12} {:>8} {:>14} {:>10} {:>14} {:>10}".format(
+        "method", "factor", "ms / image", "speedup", "hist overlap", "hist tau", "expr overlap", "expr tau"))
+    print("{:>7} {:>7} {:>12.2f}".format("-", 1, full_time))
+    for method in args.methods:
+        for factor in args.factors:
+            if factor == 1:
+                continue
+            elapsed, ranked = measure(factor, method)
+            k = args.top_n
+            overlaps = [recall_at_k(r, e, k) for r, e in zip(ranked, reference)]
+            taus = [kendall_tau_at_k(r, e, k) for r, e in zip(ranked, reference)]
+            print("{:>7} {:>7} {:>12.2f} {:>8.1f} {:>14.3f} {:>10.3f} {:>14.3f} {:>10.3f}".format(
+                method, factor, elapsed, full_time / elapsed,
+                np.mean(overlaps[:args.queries]), np.mean(taus[:args.queries]),
+                np.mean(overlaps[args.queries:]), np.mean(taus[args.queries:])))
+
+
+if __name__ == "__main__":
+    main()
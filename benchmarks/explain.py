@@ -0,0 +1,44 @@
+"""
+EXPLAIN of expression queries against the synthetic corpora, see utils.profiler
+
+The index and the rules default to a generated corpus and its high-level elements,
+--save-rules writes them as a JSON file of utils.profiler.
+
+Usage: python -m benchmarks.explain --corpus position --size 1000 "(top,green)*(any,red)"
+       python -m benchmarks.explain --corpus color --statistics --save-rules rules_color.json
+"""
+import json
+
+from himpy.executor import Parser
+from utils.profiler import create_arg_parser, load_index, load_rules, run
+from .corpus import KINDS, high_level_elements, load_corpus
+
+
+def main(args=None):
+    arg_parser = create_arg_parser(__doc__.strip().splitlines()[0], index_required=False)
+    arg_parser.add_argument("--corpus", choices=KINDS, default="position", help="high-level elements of the queries")
+    arg_parser.add_argument("--size", type=int, default=1000, help="number of documents of a synthetic corpus")
+    arg_parser.add_argument("--cache-dir", default=None, help="directory to cache generated corpora")
+    arg_parser.add_argument("--save-rules", help="write the high-level elements of the corpus to a JSON file")
+    args = arg_parser.parse_args(args)
+    if not args.queries and not args.queries_file and not args.statistics and not args.save_rules:
+        arg_parser.error("no queries given")
+
+    parser = Parser()
+    if args.rules:
+        elements, rules = load_rules(args.rules, parser)
+    else:
+        elements, rules = high_level_elements(parser, args.corpus)
+    if args.save_rules:
+        dimensions = rules if isinstance(rules, list) else [rules]
+        data = [{name: sorted(ids) for name, ids in dimension.items()} for dimension in dimensions]
+        with open(args.save_rules, "w", encoding="utf-8") as f:
+            json.dump(data if isinstance(rules, list) else data[0], f, indent=1)
+    if not args.queries and not args.queries_file and not args.statistics:
+        return
+    hists = load_index(args.index) if args.index else load_corpus(args.size, args.corpus, cache_dir=args.cache_dir)
+    run(args, hists, parser, elements, rules)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+"""
+Recall@k and latency of query-by-histogram with truncated query histograms
+
+Candidates are generated from posting lists of the largest query elements only, kept
+either by count (--elements) or by the fraction of the query mass (--mass).
+
+Usage: python -m benchmarks.query_truncation --size 5000 --elements 5 10 20 --mass 0.5 0.8 0.9
+"""
+import argparse
+import time
+
+import numpy as np
+
+from himpy.executor import Parser
+from utils.search_engine import InvertedIndex
+from utils.tracing import QueryStats
+from .corpus import KINDS, create_evaluator, load_corpus, generate_sample_histograms
+from .ranking import recall_at_k
+
+
+def measure(engine, queries, reference, top_n):
+    """Mean recall@top_n, latency in milliseconds, candidates and query elements of an engine"""
+    recalls, latencies, candidates = [], [], []
+    for query, exact in zip(queries, reference):
+        stats = QueryStats()
+        start_time = time.perf_counter()
+        ranked = engine.retrieve(query, top_n=top_n, stats=stats)
+        latencies.append((time.perf_counter() - start_time) * 1000)
+        recalls.append(recall_at_k(ranked, exact, top_n))
+        candidates.append(stats.candidates)
+    return np.mean(recalls), np.mean(latencies), np.mean(candidates)
+
+
+def main(args=None):
+    arg_parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    arg_parser.add_argument("--size", type=int, default=5000, help="number of documents")
+    arg_parser.add_argument("--corpus", choices=KINDS, default="position")
+    arg_parser.add_argument("--queries", type=int, default=20, help="number of sample queries")
+    arg_parser.add_argument("--top-n", type=int, default=30)
+    arg_parser.add_argument("--elements", type=int, nargs="*", default=[5, 10, 20, 40])
+    arg_parser.add_argument("--mass", type=float, nargs="*", default=[0.5, 0.8, 0.9, 0.95])
+    arg_parser.add_argument("--truncated-scoring", action="store_true", help="score with the truncated query")
+    arg_parser.add_argument("--cache-dir", default=None, help="directory to cache generated corpora")
+    args = arg_parser.parse_args(args)
+
+    parser = Parser()
+    evaluator = create_evaluator(parser, args.corpus)
+    hists = load_corpus(args.size, args.corpus, cache_dir=args.cache_dir)
+    queries = generate_sample_histograms(args.queries, args.corpus)
+    print("Mean query elements: {:.1f}".format(np.mean([len(query) for query in queries])))
+
+    exact_engine = InvertedIndex(hists, parser, evaluator)
+    reference = [exact_engine.retrieve(query, top_n=args.top_n) for query in queries]
+    settings = [("full", exact_engine)]
+    for query_elements in args.elements:
+        settings.append(("elements={}".format(query_elements), InvertedIndex(
+            hists, parser, evaluator, query_elements=query_elements, truncated_scoring=args.truncated_scoring)))
+    for query_mass in args.mass:
+        settings.append(("mass={:g}".format(query_mass), InvertedIndex(
+            hists, parser, evaluator, query_mass=query_mass, truncated_scoring=args.truncated_scoring)))
+
+    print("{:>14} {:>12} {:>14} {:>12}".format("query", "recall@{}".format(args.top_n), "latency, ms", "candidates"))
+    for name, engine in settings:
+        recall, latency, candidates = measure(engine, queries, reference, args.top_n)
+        print("{:>14} {:>12.3f} {:>14.2f} {:>12.0f}".format(name, recall, latency, candidates))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,29 @@
+"""
+Ranking quality metrics
+"""
+import numpy as np
+
+
+def recall_at_k(ranked, reference, k):
+    """Share of the reference top k documents found in the ranked top k, i.e. overlap@k"""
+    relevant = {doc_id for doc_id, _ in reference[:k]}
+    if not relevant:
+        return 1.0
+    return len(relevant.intersection(doc_id for doc_id, _ in ranked[:k])) / len(relevant)
+
+
+def kendall_tau(x, y):
+    """Kendall tau-b rank correlation of two sequences of scores"""
+    x, y = np.asarray(x, dtype=float), np.asarray(y, dtype=float)
+    upper = np.triu_indices(len(x), 1)
+    dx = np.sign(x[:, None] - x[None, :])[upper]
+    dy = np.sign(y[:, None] - y[None, :])[upper]
+    denominator = np.sqrt(np.count_nonzero(dx) * np.count_nonzero(dy))
+    return float((dx * dy).sum() / denominator) if denominator else 1.0
+
+
+def kendall_tau_at_k(ranked, reference, k):
+    """Kendall tau of the reference top k documents scored by both rankings, absent documents score 0"""
+    scores = dict(ranked)
+    top = reference[:k]
+    return kendall_tau([score for _, score in top], [scores.get(doc_id, 0.0) for doc_id, _ in top])
@@ -0,0 +1,69 @@
+"""
+Size, dump and load time of a histogram corpus: pickle vs columnar formats
+
+Usage: python -m benchmarks.serialization --size 10000 --corpus position
+"""
+import argparse
+import os
+import pickle
+import tempfile
+import time
+
+from himpy.serialization import read_corpus, write_corpus
+from .corpus import KINDS, load_corpus
+
+
+def dump_pickle(path, hists):
+    with open(path, "wb") as f:
+        pickle.dump(hists, f)
+
+
+def load_pickle(path):
+    with open(path, "rb") as f:
+        return pickle.load(f)
+
+
+FORMATS = {
+    "pickle": (dump_pickle, load_pickle),
+    "columnar": (lambda path, hists: write_corpus(path, hists), read_corpus),
+    "columnar-f64": (lambda path, hists: write_corpus(path, hists, double=True), read_corpus),
+    "columnar-zlib": (lambda path, hists: write_corpus(path, hists, compress=True), read_corpus),
+}
+
+
+def best_of(func, repeat):
+    """Minimum time of func in milliseconds"""
+    elapsed = list()
+    for _ in range(repeat):
+        start_time = time.perf_counter()
+        func()
+        elapsed.append((time.perf_counter() - start_time) * 1000)
+    return min(elapsed)
+
+
+def main(args=None):
+    arg_parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    arg_parser.add_argument("--size", type=int, default=10000, help="number of documents")
+    arg_parser.add_argument("--corpus", choices=KINDS, default="position")
+    arg_parser.add_argument("--formats", nargs="+", choices=list(FORMATS), default=list(FORMATS))
+    arg_parser.add_argument("--repeat", type=int, default=3)
+    arg_parser.add_argument("--cache-dir", default=None)
+    args = arg_parser.parse_args(args)
+
+    hists = load_corpus(args.size, args.corpus, cache_dir=args.cache_dir)
+    print("{:>14} {:>10} {:>8} {:>10} {:>10}".format("format", "size, MB", "ratio", "dump, ms", "load, ms"))
+    with tempfile.TemporaryDirectory() as directory:
+        baseline = None
+        for name in args.formats:
+            dump, load = FORMATS[name]
+            path = os.path.join(directory, name)
+            dump_time = best_of(lambda: dump(path, hists), args.repeat)
+            load_time = best_of(lambda: load(path), args.repeat)
+            size = os.path.getsize(path) / 2 ** 20
+            baseline = baseline or size
+            print("{:>14} {:>10.2f} {:>8.2f} {:>10.1f} {:>10.1f}".format(
+                name, size, size / baseline, dump_time, load_time))
+
+
+if __name__ == "__main__":
+    main()
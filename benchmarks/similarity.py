@@ -0,0 +1,55 @@
+"""
+Query-by-histogram latency of the similarity measures: pairwise, batch and native scoring
+
+    pairwise    Python scores of every document histogram
+    batch       vectorized scores of the dense vectors of all documents
+    dll         retrieve of the "dll" mode, the inverted index of library.cpp
+
+Usage: python -m benchmarks.similarity --size 5000 --corpus position
+"""
+import argparse
+
+from himpy.executor import Parser
+from utils.similarity import SIMILARITIES
+from utils.vectorization import HistogramVectorizer
+from .corpus import KINDS, generate_sample_histograms, high_level_elements, load_corpus
+from .serialization import best_of
+
+
+def main(args=None):
+    arg_parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    arg_parser.add_argument("--size", type=int, default=5000, help="number of documents")
+    arg_parser.add_argument("--corpus", choices=KINDS, default="position")
+    arg_parser.add_argument("--queries", type=int, default=5, help="number of sample queries")
+    arg_parser.add_argument("--similarities", nargs="+", choices=list(SIMILARITIES), default=list(SIMILARITIES))
+    arg_parser.add_argument("--top-n", type=int, default=30)
+    arg_parser.add_argument("--repeat", type=int, default=3)
+    arg_parser.add_argument("--no-dll", action="store_true", help="skip the native library")
+    arg_parser.add_argument("--cache-dir", default=None, help="directory to cache generated corpora")
+    args = arg_parser.parse_args(args)
+
+    from utils.search_engine import InvertedIndexCpp
+
+    parser = Parser()
+    hists = load_corpus(args.size, args.corpus, cache_dir=args.cache_dir)
+    queries = generate_sample_histograms(args.queries, args.corpus)
+    vectorizer = HistogramVectorizer().fit([hist for _, hist in hists])
+    X = vectorizer.transform([hist for _, hist in hists])
+    Q = vectorizer.transform(queries)
+    rules = high_level_elements(parser, args.corpus)[1]
+
+    print("{:>14} {:>14} {:>12} {:>10}".format("similarity", "pairwise, ms", "batch, ms", "dll, ms"))
+    for name in args.similarities:
+        similarity = SIMILARITIES[name]
+        pairwise = best_of(lambda: [[similarity(query, hist) for _, hist in hists] for query in queries], args.repeat)
+        batch = best_of(lambda: [similarity.batch(X, q) for q in Q], args.repeat)
+        native = float("nan")
+        if not args.no_dll and similarity.code is not None:
+            engine = InvertedIndexCpp(hists, parser, rules, similarity=similarity)
+            native = best_of(lambda: [engine.retrieve(query, top_n=args.top_n) for query in queries], args.repeat)
+        print("{:>14} {:>14.2f} {:>12.2f} {:>10.2f}".format(
+            name, pairwise / len(queries), batch / len(queries), native / len(queries)))
+
+
+if __name__ == "__main__":
+    main()
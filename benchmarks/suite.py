@@ -0,0 +1,203 @@
+"""
+Benchmark suite of the search engine modes
+
+Measures indexing, query-by-expression and query-by-histogram latencies (p50/p95/p99),
+throughput and peak RSS on synthetic corpora of several sizes, and writes them to a JSON file.
+
+Usage:
+    python -m benchmarks run --sizes 200 1000 5000 --engines classic dll --output results.json
+    python -m benchmarks compare baseline.json results.json
+"""
+import argparse
+import datetime
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+
+from himpy.executor import Parser, ExpressionCache
+from .corpus import KINDS, QUERIES, create_evaluator, generate_sample_histograms, high_level_elements, load_corpus
+from .cross_bin import element_similarity
+from .timing import measure, summarize, peak_rss_mb
+
+
+# Engine name: (SearchEngine mode, factory of keyword arguments for the corpus kind)
+ENGINES = {
+    "default": ("default", lambda kind: {}),
+    "classic": ("classic", lambda kind: {}),
+    "classic-cache": ("classic", lambda kind: {"expression_cache": ExpressionCache()}),
+    "classic-planning": ("classic", lambda kind: {"planning": True}),
+    "classic-materialize": ("classic", lambda kind: {"materialize": True}),
+    "classic-pruning": ("classic", lambda kind: {"pruning": True}),
+    "classic-impact": ("classic", lambda kind: {"impact_ordered": True}),
+    "parallel": ("parallel", lambda kind: {}),
+    "dll": ("dll", lambda kind: {}),
+    "dll-pruning": ("dll", lambda kind: {"pruning": True}),
+    "dll-impact": ("dll", lambda kind: {"impact_ordered": True}),
+    "native": ("native", lambda kind: {}),
+    "ann": ("ann", lambda kind: {"random_state": 0}),
+    "coarse": ("coarse", lambda kind: {}),
+    "crossbin": ("crossbin", lambda kind: {"element_similarity": element_similarity(kind)})
+}
+
+
+def benchmark_engine(engine, hists, kind="position", top_n=30, repeat=10, index_repeat=1, sample_count=10):
+    """
+    Benchmark a single engine on the corpus
+
+    Returns
+    -------
+    dictionary {operation: latency summary} with the peak RSS of the process
+    """
+    from utils.search_engine import SearchEngine
+
+    mode, make_kwargs = ENGINES[engine]
+    parser = Parser()
+    evaluator = create_evaluator(parser, kind)
+    rules = high_level_elements(parser, kind)[1]
+
+    search_engine = None
+
+    def build():
+        nonlocal search_engine
+        search_engine = SearchEngine(hists, parser, evaluator, mode=mode, rules=rules, **make_kwargs(kind))
+
+    result = {"indexing": summarize(measure(build, index_repeat))}
+    for name, query in QUERIES[kind].items():
+        result[name] = summarize(measure(lambda: search_engine.retrieve(query, top_n=top_n), repeat))
+    samples = generate_sample_histograms(sample_count, kind)
+    latencies = list()
+    for sample in samples:
+        latencies.extend(measure(lambda: search_engine.retrieve(sample, top_n=top_n), max(1, repeat // len(samples))))
+    result["histogram"] = summarize(latencies)
+    result["peak_rss_mb"] = peak_rss_mb()
+    return result
+
+
+def _benchmark_isolated(engine, size, kind, cache_dir, options):
+    hists = load_corpus(size, kind, cache_dir=cache_dir)
+    return benchmark_engine(engine, hists, kind, **options)
+
+
+def run(sizes, engines, kind="position", top_n=30, repeat=10, index_repeat=1, sample_count=10,
+        cache_dir=None, isolate=True, verbose=True):
+    """
+    Benchmark the engines on corpora of the sizes
+
+    With isolate every engine runs in a fresh process, so the peak RSS belongs to that engine only.
+    """
+    options = dict(top_n=top_n, repeat=repeat, index_repeat=index_repeat, sample_count=sample_count)
+    results = list()
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        cache_dir = cache_dir or tmp_dir
+        for size in sizes:
+            hists = load_corpus(size, kind, cache_dir=cache_dir)
+            for engine in engines:
+                if verbose:
+                    print("{} corpus of {} documents: {}".format(kind, size, engine), file=sys.stderr)
+                if isolate:
+                    with ProcessPoolExecutor(max_workers=1, mp_context=get_context("spawn")) as executor:
+                        result = executor.submit(
+                            _benchmark_isolated, engine, size, kind, cache_dir, options).result()
+                else:
+                    result = benchmark_engine(engine, hists, kind, **options)
+                results.append(dict(corpus=kind, size=size, engine=engine, **result))
+    return results
+
+
+def metadata(args=None):
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "HEAD"], capture_output=True, text=True,
+            cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {
+        "timestamp": datetime.datetime.now().isoformat(timespec="seconds"),
+        "commit": commit,
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "processor": platform.processor() or platform.machine(),
+        "cpu_count": os.cpu_count(),
+        "args": args
+    }
+
+
+def compare(baseline, results, metric="p50_ms"):
+    """Rows (corpus, size, engine, operation, baseline, result, ratio) of the metric in both runs"""
+    operations = ("indexing",) + tuple(QUERIES[KINDS[0]]) + ("histogram",)
+    baseline_rows = {(r["corpus"], r["size"], r["engine"]): r for r in baseline["results"]}
+    rows = list()
+    for result in results["results"]:
+        base = baseline_rows.get((result["corpus"], result["size"], result["engine"]))
+        if base is None:
+            continue
+        for operation in operations:
+            if operation not in result or operation not in base:
+                continue
+            before, after = base[operation][metric], result[operation][metric]
+            rows.append((result["corpus"], result["size"], result["engine"], operation,
+                         before, after, after / before if before else None))
+    return rows
+
+
+def _print_results(results):
+    print("{:<9} {:>7} {:<20} {:<10} {:>10} {:>10} {:>10} {:>10} {:>9}".format(
+        "corpus", "size", "engine", "operation", "p50, ms", "p95, ms", "p99, ms", "per s", "rss, MB"))
+    for result in results:
+        for operation, summary in result.items():
+            if not isinstance(summary, dict):
+                continue
+            print("{:<9} {:>7} {:<20} {:<10} {:>10.2f} {:>10.2f} {:>10.2f} {:>10.1f} {:>9}".format(
+                result["corpus"], result["size"], result["engine"], operation,
+                summary["p50_ms"], summary["p95_ms"], summary["p99_ms"], summary["throughput_per_s"] or 0,
+                "-" if result["peak_rss_mb"] is None else "{:.1f}".format(result["peak_rss_mb"])))
+
+
+def main(args=None):
+    arg_parser = argparse.ArgumentParser(prog="python -m benchmarks", description=__doc__.strip().splitlines()[0])
+    commands = arg_parser.add_subparsers(dest="command", required=True)
+
+    run_parser = commands.add_parser("run", help="run the benchmarks")
+    run_parser.add_argument("--sizes", type=int, nargs="+", default=[200, 1000])
+    run_parser.add_argument("--engines", nargs="+", choices=list(ENGINES),
+                            default=["default", "classic", "parallel", "dll"])
+    run_parser.add_argument("--corpus", choices=KINDS, default="position")
+    run_parser.add_argument("--top-n", type=int, default=30)
+    run_parser.add_argument("--repeat", type=int, default=10, help="runs of every query")
+    run_parser.add_argument("--index-repeat", type=int, default=1, help="runs of indexing")
+    run_parser.add_argument("--samples", type=int, default=10, help="number of query-by-histogram samples")
+    run_parser.add_argument("--cache-dir", default=None, help="directory to cache generated corpora")
+    run_parser.add_argument("--no-isolate", action="store_true", help="run all engines in this process")
+    run_parser.add_argument("--output", default=None, help="JSON file of the results")
+
+    compare_parser = commands.add_parser("compare", help="compare two JSON files of results")
+    compare_parser.add_argument("baseline")
+    compare_parser.add_argument("results")
+    compare_parser.add_argument("--metric", default="p50_ms")
+
+    args = arg_parser.parse_args(args)
+
+    if args.command == "compare":
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        with open(args.results) as f:
+            results = json.load(f)
+        print("{:<9} {:>7} {:<20} {:<10} {:>12} {:>12} {:>7}".format(
+            "corpus", "size", "engine", "operation", "baseline", "results", "ratio"))
+        for corpus, size, engine, operation, before, after, ratio in compare(baseline, results, args.metric):
+            print("{:<9} {:>7} {:<20} {:<10} {:>12.2f} {:>12.2f} {:>7}".format(
+                corpus, size, engine, operation, before, after, "-" if ratio is None else "{:.2f}".format(ratio)))
+        return
+
+    results = run(args.sizes, args.engines, kind=args.corpus, top_n=args.top_n, repeat=args.repeat,
+                  index_repeat=args.index_repeat, sample_count=args.samples, cache_dir=args.cache_dir,
+                  isolate=not args.no_isolate)
+    _print_results(results)
+    if args.output is not None:
+        with open(args.output, "w") as f:
+            json.dump({"meta": metadata(vars(args)), "results": results}, f, indent=4)
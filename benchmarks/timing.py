@@ -0,0 +1,53 @@
+"""
+Timing and memory measurements
+"""
+import sys
+import time
+from contextlib import contextmanager
+
+import numpy as np
+
+
+def measure(func, repeat=1):
+    """Wall times of repeated calls of func in milliseconds"""
+    latencies = list()
+    for _ in range(repeat):
+        start_time = time.perf_counter()
+        func()
+        latencies.append((time.perf_counter() - start_time) * 1000)
+    return latencies
+
+
+def summarize(latencies):
+    """Latency percentiles in milliseconds and throughput in calls per second"""
+    latencies = np.asarray(latencies, dtype=float)
+    total = latencies.sum() / 1000
+    return {
+        "count": int(latencies.size),
+        "mean_ms": float(latencies.mean()),
+        "min_ms": float(latencies.min()),
+        "p50_ms": float(np.percentile(latencies, 50)),
+        "p95_ms": float(np.percentile(latencies, 95)),
+        "p99_ms": float(np.percentile(latencies, 99)),
+        "max_ms": float(latencies.max()),
+        "throughput_per_s": float(latencies.size / total) if total > 0 else None
+    }
+
+
+def peak_rss_mb():
+    """Peak resident set size of the process in megabytes, None if it is unavailable"""
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # bytes on macOS, kilobytes on Linux
+    return peak / 1024 ** 2 if sys.platform == "darwin" else peak / 1024
+
+
+@contextmanager
+def timed(label):
+    """Print the execution time of the block"""
+    start_time = time.perf_counter()
+    yield
+    print("Execution time ({}) in milliseconds: {}".format(label, (time.perf_counter() - start_time) * 1000))
@@ -17,10 +17,21 @@ from .histogram import (
     operations,
     Histogram,
     Histogram1D,
-    Histogram2D
+    Histogram2D,
+    ExpressionUnion,
+    ExpressionIntersection,
+    ExpressionSubtraction,
+    ExpressionAnd,
+    ExpressionOr,
+    ExpressionXOr,
+    ExpressionXSubtraction
 )
 
-from typing import Union, List, Tuple
+import functools
+import itertools
+import time
+from collections import OrderedDict
+from typing import Union, List, Tuple, FrozenSet, Set, Dict
 
 
 class Parser:
@@ -87,6 +98,121 @@ class Parser:
                 break
 
 
+class ExpressionCache:
+    """
+    LRU cache of evaluated element (sub-)expressions
+
+    An entry maps a canonical sub-expression to a pair (document ids, index set)
+    as returned by Evaluator.eval_expression. Entries are only valid for the
+    storage they were computed on, so a cache must not be shared between indexes.
+
+    Parameters
+    ----------
+    max_entries     maximum number of cached sub-expressions
+    max_documents   maximum total number of document ids held by all entries
+    """
+
+    def __init__(self, max_entries: int = 1024, max_documents: Union[int, None] = None):
+        self._max_entries = max_entries
+        self._max_documents = max_documents
+        self._entries = OrderedDict()
+        self._num_documents = 0
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def canonical_key(tree, commutative_operations=()):
+        """
+        Canonical form of an expression tree
+
+        Operands of commutative operations are sorted, so "a+b" and "b+a" share an entry.
+        """
+        if not isinstance(tree, tuple):
+            return tree
+        op, left, right = tree
+        left = ExpressionCache.canonical_key(left, commutative_operations)
+        right = ExpressionCache.canonical_key(right, commutative_operations)
+        if op in commutative_operations and repr(left) > repr(right):
+            left, right = right, left
+        return op, left, right
+
+    def get(self, key) -> Union[Tuple[FrozenSet, FrozenSet], None]:
+        if key in self._entries:
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return self._entries[key]
+        self.misses += 1
+        return None
+
+    def put(self, key, value) -> Tuple[FrozenSet, FrozenSet]:
+        document_ids, indexes_set = frozenset(value[0]), frozenset(value[1])
+        entry = document_ids, indexes_set
+        if self._max_documents is not None and len(document_ids) > self._max_documents:
+            return entry
+        if key in self._entries:
+            self._num_documents -= len(self._entries.pop(key)[0])
+        self._entries[key] = entry
+        self._num_documents += len(document_ids)
+        while len(self._entries) > self._max_entries or \
+                (self._max_documents is not None and self._num_documents > self._max_documents):
+            _, evicted = self._entries.popitem(last=False)
+            self._num_documents -= len(evicted[0])
+        return entry
+
+    def clear(self):
+        self._entries.clear()
+        self._num_documents = 0
+        self.hits = 0
+        self.misses = 0
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class ExplainNode:
+    """
+    Node of an expression tree evaluated over posting lists
+
+    Parameters
+    ----------
+    token       operation sign or leaf
+    doc_ids     candidate documents of the node
+    indexes     index set of the node
+    time_ms     evaluation time of the node and its children in milliseconds
+    children    operand nodes of an operation
+    postings    {low-level element id: posting list size} of a leaf, None for elements not in the index
+    """
+
+    def __init__(
+            self, token: str, doc_ids: Set[int], indexes: Set, time_ms: float,
+            children: Tuple['ExplainNode', ...] = (), postings: Union[Dict[str, Union[int, None]], None] = None):
+        self.token = token
+        self.doc_ids = doc_ids
+        self.indexes = indexes
+        self.time_ms = time_ms
+        self.children = children
+        self.postings = postings
+
+    @property
+    def is_leaf(self) -> bool:
+        return not self.children
+
+    @property
+    def self_time_ms(self) -> float:
+        return self.time_ms - sum(child.time_ms for child in self.children)
+
+    def to_dict(self):
+        node = {"token": self.token, "candidates": len(self.doc_ids), "time_ms": self.time_ms}
+        if self.is_leaf:
+            node["postings"] = self.postings
+        else:
+            node["children"] = [child.to_dict() for child in self.children]
+        return node
+
+
 class Evaluator:
     """Evaluator for parsed element expressions/queries"""
     def __init__(self, operators, expression_operations, histogram=None, high_level_elements=None):
@@ -95,6 +221,11 @@ class Evaluator:
         self._EO = expression_operations
         self._extendedE = high_level_elements or dict()
 
+    @property
+    def expression_operations(self):
+        """Operations of eval_expression over (document ids, index set) pairs by sign"""
+        return self._EO
+
     def eval(self, expression, data_histogram=None, input_type="postfix", copy_expression=True):
 
         if copy_expression:
@@ -122,17 +253,68 @@ class Evaluator:
         else:
             return histogram(op, self._extendedE)
 
-    def eval_expression(self, expression, elements_sets, input_type="postfix", copy_expression=True):
+    def eval_expression(self, expression, elements_sets, input_type="postfix", copy_expression=True,
+                        cache: Union[ExpressionCache, None] = None):
         if copy_expression:
             expr = expression.copy()
         else:
             expr = expression
 
         if input_type == "postfix":
+            if cache is not None:
+                return self._cached_evaluate_expression(self.postfix_to_tree(expr), elements_sets, cache)[0]
             return self._postfix_evaluate_expression(expr, elements_sets)[0]
         else:
             raise NotImplemented("Not implemented yet.")
-        
+
+    def explain_expression(self, expression, elements_sets, input_type="postfix", copy_expression=True) -> ExplainNode:
+        """
+        Evaluate an expression like eval_expression, keeping candidates and time of every node
+
+        Returns
+        -------
+        root of the evaluated tree -> ExplainNode
+        """
+        expr = expression.copy() if copy_expression else expression
+        if input_type == "postfix":
+            return self._explain_tree(self.postfix_to_tree(expr), elements_sets)
+        raise ValueError("Unsupported input_type: {}".format(input_type))
+
+    def _explain_tree(self, tree, elements_sets) -> ExplainNode:
+        start_time = time.perf_counter()
+        if isinstance(tree, tuple):
+            op, op1, op2 = tree
+            children = self._explain_tree(op1, elements_sets), self._explain_tree(op2, elements_sets)
+            doc_ids, indexes = self._EO[op](*((child.doc_ids, child.indexes) for child in children))
+            return ExplainNode(op, doc_ids, indexes, (time.perf_counter() - start_time) * 1000, children)
+        doc_ids, indexes = self._postfix_evaluate_expression([tree], elements_sets)
+        time_ms = (time.perf_counter() - start_time) * 1000
+        postings = {index: len(elements_sets[index]) if index in elements_sets else None
+                    for index in sorted(self.leaf_elements(tree))}
+        return ExplainNode(tree, doc_ids, indexes, time_ms, postings=postings)
+
+    def postfix_to_tree(self, expression):
+        """Convert a postfix expression to a tree of (operation, left operand, right operand)"""
+        op = expression.pop()
+        if op in self._EO.keys():
+            op2 = self.postfix_to_tree(expression)
+            op1 = self.postfix_to_tree(expression)
+            return op, op1, op2
+        return op
+
+    def _cached_evaluate_expression(self, tree, elements_sets, cache):
+        key = ExpressionCache.canonical_key(
+            tree, {sign for sign, operation in self._EO.items() if operation.commutative})
+        result = cache.get(key)
+        if result is not None:
+            return result
+        if isinstance(tree, tuple):
+            op, op1, op2 = tree
+            arg1 = self._cached_evaluate_expression(op1, elements_sets, cache)
+            arg2 = self._cached_evaluate_expression(op2, elements_sets, cache)
+            return cache.put(key, self._EO[op](arg1, arg2))
+        return cache.put(key, self._postfix_evaluate_expression([tree], elements_sets))
+
     def _postfix_evaluate_expression(self, expression, elements_sets):
 
         op = expression.pop()
@@ -165,6 +347,69 @@ class Evaluator:
                 document_ids.update(elements_sets[op])
             return document_ids, indexes_set
 
+    def high_level_leaves(self):
+        """
+        Expression leaves that can be composed of registered high-level elements
+
+        For multidimensional high-level elements every combination of element names
+        is a leaf, e.g. "(top, green)".
+
+        Returns
+        -------
+        dictionary      {leaf: set of low-level element ids}
+        """
+        if self._extendedE and all(isinstance(dimension, int) for dimension in self._extendedE):
+            dimensions = sorted(self._extendedE)
+            leaves = ("(" + ", ".join(names) + ")" for names in itertools.product(
+                *(self._extendedE[dimension].keys() for dimension in dimensions)))
+        else:
+            leaves = self._extendedE.keys()
+        return {leaf: self.leaf_elements(leaf) for leaf in leaves}
+
+    @staticmethod
+    def element_leaves(leaves: Dict[str, Set[str]]) -> Dict[str, Tuple[str, ...]]:
+        """Leaves of every low-level element, the inverse of {leaf: set of low-level element ids}"""
+        element_leaves = dict()
+        for leaf, indexes_set in leaves.items():
+            for index in indexes_set:
+                element_leaves.setdefault(index, list()).append(leaf)
+        return {index: tuple(leaves) for index, leaves in element_leaves.items()}
+
+    def leaf_indexes(self, leaf) -> Set:
+        """Index set of an expression leaf as evaluated by eval_expression, tuples for multidimensional leaves"""
+        if leaf[0] == "(" and leaf[-1] == ")":
+            return self._cartesian_product(0, tuple(leaf.replace("(", "").replace(")", "").split(", ")))
+        elif leaf == "any":
+            indexes_set = set()
+            for high_level_elements_indexes_set in self._extendedE.values():
+                indexes_set.update(high_level_elements_indexes_set)
+            return indexes_set
+        elif leaf in self._extendedE:
+            return self._extendedE[leaf]
+        return {leaf}
+
+    def leaf_elements(self, leaf) -> Set[str]:
+        """Low-level element ids that an expression leaf stands for"""
+        return {", ".join(index) if isinstance(index, tuple) else index for index in self.leaf_indexes(leaf)}
+
+    def union_elements(self, expression) -> Union[Set[str], None]:
+        """
+        Low-level element ids of a postfix expression that is a union of leaves
+
+        The score of such an expression is the sum of the element values, so it can
+        be bounded per element. Returns None if the expression has other operations.
+        """
+        indexes_set = set()
+        for token in expression:
+            if token in self._EO:
+                if not isinstance(self._EO[token], (ExpressionUnion, ExpressionOr)):
+                    return None
+            elif token == "unary -":
+                return None
+            else:
+                indexes_set.update(self.leaf_elements(token))
+        return indexes_set if expression else None
+
     def _cartesian_product(self, dimension_index, high_level_elements_tuple):
         if len(high_level_elements_tuple) == 0:
             return set()
@@ -187,6 +432,151 @@ class Evaluator:
         return result_indexes_set
 
 
+class PlanNode:
+    """
+    Node of a query plan
+
+    Parameters
+    ----------
+    token       operation sign or leaf
+    indexes     index set of the node as evaluated by eval_expression
+    estimate    upper bound of the number of documents of the node
+    children    operands, chains of an associative operation are flattened
+    elements    low-level element ids of a leaf that are in the index
+    postings    total length of posting lists of the elements of a leaf
+    """
+
+    def __init__(
+            self, token: str, indexes: Set, estimate: int, children: List['PlanNode'] = (),
+            elements: List[str] = (), postings: int = 0):
+        self.token = token
+        self.indexes = indexes
+        self.estimate = estimate
+        self.children = children
+        self.elements = elements
+        self.postings = postings
+
+    def __repr__(self):
+        if not self.children:
+            return "{}[{}]".format(self.token, self.estimate)
+        return "({})[{}]".format((" " + self.token + " ").join(map(repr, self.children)), self.estimate)
+
+
+class QueryPlanner:
+    """
+    Cost-based evaluation of element expressions over posting lists
+
+    Index sets of all nodes are computed first, as they do not depend on documents,
+    then documents are evaluated following the plan:
+
+        * and &     chains are flattened and operands are evaluated from the smallest estimate,
+                    each one only among the documents of the previous ones; an intersection
+                    with an empty index set has no documents and its operands are not evaluated
+        + and |     chains are flattened
+        /           documents of the right operand are not evaluated
+        #/          the right operand is only evaluated among the documents of the left one
+
+    Results are identical to Evaluator.eval_expression.
+
+    Parameters
+    ----------
+    evaluator   evaluator of the high-level elements and expression operations
+    statistics  catalog with document frequencies of leaves, e.g. utils.statistics.IndexStatistics,
+                otherwise the number of documents of a leaf is bounded by its posting lists
+    """
+
+    flattened_operations = (ExpressionUnion, ExpressionOr, ExpressionIntersection, ExpressionAnd)
+
+    def __init__(self, evaluator: Evaluator, statistics=None):
+        self._evaluator = evaluator
+        self._statistics = statistics
+
+    def eval_expression(self, expression, elements_sets, input_type="postfix", copy_expression=True):
+        """Document ids of an expression like Evaluator.eval_expression"""
+        return self.evaluate(expression, elements_sets, input_type, copy_expression)[0]
+
+    def evaluate(self, expression, elements_sets, input_type="postfix", copy_expression=True) -> Tuple[Set, Set]:
+        """Document ids and index set of an expression"""
+        plan = self.plan(expression, elements_sets, input_type, copy_expression)
+        return self._documents(plan, elements_sets, None), plan.indexes
+
+    def plan(self, expression, elements_sets, input_type="postfix", copy_expression=True) -> PlanNode:
+        expr = expression.copy() if copy_expression else expression
+        if input_type == "postfix":
+            return self._plan(self._evaluator.postfix_to_tree(expr), elements_sets)
+        raise ValueError("Unsupported input_type: {}".format(input_type))
+
+    def _cardinality(self, index, elements_sets) -> int:
+        return len(elements_sets[index]) if index in elements_sets else 0
+
+    def _plan(self, tree, elements_sets) -> PlanNode:
+        if not isinstance(tree, tuple):
+            indexes = self._evaluator.leaf_indexes(tree)
+            elements = [", ".join(index) if isinstance(index, tuple) else index for index in indexes]
+            elements = [element for element in elements if element in elements_sets]
+            postings = sum(self._cardinality(element, elements_sets) for element in elements)
+            estimate = self._statistics.leaf_document_frequency(tree) if self._statistics is not None else None
+            return PlanNode(tree, indexes, postings if estimate is None else estimate, elements=elements, postings=postings)
+        op, op1, op2 = tree
+        operation = self._evaluator.expression_operations[op]
+        children = [self._plan(op1, elements_sets), self._plan(op2, elements_sets)]
+        if isinstance(operation, self.flattened_operations):
+            children = [node for child in children
+                        for node in (child.children if child.children and child.token == op else (child,))]
+        indexes = functools.reduce(operation, ((set(), child.indexes) for child in children))[1]
+        estimates = [child.estimate for child in children]
+        if isinstance(operation, ExpressionIntersection) and not indexes:
+            estimate = 0
+        elif isinstance(operation, (ExpressionIntersection, ExpressionAnd)):
+            children.sort(key=lambda child: child.estimate)
+            estimate = min(estimates)
+        elif isinstance(operation, (ExpressionSubtraction, ExpressionXSubtraction)):
+            estimate = estimates[0]
+        else:
+            estimate = sum(estimates)
+        return PlanNode(op, indexes, estimate, children)
+
+    def _documents(self, node: PlanNode, elements_sets, candidates: Union[Set, None]) -> Set:
+        """Documents of a node, only the ones among candidates if they are given"""
+        if not node.children:
+            return self._leaf_documents(node, elements_sets, candidates)
+        operation = self._evaluator.expression_operations[node.token]
+        if isinstance(operation, ExpressionIntersection) and not node.indexes:
+            return set()
+        if isinstance(operation, (ExpressionIntersection, ExpressionAnd)):
+            for child in node.children:
+                candidates = self._documents(child, elements_sets, candidates)
+                if not candidates:
+                    return set()
+            return candidates
+        if isinstance(operation, (ExpressionUnion, ExpressionOr)):
+            doc_ids = set()
+            for child in node.children:
+                doc_ids.update(self._documents(child, elements_sets, candidates))
+            return doc_ids
+        left, right = node.children
+        if isinstance(operation, ExpressionSubtraction):
+            return self._documents(left, elements_sets, candidates)
+        if isinstance(operation, ExpressionXSubtraction):
+            doc_ids = self._documents(left, elements_sets, candidates)
+            return doc_ids.difference(self._documents(right, elements_sets, doc_ids)) if doc_ids else doc_ids
+        if isinstance(operation, ExpressionXOr):
+            return self._documents(left, elements_sets, candidates).symmetric_difference(
+                self._documents(right, elements_sets, candidates))
+        doc_ids = operation(*((self._documents(child, elements_sets, None), child.indexes) for child in node.children))[0]
+        return doc_ids if candidates is None else doc_ids.intersection(candidates)
+
+    def _leaf_documents(self, node: PlanNode, elements_sets, candidates: Union[Set, None]) -> Set:
+        # Looking candidates up is cheaper than the union of large posting lists
+        if candidates is not None and len(candidates) * len(node.elements) < node.postings:
+            posting_lists = [elements_sets[element] for element in node.elements]
+            return {doc_id for doc_id in candidates if any(doc_id in doc_ids for doc_ids in posting_lists)}
+        doc_ids = set()
+        for element in node.elements:
+            doc_ids.update(elements_sets[element])
+        return doc_ids if candidates is None else doc_ids.intersection(candidates)
+
+
 class HistogramModel:
 
     def __init__(self, U=None, positioning=False, U_positions=None):
@@ -201,6 +201,45 @@ class Histogram:
             return {key: h_element.value for key, h_element in self._histogram_elements.items()}
         raise Exception("There are no elements.")
 
+    def to_bytes(self, double: bool = False) -> bytes:
+        """Compact binary form of the histogram, values are float32 unless double is set"""
+        from .serialization import histogram_to_bytes
+        return histogram_to_bytes(self, double)
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> 'Histogram':
+        """Histogram of the binary form created by to_bytes"""
+        from .serialization import histogram_from_bytes
+        return histogram_from_bytes(data, cls)
+
+    def truncate(self, max_elements: Union[int, None] = None, mass: Union[float, None] = None) -> 'Histogram':
+        """
+        Histogram of the elements with the largest values, values are not renormalized
+
+        Parameters
+        ----------
+        max_elements    number of kept elements
+        mass            fraction of the total value kept by the fewest elements, e.g. 0.9
+
+        Returns
+        -------
+        histogram of the same class with copies of the kept elements
+        """
+        ranked = sorted(self._histogram_elements.items(), key=lambda item: -item[1].value)
+        if max_elements is not None:
+            ranked = ranked[:max_elements]
+        if mass is not None:
+            bound = mass * sum(h_element.value for h_element in self._histogram_elements.values())
+            cumulative = 0.0
+            for count, (_, h_element) in enumerate(ranked, 1):
+                cumulative += h_element.value
+                if cumulative >= bound:
+                    ranked = ranked[:count]
+                    break
+        hist = self.__class__(data=None)
+        hist._histogram_elements = {key: HElement(h_element.key, h_element.value) for key, h_element in ranked}
+        return hist
+
     def normalize(self, size: Union[float, None] = None):
         if size:
             self._size = size
@@ -339,6 +378,7 @@ class OperationBase:
 
     sign = None
     description = None
+    commutative = False
 
     def compute(self, arg1, arg2):
         raise NotImplementedError
@@ -483,6 +523,7 @@ class ExpressionUnion(OperationBase):
 
     sign = "+"
     description = ""
+    commutative = True
 
     def compute(self, arg1, arg2):
         arg_d1, arg_k1 = arg1
@@ -494,6 +535,7 @@ class ExpressionIntersection(OperationBase):
 
     sign = "*"
     description = ""
+    commutative = True
 
     def compute(self, arg1, arg2):
         arg_d1, arg_k1 = arg1
@@ -520,6 +562,7 @@ class ExpressionAnd(OperationBase):
 
     sign = "&"
     description = ""
+    commutative = True
 
     def compute(self, arg1, arg2):
         arg_d1, arg_k1 = arg1
@@ -531,6 +574,7 @@ class ExpressionOr(OperationBase):
 
     sign = "|"
     description = ""
+    commutative = True
 
     def compute(self, arg1, arg2):
         arg_d1, arg_k1 = arg1
@@ -542,6 +586,7 @@ class ExpressionXOr(OperationBase):
 
     sign = "#|"
     description = ""
+    commutative = True
 
     def compute(self, arg1, arg2):
         arg_d1, arg_k1 = arg1
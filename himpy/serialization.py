@@ -0,0 +1,214 @@
+"""
+Histogram Serialization
+
+Compact binary formats of histograms:
+
+    histogram   a single histogram: element ids and their values
+    corpus      (doc id, histogram) pairs in columns: a vocabulary of element ids, doc ids,
+                offsets of documents, vocabulary indices of elements and their values
+
+Values are stored as float32 unless double is set, float32 is lossy: 0.01 is read back as 0.009999999776482582.
+Element ids must be strings or tuples of strings.
+"""
+import mmap
+import struct
+import sys
+import zlib
+from array import array
+from typing import Iterable, Iterator, List, Tuple, Union
+
+from .histogram import HElement, Histogram, Histogram1D
+
+
+HISTOGRAM_MAGIC = b"HMH1"
+CORPUS_MAGIC = b"HMC1"
+
+FLAG_TUPLE_KEYS = 1
+FLAG_DOUBLE = 2
+FLAG_ZLIB = 4
+
+_HISTOGRAM_HEADER = struct.Struct("<4sBI")
+_CORPUS_HEADER = struct.Struct("<4sBQQQQ")
+
+_KEY_SEPARATOR = "\x00"
+_TUPLE_SEPARATOR = ", "
+
+
+def _pack(typecode: str, values) -> bytes:
+    values = array(typecode, values)
+    if sys.byteorder == "big":
+        values.byteswap()
+    return values.tobytes()
+
+
+def _unpack(typecode: str, data, offset: int, count: int) -> Tuple[array, int]:
+    values = array(typecode)
+    end = offset + count * values.itemsize
+    values.frombytes(data[offset:end])
+    if sys.byteorder == "big":
+        values.byteswap()
+    return values, end
+
+
+def _encode_keys(keys: List[Union[str, Tuple[str, ...]]]) -> Tuple[int, bytes]:
+    is_tuple = bool(keys) and isinstance(keys[0], tuple)
+    if is_tuple:
+        keys = [_TUPLE_SEPARATOR.join(key) for key in keys]
+    return (FLAG_TUPLE_KEYS if is_tuple else 0), _KEY_SEPARATOR.join(keys).encode("utf-8")
+
+
+def _decode_keys(data: bytes, count: int, flags: int) -> List[Union[str, Tuple[str, ...]]]:
+    if count == 0:
+        return list()
+    keys = data.decode("utf-8").split(_KEY_SEPARATOR)
+    if flags & FLAG_TUPLE_KEYS:
+        return [tuple(key.split(_TUPLE_SEPARATOR)) for key in keys]
+    return keys
+
+
+def _build(cls, keys, values) -> Histogram:
+    hist = cls(data=None)
+    hist._histogram_elements = {key: HElement(key, value) for key, value in zip(keys, values)}
+    return hist
+
+
+"""
+Histogram
+"""
+
+
+def histogram_to_bytes(hist: Histogram, double: bool = False) -> bytes:
+    keys = hist.elements()
+    flags, keys_data = _encode_keys(keys)
+    flags |= FLAG_DOUBLE if double else 0
+    return b"".join((
+        _HISTOGRAM_HEADER.pack(HISTOGRAM_MAGIC, flags, len(keys)),
+        struct.pack("<I", len(keys_data)), keys_data,
+        _pack("d" if double else "f", (hist[key].value for key in keys))))
+
+
+def histogram_from_bytes(data: bytes, cls=Histogram1D) -> Histogram:
+    magic, flags, count = _HISTOGRAM_HEADER.unpack_from(data)
+    if magic != HISTOGRAM_MAGIC:
+        raise ValueError("Data is not a serialized histogram.")
+    offset = _HISTOGRAM_HEADER.size
+    keys_size, = struct.unpack_from("<I", data, offset)
+    offset += 4
+    keys = _decode_keys(data[offset:offset + keys_size], count, flags)
+    values, _ = _unpack("d" if flags & FLAG_DOUBLE else "f", data, offset + keys_size, count)
+    return _build(cls, keys, values.tolist())
+
+
+"""
+Corpus
+"""
+
+
+class CorpusWriter:
+    """
+    Write (doc id, histogram) pairs to a columnar corpus file
+
+    Histograms are kept as columns, not objects, until the file is written on close.
+
+    Usage:
+        with CorpusWriter("corpus.hmc", compress=True) as writer:
+            for doc_id, hist in hists:
+                writer.append(doc_id, hist)
+    """
+
+    def __init__(self, path: str, double: bool = False, compress: bool = False):
+        self._path = path
+        self._double = double
+        self._compress = compress
+        self._vocabulary = dict()
+        self._doc_ids = array("q")
+        self._offsets = array("Q", [0])
+        self._indices = array("I")
+        self._values = array("d" if double else "f")
+
+    def append(self, doc_id: int, hist: Histogram):
+        for key, h_element in hist:
+            index = self._vocabulary.get(key)
+            if index is None:
+                index = self._vocabulary[key] = len(self._vocabulary)
+            self._indices.append(index)
+            self._values.append(h_element.value)
+        self._doc_ids.append(doc_id)
+        self._offsets.append(len(self._indices))
+
+    def extend(self, hists: Iterable[Tuple[int, Histogram]]):
+        for doc_id, hist in hists:
+            self.append(doc_id, hist)
+
+    def close(self):
+        flags, vocabulary = _encode_keys(list(self._vocabulary))
+        flags |= FLAG_DOUBLE if self._double else 0
+        payload = b"".join((
+            struct.pack("<Q", len(vocabulary)), vocabulary,
+            _pack("q", self._doc_ids), _pack("Q", self._offsets),
+            _pack("I", self._indices), _pack(self._values.typecode, self._values)))
+        if self._compress:
+            flags |= FLAG_ZLIB
+            payload = zlib.compress(payload)
+        with open(self._path, "wb") as f:
+            f.write(_CORPUS_HEADER.pack(
+                CORPUS_MAGIC, flags, len(self._doc_ids), len(self._vocabulary), len(self._indices), len(payload)))
+            f.write(payload)
+
+    def __len__(self):
+        return len(self._doc_ids)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if exc_type is None:
+            self.close()
+
+
+def write_corpus(
+        path: str, hists: Iterable[Tuple[int, Histogram]], double: bool = False, compress: bool = False) -> int:
+    """Write (doc id, histogram) pairs to a columnar corpus file, returns the number of histograms"""
+    with CorpusWriter(path, double, compress) as writer:
+        writer.extend(hists)
+    return len(writer)
+
+
+def iter_corpus(path: str, cls=Histogram1D) -> Iterator[Tuple[int, Histogram]]:
+    """
+    Stream (doc id, histogram) pairs of a columnar corpus file
+
+    The vocabulary, doc ids and offsets are loaded up front, elements and values of uncompressed files
+    are read from a memory map one document at a time. Compressed files are decompressed as a whole.
+    """
+    with open(path, "rb") as f:
+        header = f.read(_CORPUS_HEADER.size)
+        if len(header) < _CORPUS_HEADER.size or header[:len(CORPUS_MAGIC)] != CORPUS_MAGIC:
+            raise ValueError("File is not a corpus of histograms.")
+        magic, flags, num_docs, num_elements, nnz, payload_size = _CORPUS_HEADER.unpack(header)
+        if flags & FLAG_ZLIB:
+            data, base = zlib.decompress(f.read(payload_size)), 0
+        else:
+            data, base = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ), _CORPUS_HEADER.size
+    try:
+        vocabulary_size, = struct.unpack_from("<Q", data, base)
+        offset = base + 8 + vocabulary_size
+        vocabulary = _decode_keys(data[base + 8:offset], num_elements, flags)
+        doc_ids, offset = _unpack("q", data, offset, num_docs)
+        offsets, offset = _unpack("Q", data, offset, num_docs + 1)
+        value_type = "d" if flags & FLAG_DOUBLE else "f"
+        indices_offset, values_offset = offset, offset + 4 * nnz
+        value_size = 8 if flags & FLAG_DOUBLE else 4
+        for i, doc_id in enumerate(doc_ids):
+            start, count = offsets[i], offsets[i + 1] - offsets[i]
+            indices, _ = _unpack("I", data, indices_offset + 4 * start, count)
+            values, _ = _unpack(value_type, data, values_offset + value_size * start, count)
+            yield doc_id, _build(cls, [vocabulary[index] for index in indices], values.tolist())
+    finally:
+        if isinstance(data, mmap.mmap):
+            data.close()
+
+
+def read_corpus(path: str, cls=Histogram1D) -> List[Tuple[int, Histogram]]:
+    """(doc id, histogram) pairs of a columnar corpus file"""
+    return list(iter_corpus(path, cls))
@@ -0,0 +1,382 @@
+// CPython extension of the inverted index of library.cpp, the "native" mode of utils/search_engine.py
+//
+// Arguments are converted from Python strings and sequences (or float64 buffers, e.g. NumPy
+// arrays) straight into the C++ containers. Calls into the index run without the GIL, retrieve
+// calls of concurrent Python threads share the index and run in parallel, methods adding
+// rules or documents wait for them under the lock of the index.
+#define PY_SSIZE_T_CLEAN
+#include <Python.h>
+#include <cstdio>
+#include "library.h"
+
+typedef struct {
+    PyObject_HEAD
+    InvertedIndex *index;
+} IndexObject;
+
+static bool toString(PyObject *object, std::string &result) {
+    Py_ssize_t size;
+    const char *data = PyUnicode_AsUTF8AndSize(object, &size);
+    if (!data) {
+        return false;
+    }
+    result.assign(data, size);
+    return true;
+}
+
+static bool toStrings(PyObject *object, std::vector<std::string> &result) {
+    PyObject *sequence = PySequence_Fast(object, "expected a sequence of strings");
+    if (!sequence) {
+        return false;
+    }
+    Py_ssize_t size = PySequence_Fast_GET_SIZE(sequence);
+    PyObject **items = PySequence_Fast_ITEMS(sequence);
+    result.resize(size);
+    for (Py_ssize_t i = 0; i < size; i++) {
+        if (!toString(items[i], result[i])) {
+            Py_DECREF(sequence);
+            return false;
+        }
+    }
+    Py_DECREF(sequence);
+    return true;
+}
+
+static bool toDoubles(PyObject *object, std::vector<double> &result) {
+    Py_buffer view;
+    if (PyObject_CheckBuffer(object) && PyObject_GetBuffer(object, &view, PyBUF_C_CONTIGUOUS | PyBUF_FORMAT) == 0) {
+        bool is_double = view.ndim == 1 && view.format && std::string(view.format) == "d";
+        if (is_double) {
+            const double *data = static_cast<const double *>(view.buf);
+            result.assign(data, data + view.shape[0]);
+        }
+        PyBuffer_Release(&view);
+        if (is_double) {
+            return true;
+        }
+    }
+    PyErr_Clear();
+    PyObject *sequence = PySequence_Fast(object, "expected a sequence of floats");
+    if (!sequence) {
+        return false;
+    }
+    Py_ssize_t size = PySequence_Fast_GET_SIZE(sequence);
+    PyObject **items = PySequence_Fast_ITEMS(sequence);
+    result.resize(size);
+    for (Py_ssize_t i = 0; i < size; i++) {
+        result[i] = PyFloat_AsDouble(items[i]);
+        if (result[i] == -1.0 && PyErr_Occurred()) {
+            Py_DECREF(sequence);
+            return false;
+        }
+    }
+    Py_DECREF(sequence);
+    return true;
+}
+
+// {element id: value} of the keys and values sequences
+static bool toHistogram(PyObject *keys, PyObject *values, std::map<std::string, double> &result) {
+    std::vector<std::string> converted_keys;
+    std::vector<double> converted_values;
+    if (!toStrings(keys, converted_keys) || !toDoubles(values, converted_values)) {
+        return false;
+    }
+    if (converted_keys.size() != converted_values.size()) {
+        PyErr_SetString(PyExc_ValueError, "keys and values have different lengths");
+        return false;
+    }
+    for (size_t i = 0; i < converted_keys.size(); i++) {
+        result.emplace(std::move(converted_keys[i]), converted_values[i]);
+    }
+    return true;
+}
+
+// {high-level element id: iterable of element ids}
+static bool toRules(PyObject *object, std::map<std::string, std::set<std::string>> &result) {
+    if (!PyDict_Check(object)) {
+        PyErr_SetString(PyExc_TypeError, "expected a dict of rules");
+        return false;
+    }
+    PyObject *key, *value;
+    Py_ssize_t position = 0;
+    while (PyDict_Next(object, &position, &key, &value)) {
+        std::string name;
+        if (!toString(key, name)) {
+            return false;
+        }
+        PyObject *sequence = PySequence_Fast(value, "expected an iterable of element ids");
+        if (!sequence) {
+            return false;
+        }
+        auto &elements = result[name];
+        Py_ssize_t size = PySequence_Fast_GET_SIZE(sequence);
+        PyObject **items = PySequence_Fast_ITEMS(sequence);
+        for (Py_ssize_t i = 0; i < size; i++) {
+            std::string element;
+            if (!toString(items[i], element)) {
+                Py_DECREF(sequence);
+                return false;
+            }
+            elements.insert(std::move(element));
+        }
+        Py_DECREF(sequence);
+    }
+    return true;
+}
+
+// [(doc id, score)] of a retrieve call, with the stats dictionary if requested
+static PyObject *fromResult(const std::vector<std::pair<int, double>> &result, const QueryStats *stats) {
+    PyObject *list = PyList_New(result.size());
+    if (!list) {
+        return nullptr;
+    }
+    for (size_t i = 0; i < result.size(); i++) {
+        PyObject *pair = Py_BuildValue("(id)", result[i].first, result[i].second);
+        if (!pair) {
+            Py_DECREF(list);
+            return nullptr;
+        }
+        PyList_SET_ITEM(list, i, pair);
+    }
+    if (!stats) {
+        return list;
+    }
+    return Py_BuildValue(
+            "(N{sdsdsdsLsLsL})", list,
+            "candidates_ms", stats->candidates_ms, "scoring_ms", stats->scoring_ms, "sorting_ms", stats->sorting_ms,
+            "candidates", stats->candidates, "postings", stats->postings, "scored", stats->scored);
+}
+
+// Runs a call into the index without the GIL. C++ exceptions must not unwind through the
+// interpreter: they are caught here and raised as Python exceptions once the GIL is taken back.
+template <typename Call>
+static bool callWithoutGil(Call call) {
+    enum { NO_ERROR, NO_MEMORY, RUNTIME_ERROR } error = NO_ERROR;
+    char message[256] = "unknown C++ exception";
+    Py_BEGIN_ALLOW_THREADS
+    try {
+        call();
+    } catch (const std::bad_alloc &) {
+        error = NO_MEMORY;
+    } catch (const std::exception &e) {
+        error = RUNTIME_ERROR;
+        std::snprintf(message, sizeof(message), "%s", e.what());
+    } catch (...) {
+        error = RUNTIME_ERROR;
+    }
+    Py_END_ALLOW_THREADS
+    if (error == NO_MEMORY) {
+        PyErr_NoMemory();
+    } else if (error == RUNTIME_ERROR) {
+        PyErr_SetString(PyExc_RuntimeError, message);
+    }
+    return error == NO_ERROR;
+}
+
+static PyObject *Index_new(PyTypeObject *type, PyObject *args, PyObject *kwargs) {
+    IndexObject *self = reinterpret_cast<IndexObject *>(type->tp_alloc(type, 0));
+    if (self) {
+        try {
+            self->index = new InvertedIndex(new Evaluator());
+        } catch (const std::bad_alloc &) {
+            Py_TYPE(self)->tp_free(reinterpret_cast<PyObject *>(self));
+            return PyErr_NoMemory();
+        }
+    }
+    return reinterpret_cast<PyObject *>(self);
+}
+
+static void Index_dealloc(IndexObject *self) {
+    delete self->index;
+    Py_TYPE(self)->tp_free(reinterpret_cast<PyObject *>(self));
+}
+
+static PyObject *Index_add_one_dimensional_rules(IndexObject *self, PyObject *rules) {
+    std::map<std::string, std::set<std::string>> converted;
+    if (!toRules(rules, converted)) {
+        return nullptr;
+    }
+    if (!callWithoutGil([&] { self->index->addOneDimensionalRules(converted); })) {
+        return nullptr;
+    }
+    Py_RETURN_NONE;
+}
+
+static PyObject *Index_add_multidimensional_rules(IndexObject *self, PyObject *rules) {
+    std::map<std::string, std::set<std::string>> converted;
+    if (!toRules(rules, converted)) {
+        return nullptr;
+    }
+    if (!callWithoutGil([&] {
+        self->index->addMultidimensionalRules(std::vector<std::map<std::string, std::set<std::string>>>(1, converted));
+    })) {
+        return nullptr;
+    }
+    Py_RETURN_NONE;
+}
+
+static PyObject *Index_add_document(IndexObject *self, PyObject *args) {
+    int id;
+    PyObject *keys, *values;
+    if (!PyArg_ParseTuple(args, "iOO", &id, &keys, &values)) {
+        return nullptr;
+    }
+    std::map<std::string, double> doc;
+    if (!toHistogram(keys, values, doc)) {
+        return nullptr;
+    }
+    if (!callWithoutGil([&] { self->index->addDocument(id, doc); })) {
+        return nullptr;
+    }
+    Py_RETURN_NONE;
+}
+
+static PyObject *Index_build_impact_order(IndexObject *self, PyObject *Py_UNUSED(ignored)) {
+    if (!callWithoutGil([&] { self->index->buildImpactOrder(); })) {
+        return nullptr;
+    }
+    Py_RETURN_NONE;
+}
+
+static PyObject *Index_set_similarity(IndexObject *self, PyObject *args) {
+    int measure;
+    if (!PyArg_ParseTuple(args, "i", &measure)) {
+        return nullptr;
+    }
+    bool is_set = false;
+    if (!callWithoutGil([&] { is_set = self->index->setSimilarity(measure); })) {
+        return nullptr;
+    }
+    if (!is_set) {
+        PyErr_Format(PyExc_ValueError, "Unknown similarity code: %d", measure);
+        return nullptr;
+    }
+    Py_RETURN_NONE;
+}
+
+static PyObject *Index_set_threads(IndexObject *self, PyObject *args) {
+    int threads;
+    if (!PyArg_ParseTuple(args, "i", &threads)) {
+        return nullptr;
+    }
+    if (threads < 0) {
+        PyErr_SetString(PyExc_ValueError, "threads must be non-negative");
+        return nullptr;
+    }
+    if (!callWithoutGil([&] { self->index->setNumThreads(threads); })) {
+        return nullptr;
+    }
+    Py_RETURN_NONE;
+}
+
+static PyObject *Index_retrieve_by_query(IndexObject *self, PyObject *args, PyObject *kwargs) {
+    static const char *keywords[] = {"expression", "count", "from_end", "threshold", "top_k", "stats", nullptr};
+    PyObject *expression;
+    int count = 10, from_end = 0, top_k = 0, with_stats = 0;
+    double threshold = 0.001;
+    if (!PyArg_ParseTupleAndKeywords(args, kwargs, "O|ipdpp", const_cast<char **>(keywords),
+                                     &expression, &count, &from_end, &threshold, &top_k, &with_stats)) {
+        return nullptr;
+    }
+    std::vector<std::string> converted;
+    if (!toStrings(expression, converted)) {
+        return nullptr;
+    }
+    QueryStats stats = {};
+    QueryStats *stats_ptr = with_stats ? &stats : nullptr;
+    std::vector<std::pair<int, double>> result;
+    bool is_retrieved = callWithoutGil([&] {
+        if (top_k && !from_end) {
+            result = self->index->retrieveByQueryTopK(converted, count, threshold, stats_ptr);
+        } else {
+            result = self->index->retrieveByQuery(converted, count, from_end, threshold, stats_ptr);
+        }
+    });
+    if (!is_retrieved) {
+        return nullptr;
+    }
+    return fromResult(result, stats_ptr);
+}
+
+static PyObject *Index_retrieve_by_histogram(IndexObject *self, PyObject *args, PyObject *kwargs) {
+    static const char *keywords[] = {"keys", "values", "count", "from_end", "threshold", "top_k", "stats", nullptr};
+    PyObject *keys, *values;
+    int count = 10, from_end = 0, top_k = 0, with_stats = 0;
+    double threshold = 0.001;
+    if (!PyArg_ParseTupleAndKeywords(args, kwargs, "OO|ipdpp", const_cast<char **>(keywords),
+                                     &keys, &values, &count, &from_end, &threshold, &top_k, &with_stats)) {
+        return nullptr;
+    }
+    std::map<std::string, double> doc;
+    if (!toHistogram(keys, values, doc)) {
+        return nullptr;
+    }
+    QueryStats stats = {};
+    QueryStats *stats_ptr = with_stats ? &stats : nullptr;
+    std::vector<std::pair<int, double>> result;
+    bool is_retrieved = callWithoutGil([&] {
+        if (top_k && !from_end) {
+            result = self->index->retrieveByHistogramTopK(doc, count, threshold, stats_ptr);
+        } else {
+            result = self->index->retrieveByHistogram(doc, count, from_end, threshold, stats_ptr);
+        }
+    });
+    if (!is_retrieved) {
+        return nullptr;
+    }
+    return fromResult(result, stats_ptr);
+}
+
+static PyMethodDef Index_methods[] = {
+    {"add_one_dimensional_rules", reinterpret_cast<PyCFunction>(Index_add_one_dimensional_rules), METH_O,
+     "add_one_dimensional_rules(rules)\n--\n\nAdd {high-level element id: element ids} rules"},
+    {"add_multidimensional_rules", reinterpret_cast<PyCFunction>(Index_add_multidimensional_rules), METH_O,
+     "add_multidimensional_rules(rules)\n--\n\nAdd the rules of the next dimension of multidimensional elements"},
+    {"add_document", reinterpret_cast<PyCFunction>(Index_add_document), METH_VARARGS,
+     "add_document(id, keys, values)\n--\n\nAdd a histogram of element ids and values"},
+    {"build_impact_order", reinterpret_cast<PyCFunction>(Index_build_impact_order), METH_NOARGS,
+     "build_impact_order()\n--\n\nSort posting lists by value for top_k retrieval by histogram"},
+    {"set_similarity", reinterpret_cast<PyCFunction>(Index_set_similarity), METH_VARARGS,
+     "set_similarity(code)\n--\n\nSimilarity measure of retrieval by histogram, a code of utils.similarity"},
+    {"set_threads", reinterpret_cast<PyCFunction>(Index_set_threads), METH_VARARGS,
+     "set_threads(threads)\n--\n\nThreads scoring the candidates of a retrieve call, 0 for the hardware concurrency"},
+    {"retrieve_by_query", reinterpret_cast<PyCFunction>(Index_retrieve_by_query), METH_VARARGS | METH_KEYWORDS,
+     "retrieve_by_query(expression, count=10, from_end=False, threshold=0.001, top_k=False, stats=False)\n--\n\n"
+     "Ranked (doc id, score) pairs of a postfix expression, with the stats dict if stats is set"},
+    {"retrieve_by_histogram", reinterpret_cast<PyCFunction>(Index_retrieve_by_histogram), METH_VARARGS | METH_KEYWORDS,
+     "retrieve_by_histogram(keys, values, count=10, from_end=False, threshold=0.001, top_k=False, stats=False)\n--\n\n"
+     "Ranked (doc id, score) pairs of a query histogram, with the stats dict if stats is set"},
+    {nullptr, nullptr, 0, nullptr}
+};
+
+static PyTypeObject IndexType = {
+    PyVarObject_HEAD_INIT(nullptr, 0)
+};
+
+static PyModuleDef module = {
+    PyModuleDef_HEAD_INIT, "_invertedindex", "Inverted index of histogram elements of library.cpp", -1, nullptr
+};
+
+PyMODINIT_FUNC PyInit__invertedindex(void) {
+    IndexType.tp_name = "_invertedindex.InvertedIndex";
+    IndexType.tp_doc = PyDoc_STR("Inverted index of histogram elements");
+    IndexType.tp_basicsize = sizeof(IndexObject);
+    IndexType.tp_flags = Py_TPFLAGS_DEFAULT;
+    IndexType.tp_new = Index_new;
+    IndexType.tp_dealloc = reinterpret_cast<destructor>(Index_dealloc);
+    IndexType.tp_methods = Index_methods;
+    if (PyType_Ready(&IndexType) < 0) {
+        return nullptr;
+    }
+    PyObject *m = PyModule_Create(&module);
+    if (!m) {
+        return nullptr;
+    }
+    Py_INCREF(&IndexType);
+    if (PyModule_AddObject(m, "InvertedIndex", reinterpret_cast<PyObject *>(&IndexType)) < 0) {
+        Py_DECREF(&IndexType);
+        Py_DECREF(m);
+        return nullptr;
+    }
+    return m;
+}
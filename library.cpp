@@ -4,59 +4,54 @@
 #include <map>
 #include <set>
 #include <algorithm>
+#include <cmath>
 #include <sstream>
 #include <iostream>
 #include <mutex>
+#include <shared_mutex>
 #include <fstream>
 #include <stack>
+#include <queue>
+#include <climits>
+#include <chrono>
 
-std::map<std::string, double> Evaluator::highlightElements(const std::string &operation, const std::map<std::string, double> &doc) {
-    std::set<std::string> indexes_set;
+// Wall time of consecutive stages of a retrieve call
+class StageTimer {
+private:
+    std::chrono::steady_clock::time_point start = std::chrono::steady_clock::now();
+
+public:
+    // Milliseconds since the start or the previous lap
+    double lap() {
+        auto now = std::chrono::steady_clock::now();
+        double elapsed = std::chrono::duration<double, std::milli>(now - start).count();
+        start = now;
+        return elapsed;
+    }
+};
+
+std::map<std::string, double> Evaluator::highlightElements(const std::string &operation, const std::map<std::string, double> &doc) const {
     std::map<std::string, double> resulted_hist;
-    if (this->is_multidimensional_hle) {
-        auto tuple_operation_str = operation.substr(1, operation.size() - 2);
-        tuple_operation_str.erase(std::remove_if(tuple_operation_str.begin(), tuple_operation_str.end(), ::isspace), tuple_operation_str.end());
-        std::vector<std::string> tuple_operation;
-        std::stringstream ss(tuple_operation_str);
-        std::string token;
-        while (std::getline(ss, token, ',')) {
-            tuple_operation.push_back(token);
-        }
-        indexes_set = this->cartesianProduct(tuple_operation);
-        for (const auto &index : indexes_set) {
-            auto element = doc.find(index);
-            if (element != doc.end()) {
-                resulted_hist[index] = element->second;
-            }
-        }
-    } else {
-        if (this->high_level_elements->find(operation) != this->high_level_elements->end()) {
-            indexes_set = (*this->high_level_elements)[operation];
-            for (const auto &index : indexes_set) {
-                auto element = doc.find(index);
-                if (element != doc.end()) {
-                    resulted_hist[index] = element->second;
-                }
-            }
-        } else {
-            auto element = doc.find(operation);
-            if (element != doc.end()) {
-                resulted_hist[operation] = element->second;
-            }
+    for (const auto &index : this->leafIndexes(operation)) {
+        auto element = doc.find(index);
+        if (element != doc.end()) {
+            resulted_hist[index] = element->second;
         }
     }
     return resulted_hist;
 }
 
-std::set<std::string> Evaluator::cartesianProduct(std::vector<std::string> &tuple_high_level_element) {
+std::set<std::string> Evaluator::cartesianProduct(const std::vector<std::string> &tuple_high_level_element) const {
     std::set<std::string> result;
     if (tuple_high_level_element.size() == this->multidimensional_high_level_elements->size()) {
         std::vector<std::vector<std::string>> product;
         product.push_back(std::vector<std::string>());
         for (int i = 0; i < tuple_high_level_element.size(); i++) {
             std::vector<std::vector<std::string>> temp;
-            if ((*this->multidimensional_high_level_elements)[i].find(tuple_high_level_element[i]) != (*this->multidimensional_high_level_elements)[i].end()) {
-                for (const auto& val : (*this->multidimensional_high_level_elements)[i][tuple_high_level_element[i]]) {
+            const auto &rules = (*this->multidimensional_high_level_elements)[i];
+            auto rule = rules.find(tuple_high_level_element[i]);
+            if (rule != rules.end()) {
+                for (const auto& val : rule->second) {
                     for (auto vec : product) {
                         vec.push_back(val);
                         temp.push_back(vec);
@@ -328,15 +323,16 @@ void Evaluator::addOneDimensionalRules(const std::map<std::string, std::set<std:
     }
 }
 
-std::map<std::string, double> Evaluator::evalHistogram(std::vector<std::string> &expression, const std::map<std::string, double> &doc) {
+std::map<std::string, double> Evaluator::evalHistogram(const std::vector<std::string> &expression, const std::map<std::string, double> &doc) const {
     std::stack<std::map<std::string, double>> stack;
     for (const auto& token : expression) {
-        if (this->operations->count(token)) {
+        auto op = this->operations->find(token);
+        if (op != this->operations->end()) {
             auto pair_2 = stack.top();
             stack.pop();
             auto pair_1 = stack.top();
             stack.pop();
-            switch (this->operations->at(token)) {
+            switch (op->second) {
                 case UNION: stack.push(Evaluator::setUnion(pair_1, pair_2)); break;
                 case INTERSECTION: stack.push(Evaluator::setIntersection(pair_1, pair_2)); break;
                 case SUBTRACTION: stack.push(Evaluator::setSubtraction(pair_1, pair_2)); break;
@@ -354,13 +350,13 @@ std::map<std::string, double> Evaluator::evalHistogram(std::vector<std::string>
 }
 
 
-std::pair<std::set<int>, std::set<std::string>> Evaluator::evalExpression(std::vector<std::string> &expression, const std::map<std::string, std::set<int>> &storage) {
+std::pair<std::set<int>, std::set<std::string>> Evaluator::evalExpression(std::vector<std::string> &expression, const std::map<std::string, std::set<int>> &storage, long long *postings) const {
         auto operation = expression.back();
         expression.pop_back();
         auto op = this->expression_operations->find(operation);
         if (op != this->expression_operations->end()) {
-            auto pair_2 = this->evalExpression(expression, storage);
-            auto pair_1 = this->evalExpression(expression, storage);
+            auto pair_2 = this->evalExpression(expression, storage, postings);
+            auto pair_1 = this->evalExpression(expression, storage, postings);
             std::pair<std::set<int>, std::set<std::string>> tmp;
             switch(op->second) {
                 case E_UNION: return Evaluator::expressionUnion(pair_1, pair_2);
@@ -374,38 +370,54 @@ std::pair<std::set<int>, std::set<std::string>> Evaluator::evalExpression(std::v
             }
         } else {
             std::set<int> doc_ids;
-            std::set<std::string> indexes_set;
-            if (this->is_multidimensional_hle) {
-                auto tuple_operation_str = operation.substr(1, operation.size() - 2);
-                tuple_operation_str.erase(std::remove_if(tuple_operation_str.begin(), tuple_operation_str.end(), ::isspace), tuple_operation_str.end());
-                std::vector<std::string> tuple_operation;
-                std::stringstream ss(tuple_operation_str);
-                std::string token;
-                while (std::getline(ss, token, ',')) {
-                    tuple_operation.push_back(token);
-                }
-                indexes_set = this->cartesianProduct(tuple_operation);
-                for (const auto &index : indexes_set) {
-                    auto &doc_ids_from_index = storage.find(index)->second;
-                    doc_ids.insert(doc_ids_from_index.begin(), doc_ids_from_index.end());
-                }
-            } else {
-                if (this->high_level_elements->find(operation) != this->high_level_elements->end()) {
-                    indexes_set = (*this->high_level_elements)[operation];
-                    for (const auto &index : indexes_set) {
-                        auto &doc_ids_from_index = storage.find(index)->second;
-                        doc_ids.insert(doc_ids_from_index.begin(), doc_ids_from_index.end());
+            std::set<std::string> indexes_set = this->leafIndexes(operation);
+            for (const auto &index : indexes_set) {
+                auto doc_ids_from_index = storage.find(index);
+                if (doc_ids_from_index != storage.end()) {
+                    doc_ids.insert(doc_ids_from_index->second.begin(), doc_ids_from_index->second.end());
+                    if (postings) {
+                        *postings += doc_ids_from_index->second.size();
                     }
-                } else {
-                    indexes_set.insert(operation);
-                    auto &doc_ids_from_index = storage.find(operation)->second;
-                    doc_ids.insert(doc_ids_from_index.begin(), doc_ids_from_index.end());
                 }
             }
             return make_pair(doc_ids, indexes_set);
         }
     }
 
+std::set<std::string> Evaluator::leafIndexes(const std::string &operation) const {
+    if (this->is_multidimensional_hle) {
+        auto tuple_operation_str = operation.substr(1, operation.size() - 2);
+        tuple_operation_str.erase(std::remove_if(tuple_operation_str.begin(), tuple_operation_str.end(), ::isspace), tuple_operation_str.end());
+        std::vector<std::string> tuple_operation;
+        std::stringstream ss(tuple_operation_str);
+        std::string token;
+        while (std::getline(ss, token, ',')) {
+            tuple_operation.push_back(token);
+        }
+        return this->cartesianProduct(tuple_operation);
+    }
+    auto high_level_element = this->high_level_elements->find(operation);
+    if (high_level_element != this->high_level_elements->end()) {
+        return high_level_element->second;
+    }
+    return {operation};
+}
+
+bool Evaluator::unionIndexes(const std::vector<std::string> &expression, std::set<std::string> &indexes_set) const {
+    for (const auto &token : expression) {
+        auto op = this->expression_operations->find(token);
+        if (op != this->expression_operations->end()) {
+            if (op->second != E_UNION && op->second != E_OR) {
+                return false;
+            }
+        } else {
+            auto leaf_indexes = this->leafIndexes(token);
+            indexes_set.insert(leaf_indexes.begin(), leaf_indexes.end());
+        }
+    }
+    return !expression.empty();
+}
+
 double InvertedIndex::documentsCoincidence(const std::map<std::string, double> &doc_a, const std::map<std::string, double> &doc_b) {
     double result = 0.0;
     const std::map<std::string, double> &doc_1 = (doc_a.size() > doc_b.size()) ? doc_b : doc_a;
@@ -419,15 +431,72 @@ double InvertedIndex::documentsCoincidence(const std::map<std::string, double> &
     return result;
 }
 
+double InvertedIndex::documentsSimilarity(int measure, const std::map<std::string, double> &doc_a, const std::map<std::string, double> &doc_b) {
+    if (measure == S_INTERSECTION) {
+        return InvertedIndex::documentsCoincidence(doc_a, doc_b);
+    }
+    // Sums over common elements, elements of a single histogram only add to the totals
+    double sum_a = 0.0, sum_b = 0.0, norm_a = 0.0, norm_b = 0.0, common = 0.0;
+    for (const auto &element : doc_a) {
+        sum_a += element.second;
+        norm_a += element.second * element.second;
+    }
+    for (const auto &element : doc_b) {
+        sum_b += element.second;
+        norm_b += element.second * element.second;
+    }
+    const std::map<std::string, double> &doc_1 = (doc_a.size() > doc_b.size()) ? doc_b : doc_a;
+    const std::map<std::string, double> &doc_2 = (doc_a.size() > doc_b.size()) ? doc_a : doc_b;
+    for (const auto &element : doc_1) {
+        auto it = doc_2.find(element.first);
+        if (it == doc_2.end()) {
+            continue;
+        }
+        double a = element.second, b = it->second;
+        switch (measure) {
+            case S_L1:
+                common += std::min(a, b);
+                break;
+            case S_CHI2:
+                common += a + b > 0.0 ? 2.0 * a * b / (a + b) : 0.0;
+                break;
+            case S_BHATTACHARYYA:
+            case S_HELLINGER:
+                common += std::sqrt(a * b);
+                break;
+            case S_COSINE:
+                common += a * b;
+                break;
+        }
+    }
+    switch (measure) {
+        case S_L1:
+        case S_CHI2:
+            return 1.0 - (sum_a + sum_b) / 2.0 + common;
+        case S_HELLINGER:
+            return 1.0 - std::sqrt(std::max(0.0, 1.0 - common));
+        case S_COSINE:
+            return norm_a > 0.0 && norm_b > 0.0 ? common / std::sqrt(norm_a * norm_b) : 0.0;
+        default:
+            return common;
+    }
+}
+
 InvertedIndex::InvertedIndex(Evaluator *evaluator) : storage(std::make_unique<std::map<std::string, std::set<int>>>()),
                                                      hists(std::make_unique<std::map<int, std::map<std::string, double>>>()),
-                                                     numThreads(std::thread::hardware_concurrency()),
+                                                     max_values(std::make_unique<std::map<std::string, double>>()),
+                                                     impacts(std::make_unique<std::map<std::string, std::vector<std::pair<double, int>>>>()),
+                                                     is_impact_ordered(false),
+                                                     similarity_measure(S_INTERSECTION),
+                                                     numThreads(std::max(1u, std::thread::hardware_concurrency())),
                                                      evaluator(evaluator){}
 
 
 InvertedIndex::~InvertedIndex() {
     this->storage.reset();
     this->hists.reset();
+    this->max_values.reset();
+    this->impacts.reset();
     if (this->evaluator) {
         delete this->evaluator;
     }
@@ -437,29 +506,81 @@ Evaluator* InvertedIndex::getEvaluator() {
     return this->evaluator;
 }
 
+std::map<std::string, double> InvertedIndex::evalHistogram(const std::vector<std::string> &expression, const std::map<std::string, double> &doc) const {
+    std::shared_lock<std::shared_mutex> lock(this->mutex);
+    return this->evaluator->evalHistogram(expression, doc);
+}
+
+std::pair<std::set<int>, std::set<std::string>> InvertedIndex::evalExpression(std::vector<std::string> expression, const std::map<std::string, std::set<int>> &storage) const {
+    std::shared_lock<std::shared_mutex> lock(this->mutex);
+    return this->evaluator->evalExpression(expression, storage);
+}
+
+void InvertedIndex::addOneDimensionalRules(const std::map<std::string, std::set<std::string>> &rules) {
+    std::unique_lock<std::shared_mutex> lock(this->mutex);
+    this->evaluator->addOneDimensionalRules(rules);
+}
+
+void InvertedIndex::addMultidimensionalRules(const std::vector<std::map<std::string, std::set<std::string>>> &rules) {
+    std::unique_lock<std::shared_mutex> lock(this->mutex);
+    this->evaluator->addMultidimensionalRules(rules);
+}
+
 void InvertedIndex::addDocument(const int &id, const std::map<std::string, double> &doc) {
+    std::unique_lock<std::shared_mutex> lock(this->mutex);
     (*this->hists)[id] = doc;
     for (const auto &entry : doc) {
         (*storage)[entry.first].insert(id);
+        auto &max_value = (*max_values)[entry.first];
+        max_value = std::max(max_value, entry.second);
+        (*impacts)[entry.first].emplace_back(entry.second, id);
     }
+    this->is_impact_ordered = false;
 }
 
 void InvertedIndex::addDocuments(const std::vector<std::pair<int, std::map<std::string, double>>> &docs) {
     for (const auto &doc : docs) {
-        (*hists)[doc.first] = doc.second;
         addDocument(doc.first, doc.second);
     }
 }
 
-std::vector<std::pair<int, double>> InvertedIndex::retrieveByQuerySingle(const std::vector<std::string> &expression, int count, bool from_end, double threshold) {
+void InvertedIndex::buildImpactOrder() {
+    std::unique_lock<std::shared_mutex> lock(this->mutex);
+    for (auto &entry : *this->impacts) {
+        std::sort(entry.second.begin(), entry.second.end(), std::greater<>());
+    }
+    this->is_impact_ordered = true;
+}
+
+bool InvertedIndex::setSimilarity(int measure) {
+    if (measure < S_INTERSECTION || measure > S_COSINE) {
+        return false;
+    }
+    std::unique_lock<std::shared_mutex> lock(this->mutex);
+    this->similarity_measure = measure;
+    return true;
+}
+
+void InvertedIndex::setNumThreads(unsigned int threads) {
+    std::unique_lock<std::shared_mutex> lock(this->mutex);
+    this->numThreads = threads ? threads : std::max(1u, std::thread::hardware_concurrency());
+}
+
+std::vector<std::pair<int, double>> InvertedIndex::retrieveByQuerySingle(const std::vector<std::string> &expression, int count, bool from_end, double threshold, QueryStats *stats) const {
+    std::shared_lock<std::shared_mutex> lock(this->mutex);
+    StageTimer timer;
     std::vector<std::string> copied_expression(expression);
-    std::set<int> docs_set = evaluator->evalExpression(copied_expression, *this->storage).first;
+    std::set<int> docs_set = evaluator->evalExpression(copied_expression, *this->storage, stats ? &stats->postings : nullptr).first;
+    if (stats) {
+        stats->candidates_ms += timer.lap();
+        stats->candidates += docs_set.size();
+        stats->scored += docs_set.size();
+    }
     std::vector<int> docs_ids(docs_set.begin(), docs_set.end());
     std::vector<std::pair<int, double>> result;
     for (const auto &id : docs_set) {
-        const std::map<std::string, double> &hist = (*this->hists)[id];
-        std::vector<std::string> copied_thread_expression(expression);
-        const auto &result_hist = this->evaluator->evalHistogram(copied_thread_expression, hist);
+        const std::map<std::string, double> &hist = this->hists->find(id)->second;
+        const auto &result_hist = this->evaluator->evalHistogram(expression, hist);
         double score = 0.0;
         for (const auto &element : result_hist) {
             score += element.second;
@@ -469,6 +590,9 @@ std::vector<std::pair<int, double>> InvertedIndex::retrieveByQuerySingle(const s
             result.push_back(similarity);
         }
     }
+    if (stats) {
+        stats->scoring_ms += timer.lap();
+    }
     if (from_end) {
         std::sort(result.begin(), result.end(), [](auto a, auto b){ return a.second < b.second; });
     } else {
@@ -477,12 +601,22 @@ std::vector<std::pair<int, double>> InvertedIndex::retrieveByQuerySingle(const s
     if (result.size() > count) {
         result.resize(count);
     }
+    if (stats) {
+        stats->sorting_ms += timer.lap();
+    }
     return result;
 }
 
-std::vector<std::pair<int, double>> InvertedIndex::retrieveByQuery(const std::vector<std::string> &expression, int count, bool from_end, double threshold) {
+std::vector<std::pair<int, double>> InvertedIndex::retrieveByQuery(const std::vector<std::string> &expression, int count, bool from_end, double threshold, QueryStats *stats) const {
+    std::shared_lock<std::shared_mutex> lock(this->mutex);
+    StageTimer timer;
     std::vector<std::string> copied_expression(expression);
-    std::set<int> docs_set = evaluator->evalExpression(copied_expression, *this->storage).first;
+    std::set<int> docs_set = evaluator->evalExpression(copied_expression, *this->storage, stats ? &stats->postings : nullptr).first;
+    if (stats) {
+        stats->candidates_ms += timer.lap();
+        stats->candidates += docs_set.size();
+        stats->scored += docs_set.size();
+    }
     std::vector<int> docs_ids(docs_set.begin(), docs_set.end());
     std::vector<std::pair<int, double>> result;
     std::mutex mtx;
@@ -490,9 +624,8 @@ std::vector<std::pair<int, double>> InvertedIndex::retrieveByQuery(const std::ve
     for (unsigned int i = 0; i < numThreads; ++i) {
         threads.emplace_back([&](unsigned int thread_id) {
             for (unsigned int j = thread_id; j < docs_ids.size(); j += numThreads) {
-                const std::map<std::string, double> &hist = (*this->hists)[docs_ids[j]];
-                std::vector<std::string> copied_thread_expression(expression);
-                const auto &result_hist = this->evaluator->evalHistogram(copied_thread_expression, hist);
+                const std::map<std::string, double> &hist = this->hists->find(docs_ids[j])->second;
+                const auto &result_hist = this->evaluator->evalHistogram(expression, hist);
                 double score = 0.0;
                 for (const auto &element : result_hist) {
                     score += element.second;
@@ -508,6 +641,9 @@ std::vector<std::pair<int, double>> InvertedIndex::retrieveByQuery(const std::ve
     for (auto &thread : threads) {
         thread.join();
     }
+    if (stats) {
+        stats->scoring_ms += timer.lap();
+    }
     if (from_end) {
         std::sort(result.begin(), result.end(), [](auto a, auto b){ return a.second < b.second; });
     } else {
@@ -516,22 +652,140 @@ std::vector<std::pair<int, double>> InvertedIndex::retrieveByQuery(const std::ve
     if (result.size() > count) {
         result.resize(count);
     }
+    if (stats) {
+        stats->sorting_ms += timer.lap();
+    }
+    return result;
+}
+
+std::vector<std::pair<int, double>> InvertedIndex::retrieveByQueryTopK(const std::vector<std::string> &expression, int count, double threshold, QueryStats *stats) const {
+    // MaxScore: only unions have a score that is a sum of independent per-element values
+    std::shared_lock<std::shared_mutex> lock(this->mutex);
+    std::set<std::string> indexes_set;
+    if (count <= 0 || !this->evaluator->unionIndexes(expression, indexes_set)) {
+        lock.unlock();
+        return this->retrieveByQuery(expression, count, false, threshold, stats);
+    }
+    StageTimer timer;
+    struct PostingList {
+        std::string index;
+        double max_value;
+        std::set<int>::const_iterator current;
+        std::set<int>::const_iterator end;
+    };
+    std::vector<PostingList> posting_lists;
+    for (const auto &index : indexes_set) {
+        auto doc_ids = this->storage->find(index);
+        if (doc_ids != this->storage->end()) {
+            posting_lists.push_back({index, this->max_values->find(index)->second, doc_ids->second.begin(), doc_ids->second.end()});
+        }
+    }
+    std::sort(posting_lists.begin(), posting_lists.end(), [](const PostingList &a, const PostingList &b) { return a.max_value < b.max_value; });
+    std::vector<double> upper_bounds;
+    double upper_bound = 0.0;
+    for (const auto &posting_list : posting_lists) {
+        upper_bound += posting_list.max_value;
+        upper_bounds.push_back(upper_bound);
+    }
+    std::priority_queue<std::pair<double, int>, std::vector<std::pair<double, int>>, std::greater<>> top;
+    auto cannot_enter = [&](double score) {
+        return (int) top.size() < count ? score < threshold : score <= top.top().first;
+    };
+    // Posting lists before first_essential cannot lift a document into the top on their own
+    size_t first_essential = 0;
+    while (first_essential < posting_lists.size() && cannot_enter(upper_bounds[first_essential])) {
+        first_essential++;
+    }
+    while (first_essential < posting_lists.size()) {
+        int doc_id = INT_MAX;
+        for (size_t i = first_essential; i < posting_lists.size(); i++) {
+            if (posting_lists[i].current != posting_lists[i].end) {
+                doc_id = std::min(doc_id, *posting_lists[i].current);
+            }
+        }
+        if (doc_id == INT_MAX) {
+            break;
+        }
+        const auto &hist = this->hists->find(doc_id)->second;
+        double score = 0.0;
+        for (size_t i = first_essential; i < posting_lists.size(); i++) {
+            if (posting_lists[i].current != posting_lists[i].end && *posting_lists[i].current == doc_id) {
+                score += hist.find(posting_lists[i].index)->second;
+                ++posting_lists[i].current;
+                if (stats) {
+                    stats->postings++;
+                }
+            }
+        }
+        if (stats) {
+            stats->candidates++;
+            stats->scored++;
+        }
+        bool pruned = false;
+        for (size_t i = first_essential; i-- > 0;) {
+            if (cannot_enter(score + upper_bounds[i])) {
+                pruned = true;
+                break;
+            }
+            auto element = hist.find(posting_lists[i].index);
+            if (element != hist.end()) {
+                score += element->second;
+            }
+        }
+        if (pruned || cannot_enter(score)) {
+            continue;
+        }
+        top.emplace(score, doc_id);
+        if ((int) top.size() > count) {
+            top.pop();
+        }
+        while (first_essential < posting_lists.size() && cannot_enter(upper_bounds[first_essential])) {
+            first_essential++;
+        }
+    }
+    if (stats) {
+        stats->scoring_ms += timer.lap();
+    }
+    std::vector<std::pair<int, double>> result;
+    while (!top.empty()) {
+        result.emplace_back(top.top().second, top.top().first);
+        top.pop();
+    }
+    std::reverse(result.begin(), result.end());
+    if (stats) {
+        stats->sorting_ms += timer.lap();
+    }
     return result;
 }
 
-std::vector<std::pair<int, double>> InvertedIndex::retrieveByHistogramSingle(const std::map<std::string, double> &doc, int count, bool from_end, double threshold) {
+std::vector<std::pair<int, double>> InvertedIndex::retrieveByHistogramSingle(const std::map<std::string, double> &doc, int count, bool from_end, double threshold, QueryStats *stats) const {
+    std::shared_lock<std::shared_mutex> lock(this->mutex);
+    StageTimer timer;
     std::set<int> docs_set;
     for (const auto &iterator : doc) {
-        auto element_set = this->storage->find(iterator.first)->second;
-        docs_set.insert(element_set.begin(), element_set.end());
+        auto element_set = this->storage->find(iterator.first);
+        if (element_set != this->storage->end()) {
+            docs_set.insert(element_set->second.begin(), element_set->second.end());
+            if (stats) {
+                stats->postings += element_set->second.size();
+            }
+        }
+    }
+    if (stats) {
+        stats->candidates_ms += timer.lap();
+        stats->candidates += docs_set.size();
+        stats->scored += docs_set.size();
     }
     std::vector<std::pair<int, double>> ranked_docs;
     for (const auto &id : docs_set) {
-        auto score = InvertedIndex::documentsCoincidence(doc,(*this->hists)[id]);
+        auto score = InvertedIndex::documentsSimilarity(this->similarity_measure, doc, this->hists->find(id)->second);
         if (score > threshold) {
             ranked_docs.emplace_back(id, score);
         }
     }
+    if (stats) {
+        stats->scoring_ms += timer.lap();
+    }
     std::sort(ranked_docs.begin(), ranked_docs.end(), [](const std::pair<int, double> &a, const std::pair<int, double> &b) {
         return a.second > b.second;
     });
@@ -542,14 +796,29 @@ std::vector<std::pair<int, double>> InvertedIndex::retrieveByHistogramSingle(con
         std::vector<std::pair<int, double>> result(ranked_docs.begin(), ranked_docs.begin() + count);
         ranked_docs = result;
     }
+    if (stats) {
+        stats->sorting_ms += timer.lap();
+    }
     return ranked_docs;
 }
 
-std::vector<std::pair<int, double>> InvertedIndex::retrieveByHistogram(const std::map<std::string, double> &doc, int count, bool from_end, double threshold) {
+std::vector<std::pair<int, double>> InvertedIndex::retrieveByHistogram(const std::map<std::string, double> &doc, int count, bool from_end, double threshold, QueryStats *stats) const {
+    std::shared_lock<std::shared_mutex> lock(this->mutex);
+    StageTimer timer;
     std::set<int> docs_set;
     for (const auto &iterator : doc) {
-        auto &element_set = this->storage->find(iterator.first)->second;
-        docs_set.insert(element_set.begin(), element_set.end());
+        auto element_set = this->storage->find(iterator.first);
+        if (element_set != this->storage->end()) {
+            docs_set.insert(element_set->second.begin(), element_set->second.end());
+            if (stats) {
+                stats->postings += element_set->second.size();
+            }
+        }
+    }
+    if (stats) {
+        stats->candidates_ms += timer.lap();
+        stats->candidates += docs_set.size();
+        stats->scored += docs_set.size();
     }
     std::vector<int> docs_ids(docs_set.begin(), docs_set.end());
     std::vector<std::pair<int, double>> result;
@@ -558,8 +827,8 @@ std::vector<std::pair<int, double>> InvertedIndex::retrieveByHistogram(const std
     for (unsigned int i = 0; i < numThreads; ++i) {
         threads.emplace_back([&](unsigned int thread_id) {
             for (unsigned int j = thread_id; j < docs_ids.size(); j += numThreads) {
-                const std::map<std::string, double> &hist = (*this->hists)[docs_ids[j]];
-                std::pair<int, double> similarity = std::make_pair(j, InvertedIndex::documentsCoincidence(doc, hist));
+                const std::map<std::string, double> &hist = this->hists->find(docs_ids[j])->second;
+                std::pair<int, double> similarity = std::make_pair(docs_ids[j], InvertedIndex::documentsSimilarity(this->similarity_measure, doc, hist));
                 if (similarity.second >= threshold) {
                     std::lock_guard<std::mutex> lock(mtx);
                     result.push_back(similarity);
@@ -570,6 +839,9 @@ std::vector<std::pair<int, double>> InvertedIndex::retrieveByHistogram(const std
     for (auto &thread : threads) {
         thread.join();
     }
+    if (stats) {
+        stats->scoring_ms += timer.lap();
+    }
     if (from_end) {
         std::sort(result.begin(), result.end(), [](auto a, auto b){ return a.second < b.second; });
     } else {
@@ -578,6 +850,77 @@ std::vector<std::pair<int, double>> InvertedIndex::retrieveByHistogram(const std
     if (result.size() > count) {
         result.resize(count);
     }
+    if (stats) {
+        stats->sorting_ms += timer.lap();
+    }
+    return result;
+}
+
+std::vector<std::pair<int, double>> InvertedIndex::retrieveByHistogramTopK(const std::map<std::string, double> &doc, int count, double threshold, QueryStats *stats) const {
+    // The early stop bounds scores of elements by min(query value, value), i.e. by the intersection
+    std::shared_lock<std::shared_mutex> lock(this->mutex);
+    if (count <= 0 || !this->is_impact_ordered || this->similarity_measure != S_INTERSECTION) {
+        lock.unlock();
+        return this->retrieveByHistogram(doc, count, false, threshold, stats);
+    }
+    StageTimer timer;
+    // Threshold algorithm: read the impact-ordered posting lists of the query elements
+    // in parallel until no unseen document can score above the current top
+    std::vector<std::pair<double, const std::vector<std::pair<double, int>>*>> impact_lists;
+    for (const auto &element : doc) {
+        auto impact_list = this->impacts->find(element.first);
+        if (impact_list != this->impacts->end()) {
+            impact_lists.emplace_back(element.second, &impact_list->second);
+        }
+    }
+    std::set<int> seen;
+    std::priority_queue<std::pair<double, int>, std::vector<std::pair<double, int>>, std::greater<>> top;
+    auto cannot_enter = [&](double score) {
+        return (int) top.size() < count ? score < threshold : score <= top.top().first;
+    };
+    for (size_t depth = 0;; depth++) {
+        double upper_bound = 0.0;
+        bool is_exhausted = true;
+        for (const auto &impact_list : impact_lists) {
+            if (depth >= impact_list.second->size()) {
+                continue;
+            }
+            is_exhausted = false;
+            const auto &posting = (*impact_list.second)[depth];
+            if (stats) {
+                stats->postings++;
+            }
+            upper_bound += std::min(impact_list.first, posting.first);
+            if (seen.insert(posting.second).second) {
+                double score = InvertedIndex::documentsCoincidence(doc, this->hists->find(posting.second)->second);
+                if (!cannot_enter(score)) {
+                    top.emplace(score, posting.second);
+                    if ((int) top.size() > count) {
+                        top.pop();
+                    }
+                }
+            }
+        }
+        if (is_exhausted || cannot_enter(upper_bound)) {
+            break;
+        }
+    }
+    if (stats) {
+        stats->candidates += seen.size();
+        stats->scored += seen.size();
+    }
+    if (stats) {
+        stats->scoring_ms += timer.lap();
+    }
+    std::vector<std::pair<int, double>> result;
+    while (!top.empty()) {
+        result.emplace_back(top.top().second, top.top().first);
+        top.pop();
+    }
+    std::reverse(result.begin(), result.end());
+    if (stats) {
+        stats->sorting_ms += timer.lap();
+    }
     return result;
 }
 
@@ -597,28 +940,51 @@ extern "C" {
         index->addDocument(id, doc);
     }
 
+    DLLEXPORT void buildImpactOrder(InvertedIndex* index) {
+        index->buildImpactOrder();
+    }
+
+    DLLEXPORT bool setSimilarity(InvertedIndex* index, int measure) {
+        return index->setSimilarity(measure);
+    }
+
+    DLLEXPORT void setNumThreads(InvertedIndex* index, unsigned int threads) {
+        index->setNumThreads(threads);
+    }
+
     DLLEXPORT void deleteInvertedIndex(InvertedIndex* index) {
         delete index;
     }
 
-    DLLEXPORT std::vector<std::pair<int, double>>* retrieveByQuerySingle(InvertedIndex* index, std::vector<std::string>* expression, int count, bool from_end, double threshold, int* out_size) {
-        auto r = index->retrieveByQuerySingle(*expression, count, from_end, threshold);
+    DLLEXPORT std::vector<std::pair<int, double>>* retrieveByQuerySingle(InvertedIndex* index, std::vector<std::string>* expression, int count, bool from_end, double threshold, int* out_size, QueryStats* stats) {
+        auto r = index->retrieveByQuerySingle(*expression, count, from_end, threshold, stats);
         *out_size = r.size();
         return new std::vector<std::pair<int, double>>(r);
     }
 
-    DLLEXPORT std::vector<std::pair<int, double>>* retrieveByQuery(InvertedIndex* index, std::vector<std::string>* expression, int count, bool from_end, double threshold, int* out_size) {
-        auto r = index->retrieveByQuery(*expression, count, from_end, threshold);
+    DLLEXPORT std::vector<std::pair<int, double>>* retrieveByQuery(InvertedIndex* index, std::vector<std::string>* expression, int count, bool from_end, double threshold, int* out_size, QueryStats* stats) {
+        auto r = index->retrieveByQuery(*expression, count, from_end, threshold, stats);
+        *out_size = r.size();
+        return new std::vector<std::pair<int, double>>(r);
+    }
+    DLLEXPORT std::vector<std::pair<int, double>>* retrieveByQueryTopK(InvertedIndex* index, std::vector<std::string>* expression, int count, double threshold, int* out_size, QueryStats* stats) {
+        auto r = index->retrieveByQueryTopK(*expression, count, threshold, stats);
         *out_size = r.size();
         return new std::vector<std::pair<int, double>>(r);
     }
-    DLLEXPORT std::vector<std::pair<int, double>>* retrieveByHistogramSingle(InvertedIndex* index, std::map<std::string, double>* doc, int count, bool from_end, double threshold, int* out_size) {
-        auto r = index->retrieveByHistogramSingle(*doc, count, from_end, threshold);
+    DLLEXPORT std::vector<std::pair<int, double>>* retrieveByHistogramSingle(InvertedIndex* index, std::map<std::string, double>* doc, int count, bool from_end, double threshold, int* out_size, QueryStats* stats) {
+        auto r = index->retrieveByHistogramSingle(*doc, count, from_end, threshold, stats);
         *out_size = r.size();
         return new std::vector<std::pair<int, double>>(r);
     }
-    DLLEXPORT std::vector<std::pair<int, double>>* retrieveByHistogram(InvertedIndex* index, std::map<std::string, double>* doc, int count, bool from_end, double threshold, int* out_size) {
-        auto r = index->retrieveByHistogram(*doc, count, from_end, threshold);
+    DLLEXPORT std::vector<std::pair<int, double>>* retrieveByHistogram(InvertedIndex* index, std::map<std::string, double>* doc, int count, bool from_end, double threshold, int* out_size, QueryStats* stats) {
+        auto r = index->retrieveByHistogram(*doc, count, from_end, threshold, stats);
+        *out_size = r.size();
+        return new std::vector<std::pair<int, double>>(r);
+    }
+
+    DLLEXPORT std::vector<std::pair<int, double>>* retrieveByHistogramTopK(InvertedIndex* index, std::map<std::string, double>* doc, int count, double threshold, int* out_size, QueryStats* stats) {
+        auto r = index->retrieveByHistogramTopK(*doc, count, threshold, stats);
         *out_size = r.size();
         return new std::vector<std::pair<int, double>>(r);
     }
@@ -628,7 +994,7 @@ extern "C" {
         for(auto pair: *rules) {
             converted.emplace(pair.first, std::set<std::string>(pair.second.begin(), pair.second.end()));
         }
-        index->getEvaluator()->addOneDimensionalRules(converted);
+        index->addOneDimensionalRules(converted);
     }
 
     DLLEXPORT void addMultiDimensionalRules(InvertedIndex* index, std::vector<std::pair<std::string, std::vector<std::string>>>* rules) {
@@ -636,11 +1002,11 @@ extern "C" {
         for(auto pair: *rules) {
             converted.emplace(pair.first, std::set<std::string>(pair.second.begin(), pair.second.end()));
         }
-        index->getEvaluator()->addMultidimensionalRules(std::vector<std::map<std::string, std::set<std::string>>>(1, converted));
+        index->addMultidimensionalRules(std::vector<std::map<std::string, std::set<std::string>>>(1, converted));
     }
 
     DLLEXPORT std::vector<std::pair<std::string, double>>* evalHistogram(InvertedIndex* index, std::vector<std::string>* expression, std::map<std::string, double>* doc, int* out_size) {
-        auto r = index->getEvaluator()->evalHistogram(*expression, *doc);
+        auto r = index->evalHistogram(*expression, *doc);
         auto vec = new std::vector<std::pair<std::string, double>>(r.begin(), r.end());
         *out_size = vec->size();
         return vec;
@@ -651,7 +1017,7 @@ extern "C" {
         for(auto pair: *storage) {
             converted.emplace(pair.first, std::set<int>(pair.second.begin(), pair.second.end()));
         }
-        auto r = index->getEvaluator()->evalExpression(*expression, converted);
+        auto r = index->evalExpression(*expression, converted);
         *size1 = r.first.size();
         *size2 = r.second.size();
         return new std::pair<std::vector<int>, std::vector<std::string>>(
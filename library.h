@@ -8,6 +8,8 @@
 #include <algorithm>
 #include <sstream>
 #include <iostream>
+#include <memory>
+#include <shared_mutex>
 
 const int E_UNION = 1;
 const int E_INTERSECTION = 2;
@@ -24,6 +26,24 @@ const int OR = 12;
 const int XOR = 13;
 const int XSUBTRACTION = 14;
 
+// Similarity measures of query by histogram, codes of utils/similarity.py
+const int S_INTERSECTION = 0;
+const int S_L1 = 1;
+const int S_CHI2 = 2;
+const int S_BHATTACHARYYA = 3;
+const int S_HELLINGER = 4;
+const int S_COSINE = 5;
+
+// Per-stage wall times in milliseconds and counters of a retrieve call, filled when passed
+struct QueryStats {
+    double candidates_ms;
+    double scoring_ms;
+    double sorting_ms;
+    long long candidates;
+    long long postings;
+    long long scored;
+};
+
 class Evaluator {
 private:
     std::unique_ptr<std::map<std::string, std::set<std::string>>> high_level_elements;
@@ -32,9 +52,9 @@ private:
     std::unique_ptr<std::map<std::string, int>> operations;
     bool is_multidimensional_hle;
 
-    std::map<std::string, double> highlightElements(const std::string &operation, const std::map<std::string, double> &doc);
+    std::map<std::string, double> highlightElements(const std::string &operation, const std::map<std::string, double> &doc) const;
 
-    std::set<std::string> cartesianProduct(std::vector<std::string> &tuple_high_level_element);
+    std::set<std::string> cartesianProduct(const std::vector<std::string> &tuple_high_level_element) const;
 
 public:
 
@@ -74,20 +94,32 @@ public:
 
     void addOneDimensionalRules(const std::map<std::string, std::set<std::string>> &rules);
 
-    std::map<std::string, double> evalHistogram(std::vector<std::string> &expression, const std::map<std::string, double> &doc);
+    std::map<std::string, double> evalHistogram(const std::vector<std::string> &expression, const std::map<std::string, double> &doc) const;
+
+    std::pair<std::set<int>, std::set<std::string>> evalExpression(std::vector<std::string> &expression, const std::map<std::string, std::set<int>> &storage, long long *postings = nullptr) const;
+
+    std::set<std::string> leafIndexes(const std::string &operation) const;
 
-    std::pair<std::set<int>, std::set<std::string>> evalExpression(std::vector<std::string> &expression, const std::map<std::string, std::set<int>> &storage);
+    bool unionIndexes(const std::vector<std::string> &expression, std::set<std::string> &indexes_set) const;
 };
 
 class InvertedIndex {
 private:
     std::unique_ptr<std::map<std::string, std::set<int>>> storage;
     std::unique_ptr<std::map<int, std::map<std::string, double>>> hists;
+    std::unique_ptr<std::map<std::string, double>> max_values;
+    std::unique_ptr<std::map<std::string, std::vector<std::pair<double, int>>>> impacts;
+    bool is_impact_ordered;
+    int similarity_measure;
     unsigned int numThreads;
     Evaluator *evaluator;
+    // Retrieve calls share the index, adding documents or rules and settings take it exclusively
+    mutable std::shared_mutex mutex;
 
     static double documentsCoincidence(const std::map<std::string, double> &doc_a, const std::map<std::string, double> &doc_b);
 
+    static double documentsSimilarity(int measure, const std::map<std::string, double> &doc_a, const std::map<std::string, double> &doc_b);
+
 public:
 
     InvertedIndex(Evaluator *evaluator);
@@ -96,17 +128,37 @@ public:
 
     Evaluator* getEvaluator();
 
+    // Evaluator calls under the shared lock, rules may be added by other threads meanwhile
+    std::map<std::string, double> evalHistogram(const std::vector<std::string> &expression, const std::map<std::string, double> &doc) const;
+
+    std::pair<std::set<int>, std::set<std::string>> evalExpression(std::vector<std::string> expression, const std::map<std::string, std::set<int>> &storage) const;
+
+    void addOneDimensionalRules(const std::map<std::string, std::set<std::string>> &rules);
+
+    void addMultidimensionalRules(const std::vector<std::map<std::string, std::set<std::string>>> &rules);
+
     void addDocument(const int &id, const std::map<std::string, double> &doc);
 
     void addDocuments(const std::vector<std::pair<int, std::map<std::string, double>>> &docs);
 
-    std::vector<std::pair<int, double>> retrieveByQuerySingle(const std::vector<std::string> &expression, int count = 10, bool from_end = false, double threshold = 0.001);
+    void buildImpactOrder();
+
+    bool setSimilarity(int measure);
+
+    // Threads scoring the candidates of a retrieve call, 0 for the hardware concurrency
+    void setNumThreads(unsigned int threads);
+
+    std::vector<std::pair<int, double>> retrieveByQuerySingle(const std::vector<std::string> &expression, int count = 10, bool from_end = false, double threshold = 0.001, QueryStats *stats = nullptr) const;
+
+    std::vector<std::pair<int, double>> retrieveByQuery(const std::vector<std::string> &expression, int count = 10, bool from_end = false, double threshold = 0.001, QueryStats *stats = nullptr) const;
+
+    std::vector<std::pair<int, double>> retrieveByQueryTopK(const std::vector<std::string> &expression, int count = 10, double threshold = 0.001, QueryStats *stats = nullptr) const;
 
-    std::vector<std::pair<int, double>> retrieveByQuery(const std::vector<std::string> &expression, int count = 10, bool from_end = false, double threshold = 0.001);
+    std::vector<std::pair<int, double>> retrieveByHistogramSingle(const std::map<std::string, double> &doc, int count = 10, bool from_end = false, double threshold = 0.001, QueryStats *stats = nullptr) const;
 
-    std::vector<std::pair<int, double>> retrieveByHistogramSingle(const std::map<std::string, double> &doc, int count = 10, bool from_end = false, double threshold = 0.001);
+    std::vector<std::pair<int, double>> retrieveByHistogram(const std::map<std::string, double> &doc, int count = 10, bool from_end = false, double threshold = 0.001, QueryStats *stats = nullptr) const;
 
-    std::vector<std::pair<int, double>> retrieveByHistogram(const std::map<std::string, double> &doc, int count = 10, bool from_end = false, double threshold = 0.001);
+    std::vector<std::pair<int, double>> retrieveByHistogramTopK(const std::map<std::string, double> &doc, int count = 10, double threshold = 0.001, QueryStats *stats = nullptr) const;
 };
 
 #endif //LIBRARY_H
@@ -1,12 +1,12 @@
 import os
 import pickle
-import time
 from himpy.executor import Parser, Evaluator
 from himpy.histogram import operations, expressionOperations
 from himpy.utils import E
-from utils.datasets import ColorImageGenerator
+from utils.datasets import ColorImageGenerator, ImageStore
 from utils.feature_extraction import ColorSetTransformer, PositionSetTransformer, create_histogram
 from utils.search_engine import SearchEngine, InvertedIndexCpp
+from benchmarks.timing import timed
 
 # =============================================================================================================
 
@@ -83,56 +83,50 @@ evaluator = Evaluator(operations, expressionOperations, high_level_elements=high
 
 # =============================================================================================================
 
-# Images with normal distrubited some elements
-images = [
-    image_generator.generate(
-        shape=(100, 100),
-        steps=(10, 10),
-        normal_element_ids={"e1", "e10", "e11", "e12", "e31", "e32", "e33", "e34"},
-        random_state=i+100)
-    for i in range(5000)
-]
+# Images are generated once into a memory-mapped store, only ranked images are read to show them
+images_data = "images_pos.npy"
+hists_data = "hists_pos.pkcl"
 
-# Images with uniform distributed elements
-images += [
-    image_generator.generate(
-        shape=(100, 100),
-        steps=(10, 10),
-        random_state=i+100)
-    for i in range(5000)
-]
 
-# =============================================================================================================
+def generate_images():
+    # Images with normal distrubited some elements
+    for i in range(5000):
+        yield image_generator.generate(
+            shape=(100, 100),
+            steps=(10, 10),
+            normal_element_ids={"e1", "e10", "e11", "e12", "e31", "e32", "e33", "e34"},
+            random_state=i+100)
+    # Images with uniform distributed elements
+    for i in range(5000):
+        yield image_generator.generate(
+            shape=(100, 100),
+            steps=(10, 10),
+            random_state=i+100)
 
-hists_data = "hists_pos.pkcl"
-images_data = "images_pos.pkcl"
+
+if not os.path.exists(images_data):
+    ImageStore.from_images(images_data, generate_images(), count=10000, shape=(100, 100, 3))
+images = ImageStore(images_data)
+
+# =============================================================================================================
 
 # Create histograms for the images
 hists = list()
 limit = len(images)
 
-position_image = position_transformer.fit_transform(X=images[0], y=None)
-if not os.path.exists(hists_data) or not os.path.exists(images_data):
+if os.path.exists(hists_data):
+    with open(hists_data, "rb") as f:
+        hists = pickle.load(f)
+else:
+    position_image = position_transformer.fit_transform(X=images[0], y=None)
     for indx, image in enumerate(images):
         color_image = color_transformer.fit_transform(X=image, y=None)
         hist = create_histogram((position_image, color_image))
         hists.append((indx, hist))
         print("\rCurrent image index: {}/{}".format(indx + 1, limit), end="")
     print()
-
-# =============================================================================================================
-
-
-if os.path.exists(hists_data) and os.path.exists(images_data):
-    with open(hists_data, "rb") as f:
-        hists = pickle.load(f)
-    with open(images_data, "rb") as f:
-        images = pickle.load(f)
-else:
     with open(hists_data, "wb") as f:
         pickle.dump(hists, f)
-    with open(images_data, "wb") as f:
-        pickle.dump(images, f)
 
 # =============================================================================================================
 
@@ -161,21 +155,15 @@ E6 = E("any", "any")
 query = E5 + E2
 # query = E1 + E2
 
-start_time = time.time()
-ranked_images = search_engine.retrieve(query, top_n=TOP_N)
-end_time = time.time()
-execution_time = (end_time - start_time) * 1000
-print("Execution time (query py) in milliseconds:", execution_time)
+with timed("query py"):
+    ranked_images = search_engine.retrieve(query, top_n=TOP_N)
 print("Total retrieved images:", len(ranked_images))
 # print(ranked_images)
 
 # =============================================================================================================
 
-start_time = time.time()
-ranked_images = search_engine_cpp.retrieve(query, top_n=TOP_N)
-end_time = time.time()
-execution_time = (end_time - start_time) * 1000
-print("Execution time (query cpp) in milliseconds:", execution_time)
+with timed("query cpp"):
+    ranked_images = search_engine_cpp.retrieve(query, top_n=TOP_N)
 print("Total retrieved images:", len(ranked_images))
 # print(ranked_images)
 
@@ -204,21 +192,15 @@ sample_hist = create_histogram((position_image, color_image))
 # =============================================================================================================
 
 # Retrieve images similar to the sample
-start_time = time.time()
-ranked_images__sample = search_engine.retrieve(sample_hist, top_n=TOP_N)
-end_time = time.time()
-execution_time = (end_time - start_time) * 1000
-print("Execution time (hist py) in milliseconds:", execution_time)
+with timed("hist py"):
+    ranked_images__sample = search_engine.retrieve(sample_hist, top_n=TOP_N)
 print("Total retrieved images:", len(ranked_images__sample))
 # print(ranked_images__sample)
 
 # =============================================================================================================
 
-start_time = time.time()
-ranked_images__sample = search_engine_cpp.retrieve(sample_hist, top_n=TOP_N)
-end_time = time.time()
-execution_time = (end_time - start_time) * 1000
-print("Execution time (hist cpp) in milliseconds:", execution_time)
+with timed("hist cpp"):
+    ranked_images__sample = search_engine_cpp.retrieve(sample_hist, top_n=TOP_N)
 print("Total retrieved images:", len(ranked_images__sample))
 # print(ranked_images__sample)
 
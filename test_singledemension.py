@@ -1,12 +1,12 @@
 import os
 import pickle
-import time
 from himpy.executor import Parser, Evaluator
 from himpy.histogram import operations, expressionOperations
 from himpy.utils import E
 from utils.datasets import ColorImageGenerator
 from utils.feature_extraction import ColorSetTransformer, create_histogram
 from utils.search_engine import SearchEngine
+from benchmarks.timing import timed
 
 # =============================================================================================================
 
@@ -107,21 +107,15 @@ E3 = E("red")
 query = E1 & E3
 # query = E1 + E2
 
-start_time = time.time()
-ranked_images = search_engine.retrieve(query, top_n=TOP_N)
-end_time = time.time()
-execution_time = (end_time - start_time) * 1000
-print("Execution time (query py) in milliseconds:", execution_time)
+with timed("query py"):
+    ranked_images = search_engine.retrieve(query, top_n=TOP_N)
 # print("Total retrieved images:", len(ranked_images))
 # print(ranked_images)
 
 # =============================================================================================================
 
-start_time = time.time()
-ranked_images = search_engine_cpp.retrieve(query, top_n=TOP_N)
-end_time = time.time()
-execution_time = (end_time - start_time) * 1000
-print("Execution time (query cpp) in milliseconds:", execution_time)
+with timed("query cpp"):
+    ranked_images = search_engine_cpp.retrieve(query, top_n=TOP_N)
 print("Total retrieved images:", len(ranked_images))
 # print(ranked_images)
 
@@ -148,21 +142,15 @@ sample_hist = create_histogram((color_image,))
 # =============================================================================================================
 
 # Retrieve images similar to the sample
-start_time = time.time()
-ranked_images__sample = search_engine.retrieve(sample_hist, top_n=TOP_N)
-end_time = time.time()
-execution_time = (end_time - start_time) * 1000
-print("Execution time (hist py) in milliseconds:", execution_time)
+with timed("hist py"):
+    ranked_images__sample = search_engine.retrieve(sample_hist, top_n=TOP_N)
 print("Total retrieved images:", len(ranked_images__sample))
 # print(ranked_images__sample)
 
 # =============================================================================================================
 
-start_time = time.time()
-ranked_images__sample = search_engine_cpp.retrieve(sample_hist, top_n=TOP_N)
-end_time = time.time()
-execution_time = (end_time - start_time) * 1000
-print("Execution time (hist cpp) in milliseconds:", execution_time)
+with timed("hist cpp"):
+    ranked_images__sample = search_engine_cpp.retrieve(sample_hist, top_n=TOP_N)
 print("Total retrieved images:", len(ranked_images__sample))
 # print(ranked_images__sample)
 
@@ -0,0 +1,49 @@
+import pytest
+
+from himpy.executor import Parser
+from himpy.utils import E
+from benchmarks.corpus import KINDS, QUERIES, create_evaluator, generate_histograms, generate_sample_histograms, high_level_elements
+
+
+# Expression queries of every operation but #|, whose candidates (documents with elements of only
+# one operand) differ from exhaustive evaluation by design
+EXPRESSIONS = {
+    "position": [
+        *QUERIES["position"].values(),
+        E("top", "green"),
+        E("left", "red") + E("right", "red") + E("center", "rose"),
+        E("top", "green") | E("bottom", "red"),
+        E("any", "green") & E("center", "any"),
+        (E("any", "green") + E("any", "red")).Sub(E("center", "rose")),
+        E("any", "green").Xsub(E("center", "rose")),
+    ],
+    "color": [
+        *QUERIES["color"].values(),
+        E("red"),
+        E("green") + E("red") + E("rose"),
+        E("green") | E("yellow_green"),
+        E("green") & E("red"),
+        E("green").Xsub(E("e40")),
+        E("e1") + E("e31"),
+    ],
+}
+
+
+class Corpus:
+    """Small synthetic corpus with its parser, evaluator, rules of the "dll" mode and queries"""
+
+    def __init__(self, kind, size=150):
+        self.kind = kind
+        self.parser = Parser()
+        self.hists = generate_histograms(size, kind, random_state=7)
+        self.rules = high_level_elements(self.parser, kind)[1]
+        self.expressions = EXPRESSIONS[kind]
+        self.samples = generate_sample_histograms(4, kind)
+
+    def evaluator(self):
+        return create_evaluator(self.parser, self.kind)
+
+
+@pytest.fixture(scope="session", params=KINDS)
+def corpus(request):
+    return Corpus(request.param)
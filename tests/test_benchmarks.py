@@ -0,0 +1,45 @@
+import pytest
+
+from benchmarks.corpus import QUERIES, load_corpus
+from benchmarks.ranking import kendall_tau, kendall_tau_at_k, recall_at_k
+from benchmarks.suite import compare, run
+from benchmarks.timing import measure, summarize
+
+
+def test_summarize():
+    summary = summarize([1.0, 2.0, 3.0, 4.0])
+    assert summary["count"] == 4
+    assert summary["min_ms"] == 1.0 and summary["max_ms"] == 4.0
+    assert summary["p50_ms"] == pytest.approx(2.5)
+    assert summary["throughput_per_s"] == pytest.approx(4 / 0.01)
+    assert len(measure(lambda: None, repeat=3)) == 3
+
+
+def test_load_corpus_cache(tmp_path):
+    hists = load_corpus(20, "color", cache_dir=str(tmp_path))
+    assert len(list(tmp_path.iterdir())) == 1
+    cached = load_corpus(20, "color", cache_dir=str(tmp_path))
+    assert [(hist_id, hist.to_dict()) for hist_id, hist in cached] == \
+           [(hist_id, hist.to_dict()) for hist_id, hist in hists]
+
+
+def test_run_and_compare(tmp_path):
+    results = run([20], ["default", "classic"], kind="color", repeat=1, sample_count=2,
+                  cache_dir=str(tmp_path), isolate=False, verbose=False)
+    assert [(result["size"], result["engine"]) for result in results] == [(20, "default"), (20, "classic")]
+    operations = {"indexing", "histogram", *QUERIES["color"]}
+    for result in results:
+        assert operations <= set(result) and all(result[operation]["count"] > 0 for operation in operations)
+    rows = compare({"results": results}, {"results": results})
+    assert len(rows) == 2 * len(operations)
+    assert all(ratio == 1.0 for *_, ratio in rows if ratio is not None)
+
+
+def test_ranking_metrics():
+    reference = [(1, 0.9), (2, 0.8), (3, 0.7), (4, 0.1)]
+    assert recall_at_k(reference, reference, 3) == 1.0
+    assert recall_at_k([(1, 0.9), (4, 0.5), (3, 0.4)], reference, 3) == pytest.approx(2 / 3)
+    assert recall_at_k([], [], 3) == 1.0
+    assert kendall_tau([1, 2, 3], [10, 20, 30]) == 1.0
+    assert kendall_tau([1, 2, 3], [30, 20, 10]) == -1.0
+    assert kendall_tau_at_k([(3, 0.9), (2, 0.8), (1, 0.7)], reference, 3) == -1.0
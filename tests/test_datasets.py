@@ -0,0 +1,54 @@
+import numpy as np
+import pytest
+
+from utils.datasets import BlockHistogramGenerator, ColorImageGenerator
+from utils.feature_extraction import ColorSetTransformer, PositionSetTransformer, create_histogram
+
+
+SHAPE, STEPS = (40, 30), (10, 5)
+NORMAL_ELEMENT_IDS = {"e1", "e31", "e33"}
+
+
+def test_generate_batch():
+    generator = ColorImageGenerator()
+    kwargs = dict(steps=STEPS, normal_element_ids=NORMAL_ELEMENT_IDS, normal_share=0.5)
+    images = generator.generate_batch(6, SHAPE, random_state=3, **kwargs)
+    assert images.shape == (6, *SHAPE, 3) and images.dtype == np.uint8
+    assert np.array_equal(images, generator.generate_batch(6, SHAPE, random_state=3, **kwargs))
+    # every block is filled with a single color
+    blocks = images.reshape(6, SHAPE[0] // STEPS[0], STEPS[0], SHAPE[1] // STEPS[1], STEPS[1], 3)
+    assert np.all(blocks == blocks[:, :, :1, :, :1])
+
+    elements = generator.generate_batch(6, SHAPE, random_state=3, output="elements", **kwargs)
+    color_transformer = ColorSetTransformer()
+    for image, element_image in zip(images, elements):
+        assert np.array_equal(color_transformer.transform(image), element_image)
+
+
+def test_iter_batches():
+    generator = ColorImageGenerator()
+    batches = list(generator.iter_batches(7, SHAPE, chunk_size=3, steps=STEPS, random_state=5))
+    assert [len(batch) for batch in batches] == [3, 3, 1]
+    again = list(generator.iter_batches(7, SHAPE, chunk_size=3, steps=STEPS, random_state=5))
+    assert all(np.array_equal(batch, other) for batch, other in zip(batches, again))
+    with pytest.raises(ValueError):
+        generator.generate_batch(1, SHAPE, steps=STEPS, output="hsv")
+
+
+@pytest.mark.parametrize("splits", [(5, 5), (4, 3), None])
+@pytest.mark.parametrize("shape", [(40, 30), (60, 20)])
+def test_block_histograms(splits, shape):
+    """Histograms of blocks are equal to create_histogram of painted images on divisible shapes"""
+    kwargs = dict(steps=STEPS, normal_element_ids=NORMAL_ELEMENT_IDS, normal_share=0.5, random_state=11)
+    hists = BlockHistogramGenerator(splits).generate(5, shape, **kwargs)
+    images = ColorImageGenerator().generate_batch(5, shape, **kwargs)
+    color_transformer = ColorSetTransformer()
+    for hist, image in zip(hists, images):
+        color_image = color_transformer.transform(image)
+        if splits is None:
+            expected = create_histogram((color_image,))
+        else:
+            position_image = PositionSetTransformer(splits=splits).fit_transform(color_image)
+            expected = create_histogram((position_image, color_image))
+        assert list(hist.to_dict()) == list(expected.to_dict())
+        assert np.allclose(list(hist.to_dict().values()), list(expected.to_dict().values()))
@@ -0,0 +1,102 @@
+import itertools
+
+import numpy as np
+import pytest
+
+from utils.datasets import ColorImageGenerator
+from utils.feature_extraction import (
+    ColorSetTransformer, ElementFilter, FeatureMerger, PositionSetTransformer, create_histogram, create_position_histogram,
+    downsample, filter_data
+)
+from utils.ingest import HistogramExtractor
+
+
+def filled_mask(transformer, size):
+    """Mask filled region by region as PositionSetTransformer did before the masks were vectorized"""
+    mask = np.zeros(size, dtype=np.uint8)
+    ndim = len(size)
+    for element_id, region in transformer:
+        for low_element in itertools.product(*[range(region[i], region[ndim + i] + 1) for i in range(ndim)]):
+            mask[low_element] = element_id
+    return mask
+
+
+@pytest.mark.parametrize("size, splits", [((50, 50), (5, 5)), ((53, 47), (5, 4)), ((7, 30), (3, 6)), ((4, 4), (5, 5))])
+def test_position_masks(size, splits):
+    transformer = PositionSetTransformer(splits=splits)
+    mask = transformer.fit_transform(np.zeros(size))
+    assert mask.dtype == np.uint8 and not mask.flags.writeable
+    assert np.array_equal(mask, filled_mask(transformer, size))
+    # masks are shared by transformers of the same grid
+    assert PositionSetTransformer(splits=list(splits)).transform(np.ones(size)) is mask
+
+
+@pytest.mark.parametrize("shape, splits", [((50, 50), (5, 5)), ((53, 47), (5, 4)), ((4, 4), (5, 5))])
+@pytest.mark.parametrize("dtype", ["<U10", np.int64])
+@pytest.mark.parametrize("normalize", [True, False])
+def test_position_histogram(shape, splits, dtype, normalize):
+    """Equal to create_histogram with a position mask, zero elements are skipped"""
+    elements = np.array([0, 3, 12, 40]) if dtype == np.int64 else np.array(["0", "e3", "e12", "e40"])
+    features = elements[np.random.default_rng(0).integers(len(elements), size=shape)]
+    position_image = PositionSetTransformer(splits=splits).fit_transform(features)
+    hist = create_position_histogram(features, splits, normalize=normalize)
+    expected = create_histogram((position_image, features), normalize=normalize)
+    assert hist.to_dict() == pytest.approx(expected.to_dict())
+    assert list(hist.to_dict()) == list(expected.to_dict())
+
+
+def test_downsample():
+    image = np.arange(7 * 9 * 3, dtype=np.uint8).reshape(7, 9, 3)
+    assert downsample(image, 1) is image
+    assert np.array_equal(downsample(image, 2), image[::2, ::2])
+    area = downsample(image, 3, method="area")
+    assert area.shape == (2, 3, 3) and area.dtype == np.uint8
+    assert np.array_equal(area[1, 2], np.rint(image[3:6, 6:9].reshape(-1, 3).mean(axis=0)))
+    with pytest.raises(ValueError):
+        downsample(image, 2, method="nearest")
+
+
+@pytest.mark.parametrize("method", ["stride", "area"])
+def test_downsampled_histograms(method):
+    """Histograms of images of blocks divisible by the factor do not change"""
+    images = ColorImageGenerator().generate_batch(3, (60, 60), steps=(12, 12), random_state=4)
+    for image in images:
+        full = HistogramExtractor((5, 5))(image)
+        for factor in (2, 4):
+            hist = HistogramExtractor((5, 5), downsample=factor, downsample_method=method)(image)
+            assert hist.to_dict() == pytest.approx(full.to_dict())
+
+
+def test_element_filter():
+    """Equal to filter_data of every element set, in the dtype of data"""
+    images = ColorImageGenerator().generate_batch(3, (40, 40), steps=(8, 8), random_state=6)
+    color_images = [ColorSetTransformer().transform(image) for image in images]
+    position_image = PositionSetTransformer(splits=(4, 4)).fit_transform(color_images[0])
+    element_sets = [
+        [(1, "e1"), (2, "e5"), (6, "e12")] + [(p, c) for p in range(1, 17) for c in np.unique(color_images[0])[:3]],
+        [(p, c) for p in (3, 7, 11) for c in np.unique(color_images[0])],
+        [(20, "e1")],
+        [],
+    ]
+    element_filter = ElementFilter().fit((position_image, color_images[0]))
+    codes = element_filter.transform((position_image, color_images[0]))
+    merged = FeatureMerger().fit_transform((position_image, color_images[0]))
+    out = np.empty((len(element_sets),) + images[0].shape, dtype=np.uint8)
+    mask = np.empty(codes.shape, dtype=bool)
+    filtered = element_filter.filter_data(images[:1], codes[None], element_sets, out=out, mask=mask)
+    assert filtered is out
+    for result, elements in zip(filtered, element_sets):
+        expected = filter_data(images[0], merged, elements) if elements else np.full(images[0].shape, 255)
+        assert np.array_equal(result, expected)
+
+    # items each with its own set of colors
+    element_filter = ElementFilter().fit(np.stack(color_images))
+    codes = element_filter.transform(np.stack(color_images))
+    colors = [np.unique(color_image)[:2].tolist() for color_image in color_images]
+    filtered = element_filter.filter_data(images, codes, colors)
+    assert filtered.dtype == np.uint8
+    for result, image, color_image, elements in zip(filtered, images, color_images, colors):
+        assert np.array_equal(result, filter_data(image, color_image, elements))
+    masks = element_filter.masks(codes, colors)
+    assert all(np.array_equal(mask, np.isin(color_image, elements))
+               for mask, color_image, elements in zip(masks, color_images, colors))
@@ -0,0 +1,49 @@
+import pytest
+
+from himpy.histogram import HElement, Histogram1D
+
+
+def histogram(values):
+    hist = Histogram1D(data=None)
+    for key, value in values.items():
+        hist[key] = HElement(key, value)
+    return hist
+
+
+VALUES = {"e3": 0.2, "e1": 0.4, "e4": 0.1, "e2": 0.3}
+
+
+@pytest.mark.parametrize("max_elements, mass, expected", [
+    (2, None, ["e1", "e2"]),
+    (10, None, ["e1", "e2", "e3", "e4"]),
+    (0, None, []),
+    (None, 0.4, ["e1"]),
+    (None, 0.5, ["e1", "e2"]),
+    (None, 0.95, ["e1", "e2", "e3", "e4"]),
+    (None, 1.0, ["e1", "e2", "e3", "e4"]),
+    (3, 0.5, ["e1", "e2"]),
+    (1, 0.9, ["e1"]),
+    (None, None, ["e1", "e2", "e3", "e4"]),
+])
+def test_truncate(max_elements, mass, expected):
+    hist = histogram(VALUES)
+    truncated = hist.truncate(max_elements, mass)
+    assert isinstance(truncated, Histogram1D)
+    # values are not renormalized
+    assert truncated.to_dict() == {key: VALUES[key] for key in expected}
+    assert list(truncated.to_dict()) == expected
+
+
+def test_truncate_copies():
+    hist = histogram(VALUES)
+    truncated = hist.truncate(2)
+    truncated["e1"].value = 1.0
+    assert hist["e1"].value == 0.4
+    assert histogram({}).truncate(2, 0.5).to_dict() == {}
+
+
+def test_truncate_full_mass():
+    """Rounding of the cumulative sum in ranked order does not drop elements of mass 1.0"""
+    hist = histogram({"e1": 0.1, "e2": 0.2, "e3": 0.7})
+    assert sum(sorted(hist.to_dict().values(), reverse=True)) < sum(hist.to_dict().values())
+    assert set(hist.truncate(mass=1.0).to_dict()) == {"e1", "e2", "e3"}
@@ -0,0 +1,35 @@
+import numpy as np
+import pytest
+
+from utils.datasets import ColorImageGenerator, ImageStore
+
+
+@pytest.fixture(scope="module")
+def images():
+    return ColorImageGenerator().generate_batch(5, (20, 30), steps=(5, 5), random_state=8)
+
+
+def test_from_images(images, tmp_path):
+    path = str(tmp_path / "images.npy")
+    store = ImageStore.from_images(path, (image for image in images), count=len(images))
+    assert len(store) == len(images) and store.shape == images.shape[1:]
+    assert np.array_equal(store[3], images[3])
+    assert np.array_equal(store.take([4, 0]), images[[4, 0]])
+    assert 4 in store and 5 not in store
+    assert np.array_equal(np.stack(list(ImageStore(path))), images)
+
+
+@pytest.mark.parametrize("count", [3, 7])
+def test_from_images_count(images, tmp_path, count):
+    path = tmp_path / "images.npy"
+    with pytest.raises(ValueError):
+        ImageStore.from_images(str(path), iter(images), count=count)
+    assert not path.exists()
+
+
+def test_create(images, tmp_path):
+    store = ImageStore.create(str(tmp_path / "images.npy"), 2, images.shape[1:])
+    assert not store[1].any()
+    store[1] = images[0]
+    store.flush()
+    assert np.array_equal(ImageStore(store.path)[1], images[0])
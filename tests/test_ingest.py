@@ -0,0 +1,74 @@
+import numpy as np
+import pytest
+
+from utils.datasets import ColorImageGenerator
+from utils.feature_extraction import ColorSetTransformer, create_position_histogram
+from utils.ingest import HistogramExtractor, SegmentWriter, extract_histograms, ingest, list_segments, read_segments
+
+
+GRID = (5, 5)
+
+
+@pytest.fixture(scope="module")
+def images():
+    return ColorImageGenerator().generate_batch(7, (50, 50), steps=(10, 10), random_state=2)
+
+
+def as_dicts(hists):
+    return [(doc_id, hist.to_dict()) for doc_id, hist in hists]
+
+
+def expected_histograms(images, start_id=0):
+    color_transformer = ColorSetTransformer()
+    return [(doc_id, create_position_histogram(color_transformer.transform(image), GRID))
+            for doc_id, image in enumerate(images, start_id)]
+
+
+def test_extract_histograms(images):
+    hists = extract_histograms(list(images), HistogramExtractor(GRID), chunk_size=3)
+    assert as_dicts(hists) == as_dicts(expected_histograms(images))
+    pairs = [(10 + i, image) for i, image in enumerate(images)]
+    assert [doc_id for doc_id, _ in extract_histograms(pairs, HistogramExtractor(GRID))] == list(range(10, 17))
+
+
+def test_read_images(images, tmp_path):
+    import matplotlib.image as image_utils
+    for i, image in enumerate(images):
+        image_utils.imsave(str(tmp_path / "{:03d}.png".format(i)), image)
+    assert as_dicts(extract_histograms(str(tmp_path), HistogramExtractor(GRID))) == \
+           as_dicts(expected_histograms(images))
+
+
+@pytest.mark.parametrize("columnar", [False, True])
+def test_segments(images, tmp_path, columnar):
+    with SegmentWriter(str(tmp_path), segment_size=3, columnar=columnar) as writer:
+        assert writer.next_id == 0
+        assert ingest(list(images[:4]), writer.append, splits=GRID) == 4
+    assert len(list_segments(str(tmp_path))) == 2
+
+    # Appending continues doc ids of the index
+    with SegmentWriter(str(tmp_path), segment_size=3, columnar=columnar) as writer:
+        assert writer.next_id == 4
+        ingest(list(images[4:]), writer.append, splits=GRID, start_id=writer.next_id)
+        assert writer.next_id == len(images)
+    hists = list(read_segments(str(tmp_path)))
+    assert [doc_id for doc_id, _ in hists] == list(range(len(images)))
+    expected = as_dicts(expected_histograms(images))
+    if columnar:
+        # float32 values of columnar segments
+        for (_, hist), (_, expected_hist) in zip(hists, expected):
+            assert list(hist.to_dict()) == list(expected_hist)
+            assert np.allclose(list(hist.to_dict().values()), list(expected_hist.values()))
+    else:
+        assert as_dicts(hists) == expected
+
+
+def test_failed_ingestion(images, tmp_path):
+    with pytest.raises(RuntimeError):
+        with SegmentWriter(str(tmp_path), segment_size=3) as writer:
+            for doc_id, hist in extract_histograms(list(images), HistogramExtractor(GRID)):
+                if doc_id == 5:
+                    raise RuntimeError("reading failed")
+                writer.append(doc_id, hist)
+    # the full segment is kept, the partial one of doc ids 3 and 4 is not committed
+    assert [doc_id for doc_id, _ in read_segments(str(tmp_path))] == [0, 1, 2]
@@ -0,0 +1,271 @@
+import threading
+
+import numpy as np
+import pytest
+
+from benchmarks.cross_bin import element_similarity
+from himpy.executor import ExpressionCache, QueryPlanner
+from himpy.histogram import Histogram1D
+from himpy.utils import E
+from utils.search_engine import (
+    DefaultSearchEngine, InvertedIndex, InvertedIndexCpp, InvertedIndexNative, MaterializedViews, SearchEngine,
+    _invertedindex
+)
+from utils.similarity import QuadraticFormSimilarity, intersection
+
+
+# top_n and last_n of the compared retrieve calls
+LIMITS = [(10, None), (1, None), (0, None), (None, None), (None, 5), (10, 3)]
+# the "dll" and "native" modes return either the top_n or the last_n documents
+NATIVE_LIMITS = [(10, None), (1, None), (0, None)]
+NATIVE_PARAMS = [("dll", *limits) for limits in NATIVE_LIMITS] + [
+    pytest.param("native", *limits, marks=pytest.mark.skipif(_invertedindex is None, reason="extension is not built"))
+    for limits in NATIVE_LIMITS]
+
+
+def assert_same_ranking(result, expected, tail=False):
+    """Same scores in the same order, documents may differ only among equal scores at the cut"""
+    if isinstance(expected, tuple):
+        assert isinstance(result, tuple) and len(result) == len(expected)
+        assert_same_ranking(result[0], expected[0])
+        assert_same_ranking(result[1], expected[1], tail=True)
+        return
+    assert len(result) == len(expected)
+    assert np.allclose([score for _, score in result], [score for _, score in expected])
+    if expected:
+        assert documents_before_cut(result, expected, tail) == documents_before_cut(expected, expected, tail)
+
+
+def documents_before_cut(ranked, expected, tail):
+    """Documents with scores other than the one at the cut of the expected ranking"""
+    if tail:
+        boundary = max(score for _, score in expected) - 1e-9
+        return {doc_id for doc_id, score in ranked if score < boundary}
+    boundary = min(score for _, score in expected) + 1e-9
+    return {doc_id for doc_id, score in ranked if score > boundary}
+
+
+def expected_ranking(engine, query, top_n, last_n):
+    """Ranking of DefaultSearchEngine filtered by the default threshold before cutting"""
+    return cut_ranking(engine.retrieve(query, top_n=None), top_n, last_n)
+
+
+def cut_ranking(ranked, top_n, last_n):
+    """Results of retrieve(top_n, last_n) of a full ranking"""
+    ranked = [(doc_id, score) for doc_id, score in ranked if score > 0.001]
+    if isinstance(last_n, int):
+        return ranked[:top_n], ranked[-last_n:]
+    return ranked[:top_n]
+
+
+def postfix(parser, query):
+    """Postfix expression of a query as evaluated by the engines"""
+    return ["(" + ", ".join(e) + ")" if isinstance(e, tuple) else e for e in parser.parse_string(query.value)]
+
+
+@pytest.fixture(scope="module")
+def default_engine(corpus):
+    return DefaultSearchEngine(corpus.hists, corpus.parser, corpus.evaluator())
+
+
+@pytest.fixture(scope="module")
+def quadratic_rankings(corpus):
+    """Rankings of the sample queries by DefaultSearchEngine with QuadraticFormSimilarity"""
+    similarity = QuadraticFormSimilarity(element_similarity(corpus.kind))
+    engine = DefaultSearchEngine(corpus.hists, corpus.parser, corpus.evaluator(), similarity=similarity)
+    return [engine.retrieve(query, top_n=None) for query in corpus.samples]
+
+
+@pytest.mark.parametrize("top_n, last_n", LIMITS)
+def test_expression_cache(corpus, default_engine, top_n, last_n):
+    cache = ExpressionCache(max_entries=16)
+    engine = InvertedIndex(corpus.hists, corpus.parser, corpus.evaluator(), expression_cache=cache)
+    for _ in range(2):
+        for query in corpus.expressions:
+            assert_same_ranking(engine.retrieve(query, top_n, last_n),
+                                expected_ranking(default_engine, query, top_n, last_n))
+    assert len(cache) > 0
+
+
+@pytest.mark.parametrize("mode, top_n, last_n", [("classic", *limits) for limits in LIMITS] + NATIVE_PARAMS)
+def test_max_score_pruning(corpus, default_engine, mode, top_n, last_n):
+    engine = SearchEngine(corpus.hists, corpus.parser, corpus.evaluator(), mode=mode, rules=corpus.rules, pruning=True)
+    for query in corpus.expressions:
+        assert_same_ranking(engine.retrieve(query, top_n, last_n), expected_ranking(default_engine, query, top_n, last_n))
+
+
+@pytest.mark.parametrize("mode, top_n, last_n", [("classic", *limits) for limits in LIMITS] + NATIVE_PARAMS)
+@pytest.mark.parametrize("similarity", ["intersection", "cosine"])
+def test_impact_ordered(corpus, mode, similarity, top_n, last_n):
+    default_engine = DefaultSearchEngine(corpus.hists, corpus.parser, corpus.evaluator(), similarity=similarity)
+    engine = SearchEngine(corpus.hists, corpus.parser, corpus.evaluator(), mode=mode, rules=corpus.rules,
+                          impact_ordered=True, similarity=similarity)
+    for query in corpus.samples:
+        assert_same_ranking(engine.retrieve(query, top_n, last_n), expected_ranking(default_engine, query, top_n, last_n))
+
+
+@pytest.mark.parametrize("top_n, last_n", LIMITS)
+@pytest.mark.parametrize("mode", ["classic", "parallel"])
+def test_query_planner(corpus, default_engine, mode, top_n, last_n):
+    engine = SearchEngine(corpus.hists, corpus.parser, corpus.evaluator(), mode=mode, planning=True)
+    for query in corpus.expressions:
+        assert_same_ranking(engine.retrieve(query, top_n, last_n), expected_ranking(default_engine, query, top_n, last_n))
+
+
+def test_query_planner_documents(corpus):
+    evaluator = corpus.evaluator()
+    engine = InvertedIndex(corpus.hists, corpus.parser, evaluator, planning=True)
+    planner = QueryPlanner(evaluator, engine.statistics)
+    storage = dict()
+    for doc_id, hist in corpus.hists:
+        for index in hist.elements():
+            storage.setdefault(index, set()).add(doc_id)
+    xor = E("top", "any").Xor(E("left", "any")) if corpus.kind == "position" else E("red").Xor(E("rose"))
+    for query in corpus.expressions + [xor]:
+        expression = postfix(corpus.parser, query)
+        assert planner.eval_expression(expression, storage) == evaluator.eval_expression(expression, storage)
+    with pytest.raises(ValueError):
+        planner.plan(expression, storage, input_type="infix")
+
+
+def test_query_planner_with_cache(corpus):
+    with pytest.raises(ValueError):
+        InvertedIndex(corpus.hists, corpus.parser, corpus.evaluator(), planning=True, expression_cache=ExpressionCache())
+
+
+def test_statistics(corpus):
+    evaluator = corpus.evaluator()
+    leaves = evaluator.high_level_leaves()
+    engine = InvertedIndex(corpus.hists, corpus.parser, evaluator)
+    assert not engine.statistics.high_level_elements()
+    statistics = InvertedIndex(corpus.hists, corpus.parser, evaluator, statistics=True).statistics
+    for index in engine.statistics.elements():
+        values = [hist.to_dict().get(index, 0.0) for _, hist in corpus.hists]
+        assert engine.statistics.document_frequency(index) == sum(value > 0 for value in values)
+        assert engine.statistics.max_value(index) == max(values)
+    for leaf, indexes_set in leaves.items():
+        documents = sum(bool(indexes_set & set(hist.elements())) for _, hist in corpus.hists)
+        assert statistics.leaf_document_frequency(leaf) == documents
+
+
+@pytest.mark.parametrize("top_n, last_n", LIMITS)
+@pytest.mark.parametrize("truncation", [{"query_elements": 3}, {"query_mass": 0.5}, {"query_elements": 5, "query_mass": 0.8}])
+@pytest.mark.parametrize("truncated_scoring", [False, True])
+def test_query_truncation(corpus, truncation, truncated_scoring, top_n, last_n):
+    """Candidates have one of the kept query elements and are scored with the full or the truncated query"""
+    engine = InvertedIndex(corpus.hists, corpus.parser, corpus.evaluator(), truncated_scoring=truncated_scoring,
+                           **truncation)
+    for query in corpus.samples:
+        truncated = query.truncate(truncation.get("query_elements"), truncation.get("query_mass"))
+        scoring_query = truncated if truncated_scoring else query
+        elements = set(truncated.elements())
+        scores = [(doc_id, intersection(scoring_query, hist)) for doc_id, hist in corpus.hists
+                  if elements & set(hist.elements())]
+        expected = cut_ranking(sorted(scores, key=lambda x: -x[1]), top_n, last_n)
+        assert_same_ranking(engine.retrieve(query, top_n, last_n), expected)
+
+
+@pytest.mark.parametrize("truncated_scoring", [False, True])
+def test_query_truncation_impact_ordered(corpus, truncated_scoring):
+    """Exact with truncated scoring, otherwise the stop is approximate but documents have their full scores"""
+    kwargs = {"query_elements": 4, "query_mass": 0.7, "truncated_scoring": truncated_scoring}
+    engine = InvertedIndex(corpus.hists, corpus.parser, corpus.evaluator(), **kwargs)
+    impact_engine = InvertedIndex(corpus.hists, corpus.parser, corpus.evaluator(), impact_ordered=True, **kwargs)
+    hists = dict(corpus.hists)
+    for query in corpus.samples:
+        result = impact_engine.retrieve(query, 10)
+        if truncated_scoring:
+            assert_same_ranking(result, engine.retrieve(query, 10))
+            continue
+        elements = set(query.truncate(4, 0.7).elements())
+        assert len(result) == 10
+        for doc_id, score in result:
+            assert elements & set(hists[doc_id].elements())
+            assert score == pytest.approx(intersection(query, hists[doc_id]))
+
+
+def test_query_truncation_mass(corpus, default_engine):
+    """Mass 1.0 keeps every query element, fewer elements read fewer posting lists"""
+    full = SearchEngine(corpus.hists, corpus.parser, corpus.evaluator(), mode="classic", query_mass=1.0)
+    truncated = SearchEngine(corpus.hists, corpus.parser, corpus.evaluator(), mode="classic", query_elements=2)
+    for query in corpus.samples:
+        result, stats = full.retrieve(query, None, return_stats=True)
+        assert_same_ranking(result, expected_ranking(default_engine, query, None, None))
+        _, truncated_stats = truncated.retrieve(query, None, return_stats=True)
+        assert truncated_stats.postings < stats.postings and truncated_stats.candidates <= stats.candidates
+
+
+@pytest.mark.parametrize("top_n, last_n", LIMITS)
+@pytest.mark.parametrize("mode, kwargs", [
+    ("ann", {"n_lists": 4, "n_probe": 4, "random_state": 0}), ("coarse", {}), ("crossbin", None)])
+def test_histogram_engines(corpus, default_engine, quadratic_rankings, mode, kwargs, top_n, last_n):
+    """
+    Exhaustive settings: the shortlist covers the corpus and "ann" probes every list.
+    Histogram queries of "crossbin" are ranked as by DefaultSearchEngine with QuadraticFormSimilarity.
+    """
+    if mode == "crossbin":
+        kwargs = {"element_similarity": element_similarity(corpus.kind)}
+        rankings = quadratic_rankings
+    else:
+        kwargs = dict(kwargs, shortlist=len(corpus.hists))
+        rankings = [default_engine.retrieve(query, top_n=None) for query in corpus.samples]
+    engine = SearchEngine(corpus.hists, corpus.parser, corpus.evaluator(), mode=mode, **kwargs)
+    for query in corpus.expressions:
+        assert_same_ranking(engine.retrieve(query, top_n, last_n), expected_ranking(default_engine, query, top_n, last_n))
+    for query, ranked in zip(corpus.samples, rankings):
+        assert_same_ranking(engine.retrieve(query, top_n, last_n), cut_ranking(ranked, top_n, last_n))
+
+
+@pytest.mark.parametrize("top_n, last_n", LIMITS)
+def test_materialized_views(corpus, default_engine, top_n, last_n):
+    engine = InvertedIndex(corpus.hists, corpus.parser, corpus.evaluator(), materialize=True)
+    views = MaterializedViews(corpus.evaluator().high_level_leaves())
+    union_leaves = [views.union_leaves(postfix(corpus.parser, query)) for query in corpus.expressions]
+    assert any(leaves is not None for leaves in union_leaves) and any(leaves is None for leaves in union_leaves)
+    for query in corpus.expressions:
+        assert_same_ranking(engine.retrieve(query, top_n, last_n), expected_ranking(default_engine, query, top_n, last_n))
+
+
+@pytest.mark.parametrize("engine_class", [InvertedIndexCpp, pytest.param(
+    InvertedIndexNative, marks=pytest.mark.skipif(_invertedindex is None, reason="extension is not built"))])
+def test_concurrent_retrieve(corpus, engine_class):
+    """
+    Threads querying one index while another thread adds documents and rules get the results of serial calls,
+    the added documents have no elements of the queries
+    """
+    engine = engine_class(corpus.hists, corpus.parser, corpus.rules, threads=1)
+    queries = corpus.expressions + corpus.samples
+    expected = [engine.retrieve(query, 10) for query in queries]
+    added = Histogram1D(data=["99, e99" if corpus.kind == "position" else "e99"])
+    added_ids = list()
+    barrier = threading.Barrier(5)
+    done = threading.Event()
+    results = [list() for _ in range(4)]
+
+    def read(result):
+        barrier.wait()
+        for _ in range(2):
+            result.append([engine.retrieve(query, 10) for query in queries])
+
+    def write():
+        barrier.wait()
+        while not done.is_set():
+            doc_id = 1000 + len(added_ids)
+            engine.add_document(doc_id, added)
+            # one-dimensional rules are replaced by name, a list of rules would add dimensions
+            if isinstance(corpus.rules, dict):
+                engine.add_rules({"added_{}".format(doc_id): {"e99"}})
+            added_ids.append(doc_id)
+
+    readers = [threading.Thread(target=read, args=(result,)) for result in results]
+    writer = threading.Thread(target=write)
+    for thread in readers + [writer]:
+        thread.start()
+    for thread in readers:
+        thread.join()
+    done.set()
+    writer.join()
+    assert all(rounds == [expected] * 2 for rounds in results)
+    assert {doc_id for doc_id, _ in engine.retrieve(added, len(added_ids) + 1)} == set(added_ids)
+    if isinstance(corpus.rules, dict):
+        assert {doc_id for doc_id, _ in engine.retrieve(E("added_1000"), len(added_ids) + 1)} == set(added_ids)
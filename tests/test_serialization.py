@@ -0,0 +1,70 @@
+import numpy as np
+import pytest
+
+from himpy.histogram import HElement, Histogram1D
+from himpy.serialization import CorpusWriter, iter_corpus, read_corpus, write_corpus
+
+
+def histogram(values):
+    hist = Histogram1D(data=None)
+    for key, value in values.items():
+        hist[key] = HElement(key, value)
+    return hist
+
+
+def as_dicts(hists):
+    return [(doc_id, hist.to_dict()) for doc_id, hist in hists]
+
+
+@pytest.mark.parametrize("data", [
+    {"e1": 0.01, "e40": 0.5, "e7": 0.49},
+    {("1", "e1"): 0.25, ("12", "e40"): 0.75},
+    {},
+])
+def test_histogram_bytes(data):
+    hist = histogram(data)
+    restored = Histogram1D.from_bytes(hist.to_bytes(double=True))
+    assert isinstance(restored, Histogram1D)
+    assert restored.to_dict() == hist.to_dict()
+    # float32 by default
+    restored = Histogram1D.from_bytes(hist.to_bytes())
+    assert list(restored.to_dict()) == list(hist.to_dict())
+    assert restored.to_dict() == {key: float(np.float32(value)) for key, value in hist.to_dict().items()}
+
+
+def test_float32_is_lossy():
+    hist = histogram({"e1": 0.01})
+    assert Histogram1D.from_bytes(hist.to_bytes()).to_dict() == {"e1": 0.009999999776482582}
+    assert Histogram1D.from_bytes(hist.to_bytes(double=True)).to_dict() == {"e1": 0.01}
+    with pytest.raises(ValueError):
+        Histogram1D.from_bytes(b"HMC1" + hist.to_bytes()[4:])
+
+
+@pytest.mark.parametrize("compress", [False, True])
+def test_corpus(corpus, tmp_path, compress):
+    hists = corpus.hists + [(1000, histogram({}))]
+    path = str(tmp_path / "corpus.hmc")
+    assert write_corpus(path, hists, double=True, compress=compress) == len(hists)
+    assert as_dicts(read_corpus(path)) == as_dicts(hists)
+
+    with CorpusWriter(path, compress=compress) as writer:
+        writer.extend(hists)
+    for (doc_id, hist), (expected_id, expected) in zip(read_corpus(path), hists):
+        assert doc_id == expected_id and list(hist.to_dict()) == list(expected.to_dict())
+        assert np.allclose(list(hist.to_dict().values()), list(expected.to_dict().values()))
+
+
+def test_iter_corpus(corpus, tmp_path):
+    hists = corpus.hists
+    path = str(tmp_path / "corpus.hmc")
+    write_corpus(path, hists, double=True)
+    stream = iter_corpus(path)
+    assert as_dicts([next(stream), next(stream)]) == as_dicts(hists[:2])
+    stream.close()
+
+    write_corpus(path, [])
+    assert read_corpus(path) == []
+    with open(path, "wb") as f:
+        f.write(b"HMC")
+    with pytest.raises(ValueError):
+        read_corpus(path)
@@ -0,0 +1,105 @@
+import logging
+
+import pytest
+
+from himpy.utils import E
+from utils.profiler import QueryProfiler
+from utils.search_engine import InvertedIndexCpp, SearchEngine, _invertedindex
+from utils.tracing import QueryStats, SlowQueryLog
+
+
+MODES = ["classic", "parallel", "dll", pytest.param(
+    "native", marks=pytest.mark.skipif(_invertedindex is None, reason="extension is not built"))]
+
+
+def counters(stats):
+    return stats.candidates, stats.postings, stats.scored, stats.results
+
+
+@pytest.mark.parametrize("mode", MODES[1:])
+def test_counters(corpus, mode):
+    """Counters of every mode are equal to those of the "classic" mode"""
+    classic = SearchEngine(corpus.hists, corpus.parser, corpus.evaluator(), mode="classic")
+    engine = SearchEngine(corpus.hists, corpus.parser, corpus.evaluator(), mode=mode, rules=corpus.rules)
+    for query in corpus.expressions + corpus.samples:
+        result, stats = engine.retrieve(query, top_n=10, return_stats=True)
+        expected, expected_stats = classic.retrieve(query, top_n=10, return_stats=True)
+        assert counters(stats) == counters(expected_stats)
+        assert stats.results == len(result) and stats.mode == mode
+        assert {"candidates", "scoring", "sorting"} <= set(stats.stages)
+        assert stats.total_ms >= 0 and all(elapsed >= 0 for elapsed in stats.stages.values())
+
+
+@pytest.mark.parametrize("mode", MODES)
+def test_position_counters(corpus, mode):
+    if corpus.kind != "position":
+        pytest.skip("counters of the position corpus")
+    engine = SearchEngine(corpus.hists, corpus.parser, corpus.evaluator(), mode=mode, rules=corpus.rules)
+    _, stats = engine.retrieve(E("top", "green") + E("any", "red"), top_n=10, return_stats=True)
+    assert counters(stats) == (150, 7031, 150, 10)
+
+
+def test_cpp_stats(corpus):
+    """Counters and stage times of library.h are copied from CQueryStats"""
+    engine = InvertedIndexCpp(corpus.hists, corpus.parser, corpus.rules)
+    for query in (corpus.expressions[0], corpus.samples[0]):
+        stats = QueryStats()
+        result = engine.retrieve(query, top_n=5, stats=stats)
+        assert result == engine.retrieve(query, top_n=5)
+        assert stats.candidates > 0 and stats.postings > 0 and stats.scored > 0
+        assert set(stats.stages) == {"parse", "candidates", "scoring", "sorting", "decode"}
+
+
+def test_callbacks(corpus):
+    calls = list()
+    engine = SearchEngine(corpus.hists, corpus.parser, corpus.evaluator(), mode="classic", callbacks=[calls.append])
+    query = corpus.expressions[0]
+    result = engine.retrieve(query, top_n=3)
+    assert len(calls) == 1 and calls[0].query == str(query) and calls[0].query_type == "expression"
+    assert calls[0].results == len(result) == 3
+
+    histogram_calls = list()
+    engine.add_callback(histogram_calls.append)
+    engine.retrieve(corpus.samples[0], top_n=3)
+    assert len(calls) == 2 and histogram_calls == calls[1:]
+    assert calls[1].query_type == "histogram"
+
+    engine.remove_callback(calls.append)
+    engine.remove_callback(histogram_calls.append)
+    assert engine.retrieve(query, top_n=3) == result
+    assert len(calls) == 2 and len(histogram_calls) == 1
+
+
+def test_slow_query_log(corpus, caplog):
+    query = corpus.expressions[0]
+    with caplog.at_level(logging.WARNING, logger="utils.tracing"):
+        SearchEngine(corpus.hists, corpus.parser, corpus.evaluator(), mode="classic", slow_query_ms=1e9).retrieve(query)
+        assert not caplog.records
+        SearchEngine(corpus.hists, corpus.parser, corpus.evaluator(), mode="classic", slow_query_ms=0).retrieve(query)
+    assert len(caplog.records) == 1
+    assert caplog.records[0].name == "utils.tracing" and str(query) in caplog.records[0].getMessage()
+
+    logger = logging.getLogger("tests.slow_queries")
+    with caplog.at_level(logging.INFO, logger=logger.name):
+        SlowQueryLog(5, logger, level=logging.INFO)(QueryStats("classic", "expression", "q"))
+        stats = QueryStats("classic", "expression", "q")
+        stats.total_ms = 5
+        SlowQueryLog(5, logger, level=logging.INFO)(stats)
+    assert [record.levelno for record in caplog.records[1:]] == [logging.INFO]
+
+
+def test_explain_expression(corpus):
+    """Candidates of the root are the documents of eval_expression"""
+    evaluator = corpus.evaluator()
+    profiler = QueryProfiler(corpus.hists, corpus.parser, evaluator)
+    storage = dict()
+    for doc_id, hist in corpus.hists:
+        for index in hist.elements():
+            storage.setdefault(index, set()).add(doc_id)
+    for query in corpus.expressions:
+        profile = profiler.explain(query)
+        assert profile.tree.doc_ids == evaluator.eval_expression(profile.expression, storage)
+        assert profile.stats.candidates == len(profile.tree.doc_ids)
+        assert all(child.time_ms <= profile.tree.time_ms for child in profile.tree.children)
+    with pytest.raises(ValueError):
+        evaluator.explain_expression(profile.expression, storage, input_type="infix")
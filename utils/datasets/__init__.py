@@ -1,6 +1,10 @@
 from .color_image_generator import ColorImageGenerator
+from .image_store import ImageStore
+from .synthetic import BlockHistogramGenerator
 
 
 __all__ = [
-    "ColorImageGenerator"
+    "ColorImageGenerator",
+    "ImageStore",
+    "BlockHistogramGenerator"
 ]
@@ -1,6 +1,10 @@
 import os
 import shutil
 import urllib.request
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
 
 
 """
@@ -30,3 +34,26 @@ def _unpack(src_path, dst_path, delete_archive=True):
     shutil.unpack_archive(src_path, dst_path)
     if delete_archive is True:
         os.unlink(src_path)
+
+
+def _iter_chunks(func, count, chunk_size=1000, n_jobs=1, random_state=None, **kwargs):
+    """
+    Results of func(size, random_state=seed, **kwargs) for chunks of count items
+
+    Every chunk has its own seed spawned from random_state, so the results are the same
+    for any n_jobs. With n_jobs > 1 chunks are computed by processes, at most 2 * n_jobs at a time.
+    """
+    seeds = np.random.SeedSequence(random_state).spawn((count + chunk_size - 1) // chunk_size)
+    sizes = [min(chunk_size, count - i * chunk_size) for i in range(len(seeds))]
+    if n_jobs == 1:
+        for size, seed in zip(sizes, seeds):
+            yield func(size, random_state=seed, **kwargs)
+        return
+    with ProcessPoolExecutor(max_workers=n_jobs) as executor:
+        in_flight = deque()
+        for size, seed in zip(sizes, seeds):
+            if len(in_flight) == 2 * n_jobs:
+                yield in_flight.popleft().result()
+            in_flight.append(executor.submit(func, size, random_state=seed, **kwargs))
+        while in_flight:
+            yield in_flight.popleft().result()
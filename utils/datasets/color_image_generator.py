@@ -2,6 +2,7 @@ import copy
 import random
 import numpy as np
 
+from .base import _iter_chunks
 from ..feature_extraction.color import COLOR_ELEMENTS_RGB, hsl2rgb
 
 
@@ -18,7 +19,7 @@ class ColorImageGenerator:
 
     def generate(self, shape, element_ids="all", steps=(5, 5), normal_element_ids=None, random_state=None):
 
-        random.seed(random_state)
+        rng = random.Random(random_state)
 
         num_splits_x = shape[1] // steps[1]
         num_splits_y = shape[0] // steps[0]
@@ -30,25 +31,113 @@ class ColorImageGenerator:
         for i in range(num_splits_y):
             for j in range(num_splits_x):
                 image[i*steps[1]:(i+1)*steps[1], j*steps[0]:(j+1)*steps[0], :] = \
-                    self._elements[random.choice(list(element_ids_))]
+                    self._elements[rng.choice(list(element_ids_))]
 
         if not normal_element_ids:
             return image
 
-        cx = random.randint(0, num_splits_x)
-        cy = random.randint(0, num_splits_y)
+        cx = rng.randint(0, num_splits_x)
+        cy = rng.randint(0, num_splits_y)
 
         sx = num_splits_x//4
         sy = num_splits_y//4
 
         for _ in range(num_splits_y):
             for _ in range(num_splits_x):
-                x = round(random.normalvariate(mu=cx, sigma=sx))
-                y = round(random.normalvariate(mu=cy, sigma=sy))
+                x = round(rng.normalvariate(mu=cx, sigma=sx))
+                y = round(rng.normalvariate(mu=cy, sigma=sy))
                 image[x*steps[1]:(x+1)*steps[1], y*steps[0]:(y+1)*steps[0], :] = \
-                    self._elements[random.choice(list(normal_element_ids))]
+                    self._elements[rng.choice(list(normal_element_ids))]
         return image
 
+    def generate_codes(self, count, shape, element_ids="all", steps=(5, 5), normal_element_ids=None,
+                       normal_share=1.0, random_state=None):
+        """
+        Block-level element maps of a batch of images
+
+        Every block is filled with a random element, images selected with probability normal_share
+        are then painted with normal_element_ids around a random center as in generate.
+        Unlike generate, samples that fall outside the grid are dropped.
+
+        Parameters
+        ----------
+        count               number of images
+        shape               shape of an image in pixels
+        element_ids         "all" or element ids to fill blocks with
+        steps               shape of a block in pixels
+        normal_element_ids  element ids of the normally distributed region
+        normal_share        probability of an image to have the normally distributed region
+        random_state        seed, numpy.random.SeedSequence or numpy.random.Generator
+
+        Returns
+        -------
+        codes, shape (count, blocks along y, blocks along x), of indices into the returned element ids
+        """
+        rng = np.random.default_rng(random_state)
+        elements = self._ordered_ids(element_ids)
+        normal_elements = self._ordered_ids(normal_element_ids) if normal_element_ids else list()
+        vocabulary = elements + [element for element in normal_elements if element not in elements]
+
+        num_splits = np.array([shape[0] // steps[0], shape[1] // steps[1]])
+        codes = rng.integers(len(elements), size=(count, *num_splits))
+
+        if normal_elements:
+            index = {element: i for i, element in enumerate(vocabulary)}
+            normal_codes = np.array([index[element] for element in normal_elements])
+            images = np.flatnonzero(rng.random(count) < normal_share)
+            num_samples = int(num_splits.prod())
+            centers = rng.integers(0, num_splits + 1, size=(len(images), 2))
+            points = np.rint(
+                centers[:, None, :] + rng.standard_normal((len(images), num_samples, 2)) * (num_splits // 4)
+            ).astype(np.intp)
+            values = normal_codes[rng.integers(len(normal_codes), size=(len(images), num_samples))]
+            inside = np.all((points >= 0) & (points < num_splits), axis=-1)
+            image_ids = np.broadcast_to(images[:, None], inside.shape)
+            codes[image_ids[inside], points[..., 0][inside], points[..., 1][inside]] = values[inside]
+        return codes, vocabulary
+
+    def generate_batch(self, count, shape, element_ids="all", steps=(5, 5), normal_element_ids=None,
+                       normal_share=1.0, random_state=None, output="rgb"):
+        """
+        Batch of images, see generate_codes
+
+        Parameters
+        ----------
+        output  "rgb" for images, shape (count, *shape, 3), or "elements" for maps of element ids,
+                shape (count, *shape), equal to ColorSetTransformer output for the images;
+                pixels out of the block grid are black or have no element "0"
+        """
+        codes, vocabulary = self.generate_codes(
+            count, shape, element_ids, steps, normal_element_ids, normal_share, random_state)
+        if output == "rgb":
+            values = np.array([self._elements[element] for element in vocabulary], dtype=np.uint8)
+            images = np.zeros((count, *shape, 3), dtype=np.uint8)
+        elif output == "elements":
+            values = np.array(vocabulary, dtype="<U10")
+            images = np.full((count, *shape), fill_value="0", dtype="<U10")
+        else:
+            raise ValueError("Unsupported output: {}".format(output))
+        height, width = codes.shape[1] * steps[0], codes.shape[2] * steps[1]
+        images[:, :height, :width] = values[codes].repeat(steps[0], axis=1).repeat(steps[1], axis=2)
+        return images
+
+    def iter_batches(self, count, shape, chunk_size=1000, n_jobs=1, random_state=None, **kwargs):
+        """
+        Stream batches of at most chunk_size images, see generate_batch
+
+        The stream is the same for any n_jobs, see _iter_chunks.
+        """
+        return _iter_chunks(
+            self.generate_batch, count, chunk_size, n_jobs, random_state, shape=shape, **kwargs)
+
+    def _ordered_ids(self, element_ids):
+        if element_ids == "all":
+            return list(self._elements.keys())
+        # Order of a set depends on hash seed of the process
+        if isinstance(element_ids, (set, frozenset)):
+            return sorted(element_ids, key=str)
+        return list(element_ids)
+
     def _assign_display_hsb_colors(self, elements):
         """
         RGB colors for element
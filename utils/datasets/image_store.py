@@ -0,0 +1,97 @@
+import itertools
+import os
+
+import numpy as np
+from numpy.lib.format import open_memmap
+
+
+"""
+Image Store
+"""
+
+
+class ImageStore:
+    """
+    Images of the same shape in a memory-mapped .npy file, the doc id of an image is its row
+
+    Only accessed images are read from disk, so ranked results can be shown
+    without loading the corpus, e.g. show_rank_images(ImageStore("images.npy"), ranked_images, title)
+
+    Parameters
+    ----------
+    path    path of the .npy file
+    mode    "r" to read or "r+" to also write images
+    """
+
+    def __init__(self, path: str, mode: str = "r"):
+        self._path = path
+        self._images = np.load(path, mmap_mode=mode)
+
+    @classmethod
+    def create(cls, path: str, count: int, shape, dtype=np.uint8):
+        """Writable store of count zero images"""
+        open_memmap(path, mode="w+", dtype=dtype, shape=(count, *shape)).flush()
+        return cls(path, mode="r+")
+
+    @classmethod
+    def from_images(cls, path: str, images, count: int = None, shape=None, dtype=np.uint8):
+        """
+        Store images of an iterable written one at a time
+
+        count is required for iterables without len, e.g. generators. Raises ValueError
+        and removes the file if the iterable has another number of images.
+        """
+        if count is None:
+            count = len(images)
+        images = iter(images)
+        if shape is None:
+            first = next(images)
+            shape = first.shape
+            images = itertools.chain([first], images)
+        store = cls.create(path, count, shape, dtype)
+        written = 0
+        for image in itertools.islice(images, count):
+            store[written] = image
+            written += 1
+        if written != count or next(images, None) is not None:
+            del store
+            os.remove(path)
+            raise ValueError("Expected {} images, got {}".format(
+                count, written if written != count else "more"))
+        store.flush()
+        return cls(path)
+
+    @property
+    def path(self):
+        return self._path
+
+    @property
+    def shape(self):
+        """Shape of an image"""
+        return self._images.shape[1:]
+
+    def take(self, doc_ids):
+        """Images of doc ids read into memory"""
+        return self._images[np.asarray(doc_ids, dtype=np.intp)]
+
+    def flush(self):
+        if isinstance(self._images, np.memmap):
+            self._images.flush()
+
+    def __getitem__(self, doc_id):
+        return self._images[doc_id]
+
+    def __setitem__(self, doc_id, image):
+        self._images[doc_id] = image
+
+    def __len__(self):
+        return len(self._images)
+
+    def __iter__(self):
+        return iter(self._images)
+
+    def __contains__(self, doc_id):
+        return isinstance(doc_id, (int, np.integer)) and 0 <= doc_id < len(self._images)
+
+    def __repr__(self):
+        return "ImageStore({!r}, {} images of shape {})".format(os.fspath(self._path), len(self), self.shape)
@@ -0,0 +1,103 @@
+import numpy as np
+
+from himpy.histogram import Histogram1D, HElement
+from .base import _iter_chunks
+from .color_image_generator import ColorImageGenerator
+from ..feature_extraction.position import PositionSetTransformer
+
+
+"""
+Synthetic Histograms
+"""
+
+
+class BlockHistogramGenerator:
+    """
+    Histograms of synthetic images computed directly from their blocks
+
+    Images are never painted: a histogram is accumulated from the element of every block
+    and the number of its pixels in every position element, so it is equal to
+    create_histogram((position_image, color_image)), or create_histogram((color_image,))
+    without splits, of the image ColorImageGenerator.generate_batch paints with the same seed.
+    Pixels out of the block grid are skipped.
+
+    Parameters
+    ----------
+    splits          grid of position elements as in PositionSetTransformer or None for color histograms
+    image_generator ColorImageGenerator that draws blocks
+    """
+
+    def __init__(self, splits=None, image_generator=None):
+        self._splits = splits
+        self._image_generator = image_generator or ColorImageGenerator()
+        self._layouts = dict()
+
+    def generate(self, count, shape, steps=(5, 5), random_state=None, **kwargs):
+        """Histograms of a batch of images, see ColorImageGenerator.generate_codes for kwargs"""
+        codes, vocabulary = self._image_generator.generate_codes(
+            count, shape, steps=steps, random_state=random_state, **kwargs)
+        return self.transform(codes, vocabulary, shape, steps)
+
+    def iter_batches(self, count, shape, chunk_size=1000, n_jobs=1, random_state=None, **kwargs):
+        """Stream lists of at most chunk_size histograms, the same for any n_jobs, see _iter_chunks"""
+        return _iter_chunks(self.generate, count, chunk_size, n_jobs, random_state, shape=shape, **kwargs)
+
+    def transform(self, codes, vocabulary, shape, steps):
+        """
+        Histograms of block-level element maps
+
+        Parameters
+        ----------
+        codes       shape (count, blocks along y, blocks along x), indices into vocabulary
+        vocabulary  color element ids
+        shape       shape of an image in pixels
+        steps       shape of a block in pixels
+        """
+        count = codes.shape[0]
+        blocks, positions, pixels, position_ids = self._layout(tuple(shape), tuple(steps))
+        num_bins = len(position_ids) * len(vocabulary)
+        # Bin of every (block, position) overlap is position * len(vocabulary) + element
+        bins = positions * len(vocabulary) + codes.reshape(count, -1)[:, blocks]
+        bins += np.arange(count)[:, None] * num_bins
+        counts = np.bincount(
+            bins.ravel(), weights=np.broadcast_to(pixels, bins.shape).ravel(), minlength=count * num_bins)
+        values = counts.reshape(count, num_bins) / (shape[0] * shape[1])
+
+        names, order = self._bin_names(position_ids, vocabulary)
+        hists = list()
+        for image_values in values:
+            hist = Histogram1D(data=None)
+            for i in order[image_values[order] > 0]:
+                hist[names[i]] = HElement(names[i], image_values[i])
+            hists.append(hist)
+        return hists
+
+    def _layout(self, shape, steps):
+        """Overlaps (block, position index, pixels) of the block grid and position elements"""
+        key = (shape, steps)
+        if key not in self._layouts:
+            height, width = shape[0] // steps[0] * steps[0], shape[1] // steps[1] * steps[1]
+            rows, cols = np.indices((height, width))
+            block_map = rows // steps[0] * (width // steps[1]) + cols // steps[1]
+            if self._splits is None:
+                position_map = np.ones_like(block_map)
+                position_ids = [None]
+            else:
+                position_map = PositionSetTransformer(splits=self._splits).fit_transform(
+                    np.zeros(shape))[:height, :width].astype(np.intp)
+                position_ids = list(range(1, int(np.max(position_map)) + 1))
+            inside = position_map > 0
+            pairs, pixels = np.unique(
+                np.c_[block_map[inside], position_map[inside] - 1], axis=0, return_counts=True)
+            self._layouts[key] = pairs[:, 0], pairs[:, 1], pixels, position_ids
+        return self._layouts[key]
+
+    @staticmethod
+    def _bin_names(position_ids, vocabulary):
+        """Element names of bins and their order in create_histogram"""
+        if position_ids == [None]:
+            names = [str(element) for element in vocabulary]
+            return names, np.array(sorted(range(len(names)), key=names.__getitem__))
+        pairs = [(str(position), str(element)) for position in position_ids for element in vocabulary]
+        names = [", ".join(pair) for pair in pairs]
+        return names, np.array(sorted(range(len(pairs)), key=pairs.__getitem__))
@@ -1,10 +1,13 @@
-from .color import ColorSetTransformer
-from .position import PositionSetTransformer
+from .color import ColorSetTransformer, color_element_similarity
+from .position import PositionSetTransformer, position_element_similarity
 from .base import (
     FeatureMerger,
+    ElementFilter,
     filter_data,
     create_histogram,
+    create_position_histogram,
     create_histogram_,
+    downsample,
     extract_elements,
     extract_element_set
 )
@@ -12,11 +15,16 @@ from .base import (
 
 __all__ = [
     "FeatureMerger",
+    "ElementFilter",
     "ColorSetTransformer",
     "PositionSetTransformer",
+    "color_element_similarity",
+    "position_element_similarity",
     "filter_data",
     "create_histogram",
+    "create_position_histogram",
     "create_histogram_",
+    "downsample",
     "extract_elements",
     "extract_element_set"
 ]
@@ -106,6 +106,39 @@ def create_histogram(features, normalize=True):
     return hist
 
 
+def create_position_histogram(features, splits, normalize=True):
+    """
+    (Position, color) histogram of a 2D map of elements without a position mask
+
+    Equal to create_histogram((position_image, features)) for position_image of
+    PositionSetTransformer(splits). Elements are counted block by block of the grid cells,
+    so only one block is copied (and sorted) at a time: extra memory is of the size of a grid
+    cell, not of the whole data
+    """
+    steps = [features.shape[i] // splits[i] for i in range(2)]
+    # zero element means NaN as element ids is not equal to 0
+    is_integer = np.issubdtype(features.dtype, np.integer)
+    zero_ = 0 if is_integer else "0"
+    counts = dict()
+    if min(steps) > 0:
+        for i in range(splits[0]):
+            for j in range(splits[1]):
+                block = features[i*steps[0]:(i+1)*steps[0], j*steps[1]:(j+1)*steps[1]]
+                elements, block_counts = np.unique(block, return_counts=True)
+                for element, count in zip(elements.tolist(), block_counts.tolist()):
+                    if element != zero_:
+                        counts[(i * splits[1] + j + 1, element)] = count
+
+    # Order of np.unique over rows of position and element
+    order = sorted(counts) if is_integer else sorted(counts, key=lambda key: (str(key[0]), key[1]))
+    hist = Histogram1D(data=None)
+    for position, element in order:
+        item_tuple = "{}, {}".format(position, element)
+        count = counts[(position, element)]
+        hist[item_tuple] = HElement(item_tuple, count / features.size if normalize else count)
+    return hist
+
+
 def create_histogram_(merged_features, normalize=True):
     """
     Slower than create_histogram?
@@ -175,7 +208,35 @@ def convert_complete_histogram_values(U, H, to_sort=False):
 
 
 """
-Filters 
+Downsampling
+"""
+
+
+def downsample(image, factor, method="stride"):
+    """
+    Image reduced by factor along both axes
+
+    Parameters
+    ----------
+    image   array of shape (height, width) or (height, width, channels)
+    factor  integer reduction factor, 1 returns the image itself
+    method  "stride" to take every factor-th pixel or "area" to average factor x factor blocks,
+            in which case the remainder of the size // factor is cropped
+    """
+    if factor == 1:
+        return image
+    if method == "stride":
+        return image[::factor, ::factor]
+    if method == "area":
+        height, width = image.shape[0] // factor, image.shape[1] // factor
+        blocks = image[:height * factor, :width * factor].reshape(
+            (height, factor, width, factor) + image.shape[2:])
+        return np.rint(blocks.mean(axis=(1, 3))).astype(image.dtype)
+    raise ValueError("Unsupported method: {}".format(method))
+
+
+"""
+Filters
 """
 
 
@@ -206,12 +267,140 @@ def filter_data(data, features, elements):
 
     elements_ = np.array(elements, dtype=features_.dtype)
 
-    indx = np.in1d(features_, elements_)
+    indx = np.isin(features_, elements_)
     mask[indx] = data_flatten[indx]
 
     return mask.reshape(data.shape)
 
 
+class ElementFilter:
+    """
+    Batched filter of data by element sets with lookup tables
+
+    Features are encoded once to integer codes of their elements (combinations of elements
+    for several features), then a filter by an element set is a lookup of the codes in
+    a boolean table of the set. Masks and filtered data can be written to preallocated buffers.
+
+    Usage:
+        element_filter = ElementFilter().fit((position_image, color_image))
+        codes = element_filter.transform((position_image, color_image))
+        images = element_filter.filter_data(image[None], codes[None], [HE1.elements(), HE2.elements()])
+    """
+
+    def __init__(self):
+        self._vocabularies = None
+
+    def fit(self, features, y=None):
+        self._vocabularies = [np.unique(feature) for feature in self._split(features)]
+        return self
+
+    def transform(self, features):
+        """Codes of elements, shape of features; elements out of the vocabularies have their own codes"""
+        if self._vocabularies is None:
+            raise Exception("Use the fit method at first.")
+        features = self._split(features)
+        if len(features) != len(self._vocabularies):
+            raise Exception("Mismatching dimensions.")
+        codes = np.zeros(features[0].shape, dtype=np.int64)
+        for feature, vocabulary in zip(features, self._vocabularies):
+            codes *= len(vocabulary) + 1
+            codes += self._encode(vocabulary, feature)
+        return codes
+
+    def fit_transform(self, features, y=None):
+        return self.fit(features, y).transform(features)
+
+    def lookup_tables(self, element_sets):
+        """Boolean tables of element sets, shape (number of sets, number of codes)"""
+        sizes = [len(vocabulary) + 1 for vocabulary in self._vocabularies]
+        tables = np.zeros((len(element_sets), int(np.prod(sizes))), dtype=bool)
+        for i, elements in enumerate(element_sets):
+            keys = [self._split_key(element) for element in elements]
+            if not keys:
+                continue
+            codes = np.zeros(len(keys), dtype=np.int64)
+            known = np.ones(len(keys), dtype=bool)
+            for dim, vocabulary in enumerate(self._vocabularies):
+                dim_codes = self._encode(vocabulary, np.array([key[dim] for key in keys]).astype(vocabulary.dtype))
+                known &= dim_codes < len(vocabulary)
+                codes = codes * sizes[dim] + dim_codes
+            tables[i, codes[known]] = True
+        return tables
+
+    def masks(self, codes, element_sets, out=None):
+        """
+        Masks of codes in element sets
+
+        Parameters
+        ----------
+        codes           codes of a batch, shape (number of items, ...)
+        element_sets    element ids per item, or per mask of a single item, or a single set for all items
+        out             boolean buffer, shape (max(number of items, number of sets), ...)
+        """
+        tables = self.lookup_tables(element_sets)
+        if out is None:
+            out = np.empty((self._batch_size(codes, tables),) + codes.shape[1:], dtype=bool)
+        for i, table, item_codes in self._iter_batch(codes, tables):
+            np.take(table, item_codes, out=out[i])
+        return out
+
+    def filter_data(self, data, codes, element_sets, fill_value=255, out=None, mask=None):
+        """
+        Data where codes are in element sets and fill_value elsewhere, see masks
+
+        Unlike filter_data, the result has the dtype of data (e.g. uint8 for images, not int64).
+        Items are filtered one by one through a single mask, so with the buffers nothing is allocated.
+
+        Parameters
+        ----------
+        data    batch of data, shape (number of items, *codes.shape[1:]) with optional channels
+        out     buffer of data dtype, shape (max(number of items, number of sets), *data.shape[1:])
+        mask    boolean buffer of an item, shape codes.shape[1:]
+        """
+        tables = self.lookup_tables(element_sets)
+        if out is None:
+            out = np.empty((self._batch_size(codes, tables),) + data.shape[1:], dtype=data.dtype)
+        if mask is None:
+            mask = np.empty(codes.shape[1:], dtype=bool)
+        where = mask[..., None] if data.ndim == codes.ndim + 1 else mask
+        for i, table, item_codes in self._iter_batch(codes, tables):
+            np.take(table, item_codes, out=mask)
+            out[i].fill(fill_value)
+            np.copyto(out[i], data[i if len(data) > 1 else 0], where=where)
+        return out
+
+    @staticmethod
+    def _batch_size(codes, tables):
+        if len(codes) != len(tables) and 1 not in (len(codes), len(tables)):
+            raise Exception("Mismatching numbers of items and element sets.")
+        return max(len(codes), len(tables))
+
+    def _iter_batch(self, codes, tables):
+        """(item, lookup table, codes) of every item of the batch"""
+        for i in range(self._batch_size(codes, tables)):
+            yield i, tables[i if len(tables) > 1 else 0], codes[i if len(codes) > 1 else 0]
+
+    @staticmethod
+    def _split(features):
+        if isinstance(features, np.ndarray) and features.dtype.names:
+            return [features[name] for name in features.dtype.names]
+        if isinstance(features, np.ndarray):
+            return [features]
+        return list(features)
+
+    def _split_key(self, element):
+        if isinstance(element, tuple):
+            return element
+        return tuple(str(element).split(", ")) if len(self._vocabularies) > 1 else (element,)
+
+    @staticmethod
+    def _encode(vocabulary, feature):
+        """Indices of values in the sorted vocabulary, len(vocabulary) for unknown values"""
+        indices = np.searchsorted(vocabulary, feature)
+        indices[indices == len(vocabulary)] = 0
+        return np.where(vocabulary[indices] == feature, indices, len(vocabulary))
+
+
 """
 Element Extractor
 """
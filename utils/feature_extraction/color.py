@@ -34,6 +34,34 @@ COLOR_ELEMENTS_RGB = {
 }
 
 
+def color_element_similarity(elements=COLOR_ELEMENTS, max_distance=0.4):
+    """
+    Similarity of color elements by distance between centers of their HSL ranges
+
+    Hue distance is circular and scaled by a half of the hue circle, saturation and
+    brightness distances by their range, the similarity is 1 - distance / max_distance.
+
+    Returns
+    -------
+    dictionary      {(element id, element id): similarity} of distinct elements closer than max_distance
+    """
+    def center(bounds, period=None):
+        low, high = bounds
+        if period and low > high:
+            high += period
+        return (low + high) / 2 % period if period else (low + high) / 2
+
+    centers = np.array([(center(el["h"], 240), center(el["s"]), center(el["b"])) for el in elements])
+    hue = np.abs(centers[:, None, 0] - centers[None, :, 0])
+    hue = np.minimum(hue, 240 - hue) / 120
+    saturation = np.abs(centers[:, None, 1] - centers[None, :, 1]) / 240
+    brightness = np.abs(centers[:, None, 2] - centers[None, :, 2]) / 240
+    distances = np.sqrt(hue ** 2 + saturation ** 2 + brightness ** 2)
+    return {
+        (elements[i]["id"], elements[j]["id"]): float(1 - distances[i, j] / max_distance)
+        for i, j in zip(*np.nonzero(distances < max_distance)) if i != j}
+
+
 class ColorSetTransformer:
     """
 
@@ -76,8 +104,8 @@ class ColorSetTransformer:
             Transformed data that uses inner ids as elements.
         element_ids : list, tuple, set
             Element ids to filter.
-        single : bool
-            If true (default), then provided X is one object data. Otherwise,
+        batch : bool
+            If false (default), then provided X is one object data. Otherwise,
             X contains multiple objects
 
         Returns
@@ -85,14 +113,10 @@ class ColorSetTransformer:
         mask : ndarray
             Data that contains only elements from element_ids
         """
+        # A batch is filtered by the same elements as a single object
         mask = np.zeros(X.shape, dtype=self._element_dtype)
-        if batch is True:
-            raise NotImplementedError
-        else:
-            for element_id in element_ids:
-                indices = X==element_id
-                mask[indices] = X[indices]
-            return mask
+        np.copyto(mask, X, where=np.isin(X, np.array(tuple(element_ids))), casting="unsafe")
+        return mask
 
     def filter_data(self, X, I, element_ids=None):
         if element_ids and not isinstance(element_ids, (set, list, tuple)):
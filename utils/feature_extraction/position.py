@@ -1,8 +1,81 @@
 import itertools
+import threading
+from collections import OrderedDict
 
 import numpy as np
 
 
+"""
+Position Masks
+"""
+
+
+MASK_CACHE_SIZE = 64
+
+_mask_cache = OrderedDict()
+_mask_cache_lock = threading.Lock()
+
+
+def build_position_mask(size, splits):
+    """
+    Mask of position element ids for the size of data
+
+    Element ids follow row-major order of grid cells starting from 1,
+    items beyond the grid (the remainder of size // splits) have id 0.
+    """
+    size = tuple(size)
+    splits = (splits,) * len(size) if isinstance(splits, int) else tuple(splits)
+    if len(splits) != len(size):
+        raise Exception("Mismatching dimensions.")
+    steps = [dim_size // dim_splits for dim_size, dim_splits in zip(size, splits)]
+    num_elements = int(np.prod(splits))
+    ids = np.zeros(size, dtype=np.int64)
+    inside = np.ones(size, dtype=bool)
+    for i, indices in enumerate(np.ogrid[tuple(slice(0, dim_size) for dim_size in size)]):
+        cells = indices // max(steps[i], 1)
+        ids = ids * splits[i] + cells
+        inside &= (cells < splits[i]) & (steps[i] > 0)
+    return np.where(inside, ids + 1, 0).astype(np.min_scalar_type(num_elements))
+
+
+def position_mask(size, splits):
+    """Read-only mask of build_position_mask shared through a bounded LRU cache"""
+    key = (tuple(size), splits if isinstance(splits, int) else tuple(splits))
+    with _mask_cache_lock:
+        mask = _mask_cache.get(key)
+        if mask is not None:
+            _mask_cache.move_to_end(key)
+            return mask
+    mask = build_position_mask(*key)
+    mask.flags.writeable = False
+    with _mask_cache_lock:
+        _mask_cache[key] = mask
+        while len(_mask_cache) > MASK_CACHE_SIZE:
+            _mask_cache.popitem(last=False)
+    return mask
+
+
+def position_element_similarity(splits, neighbour_weight=0.5):
+    """
+    Similarity of adjacent grid cells, ids of cells as in build_position_mask
+
+    Cells sharing a side have neighbour_weight, cells sharing only a corner neighbour_weight ** 2
+    in 2D (the power is the number of differing coordinates).
+
+    Returns
+    -------
+    dictionary      {(element id, element id): similarity} of distinct adjacent cells, ids are strings
+    """
+    splits = (splits,) if isinstance(splits, int) else tuple(splits)
+    similarity = dict()
+    for cell in itertools.product(*(range(dim_splits) for dim_splits in splits)):
+        for offset in itertools.product((-1, 0, 1), repeat=len(splits)):
+            neighbour = tuple(c + o for c, o in zip(cell, offset))
+            if any(offset) and all(0 <= c < dim_splits for c, dim_splits in zip(neighbour, splits)):
+                key = (str(int(np.ravel_multi_index(cell, splits)) + 1), str(int(np.ravel_multi_index(neighbour, splits)) + 1))
+                similarity[key] = neighbour_weight ** sum(1 for o in offset if o)
+    return similarity
+
 
 """
 Position Transformer
@@ -30,29 +103,16 @@ class PositionSetTransformer:
         return self
 
     def transform(self, X, batch=False, ids=None):
+        """
+        Masks of position element ids
+
+        Masks are shared by all transformers with the same grid and are read-only.
+        """
         if batch is True:
-            masks = list()
             X_ = X if ids is None else X[ids]
-            for item in X_:
-                size = item.shape[:-1] if self._element_ndim > 1 else item.shape
-                # Avoid recalculation elements if a previous fit call had the same size
-                if self._size is None or size != self._size:
-                    self._size = size
-                    self._last_transformed = None
-                    self._compose_low_elements()
-                    masks.append(self._transform())
-                else:
-                    masks.append(self._last_transformed)
-            return masks
+            return [self._transform(self._item_size(item)) for item in X_]
         else:
-            size = X.shape[:-1] if self._element_ndim > 1 else X.shape
-            # Avoid recalculation elements if a previous fit call had the same size
-            if self._size is None or size != self._size:
-                self._size = size
-                self._last_transformed = None
-                self._compose_low_elements()
-                return self._transform()
-            return self._last_transformed
+            return self._transform(self._item_size(X))
 
     def fit_transform(self, X=None, y=None, batch=False, ids=None):
         return self.fit(X, y).transform(X, batch, ids=ids)
@@ -132,15 +192,16 @@ class PositionSetTransformer:
             for element in self:
                 yield element
 
-    def _transform(self):
-        mask = np.zeros(self._size, dtype=np.uint8)
-        for element_id, element_region in self:
-            for low_element in itertools.product(
-                *[range(element_region[i], element_region[self._ndim+i]+1) for i in range(self._ndim)]
-            ):
-                mask[low_element] = element_id
-        self._last_transformed = mask
-        return mask
+    def _item_size(self, X):
+        return X.shape[:-1] if self._element_ndim > 1 else X.shape
+
+    def _transform(self, size):
+        # Avoid recalculation elements if a previous call had the same size
+        if self._size is None or size != self._size:
+            self._size = size
+            self._compose_low_elements()
+            self._last_transformed = position_mask(size, self._splits)
+        return self._last_transformed
 
     def _compose_low_elements(self):
         if isinstance(self._size, int):
@@ -0,0 +1,248 @@
+import glob
+import itertools
+import os
+import pickle
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Iterable, Iterator, List, Tuple, Union
+
+import numpy as np
+
+from himpy.histogram import Histogram
+from himpy.serialization import read_corpus, write_corpus
+from .feature_extraction import ColorSetTransformer, create_histogram, create_position_histogram, downsample
+
+
+"""
+Streaming Ingestion
+
+Stages: read image -> color transform -> position histogram -> sink.
+Images are processed in chunks and only a bounded number of chunks is in flight,
+so memory does not depend on the size of the corpus.
+"""
+
+
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".bmp", ".gif", ".tif", ".tiff")
+
+
+def list_images(directory: str) -> List[str]:
+    """Sorted paths of images in a directory, a doc id of an image is its index in the list"""
+    return sorted(
+        path for path in glob.glob(os.path.join(directory, "*"))
+        if os.path.splitext(path)[1].lower() in IMAGE_EXTENSIONS)
+
+
+def read_image(path: str) -> np.ndarray:
+    """RGB image with uint8 channels"""
+    import matplotlib.image as image_utils
+    image = image_utils.imread(path)
+    if np.issubdtype(image.dtype, np.floating):
+        image = np.rint(image * 255).astype(np.uint8)
+    if image.ndim == 2:
+        image = np.repeat(image[:, :, None], 3, axis=2)
+    return image[:, :, :3]
+
+
+def iter_items(source, start_id: int = 0) -> Iterator[Tuple[int, Union[str, np.ndarray]]]:
+    """
+    (doc id, image or path) pairs of a source
+
+    A source is a directory, an iterable of images or paths, or an iterable of (doc id, image or path) pairs.
+    Images and paths are numbered from start_id, e.g. SegmentWriter.next_id to append to an index.
+    """
+    if isinstance(source, str):
+        source = list_images(source)
+    for doc_id, item in enumerate(source, start_id):
+        if isinstance(item, tuple):
+            yield item
+        else:
+            yield doc_id, item
+
+
+def chunked(items: Iterable, chunk_size: int) -> Iterator[list]:
+    chunk = list()
+    for item in items:
+        chunk.append(item)
+        if len(chunk) == chunk_size:
+            yield chunk
+            chunk = list()
+    if chunk:
+        yield chunk
+
+
+class HistogramExtractor:
+    """
+    (Position, color) histograms of images, color histograms if splits is None
+
+    Instances are picklable, so they can be used by processes.
+
+    Parameters
+    ----------
+    splits              grid of position elements
+    downsample          factor to reduce images by before the color transform, see feature_extraction.downsample
+    downsample_method   "stride" or "area"
+    """
+
+    def __init__(self, splits=None, downsample: int = 1, downsample_method: str = "stride"):
+        self._splits = splits
+        self._downsample = downsample
+        self._downsample_method = downsample_method
+        self._color_transformer = ColorSetTransformer()
+
+    def __call__(self, image: Union[str, np.ndarray]) -> Histogram:
+        if isinstance(image, str):
+            image = read_image(image)
+        image = downsample(image, self._downsample, self._downsample_method)
+        color_image = self._color_transformer.transform(image)
+        if self._splits is None:
+            return create_histogram((color_image,))
+        return create_position_histogram(color_image, self._splits)
+
+    def transform_chunk(self, chunk: List[Tuple[int, Union[str, np.ndarray]]]) -> List[Tuple[int, Histogram]]:
+        return [(doc_id, self(image)) for doc_id, image in chunk]
+
+
+def extract_histograms(
+        source, extractor: Callable = None, chunk_size: int = 64,
+        n_jobs: int = 1, max_in_flight: Union[int, None] = None, start_id: int = 0) -> Iterator[Tuple[int, Histogram]]:
+    """
+    Stream (doc id, histogram) pairs of a source in order
+
+    Parameters
+    ----------
+    source          see iter_items
+    extractor       HistogramExtractor
+    chunk_size      number of images per task
+    n_jobs          number of processes, 1 to extract in this process
+    max_in_flight   maximum number of submitted chunks, 2 * n_jobs by default
+    start_id        doc id of the first image, see iter_items
+    """
+    extractor = extractor or HistogramExtractor()
+    chunks = chunked(iter_items(source, start_id), chunk_size)
+    if n_jobs == 1:
+        for chunk in chunks:
+            yield from extractor.transform_chunk(chunk)
+        return
+    max_in_flight = max_in_flight or 2 * n_jobs
+    with ProcessPoolExecutor(max_workers=n_jobs) as executor:
+        in_flight = deque()
+        for chunk in chunks:
+            # Back-pressure: wait for the oldest chunk before reading more images
+            if len(in_flight) == max_in_flight:
+                yield from in_flight.popleft().result()
+            in_flight.append(executor.submit(extractor.transform_chunk, chunk))
+        while in_flight:
+            yield from in_flight.popleft().result()
+
+
+"""
+Segments
+"""
+
+
+class SegmentWriter:
+    """
+    Write (doc id, histogram) pairs to segment files of at most segment_size histograms
+
+    Segments are pickled by default, columnar segments (himpy.serialization) are smaller and faster to load.
+
+    When the with block raises, histograms of the partial last segment are dropped instead of
+    committed. Appending to an existing index continues its doc ids from next_id.
+
+    Usage:
+        with SegmentWriter("index") as writer:
+            ingest("images", writer.append, start_id=writer.next_id)
+        engine = SearchEngine(read_segments("index"), parser, evaluator, mode="classic")
+    """
+
+    def __init__(self, directory: str, segment_size: int = 10000, columnar: bool = False, compress: bool = False):
+        self._directory = directory
+        self._segment_size = segment_size
+        self._columnar = columnar
+        self._compress = compress
+        self._buffer = list()
+        self._segments = len(list_segments(directory)) if os.path.isdir(directory) else 0
+        self._next_id = None
+        os.makedirs(directory, exist_ok=True)
+
+    @property
+    def next_id(self) -> int:
+        """Doc id following the largest one of the index, existing segments are read on the first call"""
+        if self._next_id is None:
+            doc_ids = itertools.chain((doc_id for doc_id, _ in read_segments(self._directory)),
+                                      (doc_id for doc_id, _ in self._buffer))
+            self._next_id = max(doc_ids, default=-1) + 1
+        return self._next_id
+
+    def append(self, doc_id: int, hist: Histogram):
+        if self._next_id is not None:
+            self._next_id = max(self._next_id, doc_id + 1)
+        self._buffer.append((doc_id, hist))
+        if len(self._buffer) >= self._segment_size:
+            self.flush()
+
+    def flush(self):
+        if not self._buffer:
+            return
+        extension = "hmc" if self._columnar else "pkcl"
+        path = os.path.join(self._directory, "segment_{:06d}.{}".format(self._segments, extension))
+        # Write to a temporary file, so readers never see a partial segment
+        if self._columnar:
+            write_corpus(path + ".tmp", self._buffer, compress=self._compress)
+        else:
+            with open(path + ".tmp", "wb") as f:
+                pickle.dump(self._buffer, f)
+        os.replace(path + ".tmp", path)
+        self._segments += 1
+        self._buffer = list()
+
+    def close(self):
+        self.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if exc_type is not None:
+            # Do not commit a partial segment of a failed ingestion
+            self._buffer = list()
+        self.close()
+
+
+def list_segments(directory: str) -> List[str]:
+    return sorted(
+        path for extension in ("pkcl", "hmc")
+        for path in glob.glob(os.path.join(directory, "segment_*." + extension)))
+
+
+def read_segments(directory: str) -> Iterator[Tuple[int, Histogram]]:
+    """Stream (doc id, histogram) pairs of segments, one segment in memory at a time"""
+    for path in list_segments(directory):
+        if path.endswith(".hmc"):
+            yield from read_corpus(path)
+            continue
+        with open(path, "rb") as f:
+            yield from pickle.load(f)
+
+
+def ingest(
+        source, sink: Callable[[int, Histogram], None], splits=None, chunk_size: int = 64,
+        n_jobs: int = 1, max_in_flight: Union[int, None] = None,
+        downsample: int = 1, downsample_method: str = "stride", start_id: int = 0) -> int:
+    """
+    Extract histograms of a source and pass them to a sink, e.g. SegmentWriter.append
+
+    Histograms of downsampled images are cheaper, use benchmarks.downsampling to pick a factor.
+    Images are numbered from start_id, use SegmentWriter.next_id to append to an existing index.
+
+    Returns
+    -------
+    number of ingested images
+    """
+    count = 0
+    for doc_id, hist in extract_histograms(
+            source, HistogramExtractor(splits, downsample, downsample_method),
+            chunk_size=chunk_size, n_jobs=n_jobs, max_in_flight=max_in_flight, start_id=start_id):
+        sink(doc_id, hist)
+        count += 1
+    return count
@@ -4,7 +4,7 @@ import matplotlib.pyplot as plt
 import matplotlib.image as image_utils
 from matplotlib.patches import Rectangle
 
-from ..feature_extraction.base import extract_element_set, filter_data
+from ..feature_extraction.base import ElementFilter, extract_element_set
 
 
 """
@@ -48,6 +48,14 @@ Histogram Operations
 """
 
 
+def filter_element_sets(I, merged_image, HEs, fill_value=255):
+    """Images of I that keep only elements of every histogram set, filtered at once"""
+    element_filter = ElementFilter()
+    codes = element_filter.fit_transform(merged_image)
+    return element_filter.filter_data(
+        I[None], codes[None], [HE.elements() for HE in HEs], fill_value=fill_value)
+
+
 # TODO: replace with show_operation_result
 def show_operation_result_(I, merged_image, HE1, HE2, HE3, transformers, titles=("E1", "E2", "Result")):
     import matplotlib.pyplot as plt
@@ -56,9 +64,7 @@ def show_operation_result_(I, merged_image, HE1, HE2, HE3, transformers, titles=
     E2_set = extract_element_set(HE2, 2)
     E3_set = extract_element_set(HE3, 2)
 
-    E1_image = filter_data(I, merged_image, HE1.elements())
-    E2_image = filter_data(I, merged_image, HE2.elements())
-    E3_image = filter_data(I, merged_image, HE3.elements())
+    E1_image, E2_image, E3_image = filter_element_sets(I, merged_image, (HE1, HE2, HE3))
 
     fig, axes = plt.subplots(1, 3, figsize=(14, 20))
     axes[0].set_title(titles[0])
@@ -87,9 +93,7 @@ def show_operation_result(I, merged_image, obj_index, HE1, HE2, HE3, transformer
     E2_set = extract_element_set(HE2, 2)
     E3_set = extract_element_set(HE3, 2)
 
-    E1_image = filter_data(I, merged_image, HE1.elements())
-    E2_image = filter_data(I, merged_image, HE2.elements())
-    E3_image = filter_data(I, merged_image, HE3.elements())
+    E1_image, E2_image, E3_image = filter_element_sets(I, merged_image, (HE1, HE2, HE3))
 
     fig, axes = plt.subplots(1, 3, figsize=(14, 20))
     axes[0].set_title(titles[0])
@@ -0,0 +1,203 @@
+"""
+Query Profiler
+
+EXPLAIN of expression queries against a saved index: the postfix tree, low-level elements
+of every leaf with their posting list sizes, candidates and time of every node, and
+the stages of the search engine.
+
+High-level elements of the queries are read from a JSON file, {name: element ids} or a list
+of such objects, one per dimension of multidimensional elements:
+
+    [{"top": ["1", "2", "3"], "any": "1+2+3+4"}, {"green": ["e1", "e2"], "red": "e31+e32"}]
+
+Usage: python -m utils.profiler --index hists_pos.pkcl --rules rules.json "(top,green)*(any,red)"
+       python -m utils.profiler --index segments --rules rules.json --queries queries.txt
+       python -m utils.profiler --index segments --rules rules.json --statistics
+
+See benchmarks.explain for the synthetic corpora of the benchmarks.
+"""
+import argparse
+import json
+import os
+import pickle
+from typing import Dict, List, Set, Tuple, Union
+
+from himpy.executor import Parser, Evaluator, ExplainNode
+from himpy.histogram import Histogram, operations, expressionOperations
+from himpy.serialization import read_corpus
+from himpy.utils import E
+from .ingest import read_segments
+from .search_engine import SearchEngine
+from .statistics import IndexStatistics
+from .tracing import QueryStats
+
+
+def load_index(path: str) -> List[Tuple[int, Histogram]]:
+    """(doc id, histogram) pairs of a segment directory, a columnar corpus or a pickle file"""
+    if os.path.isdir(path):
+        return list(read_segments(path))
+    if path.endswith(".hmc"):
+        return read_corpus(path)
+    with open(path, "rb") as f:
+        return pickle.load(f)
+
+
+def load_rules(path: str, parser: Union[Parser, None] = None):
+    """
+    High-level elements of a JSON file, element ids are lists or strings joined by "+"
+
+    Returns
+    -------
+    elements for Evaluator and rules for the "dll" mode
+    """
+    parser = parser or Parser()
+    with open(path, encoding="utf-8") as f:
+        data = json.load(f)
+
+    def element_set(element_ids) -> Dict[str, Set[str]]:
+        return {name: parser.parse_set(ids) if isinstance(ids, str) else set(ids) for name, ids in element_ids.items()}
+
+    if isinstance(data, dict):
+        rules = element_set(data)
+        return rules, rules
+    if isinstance(data, list) and all(isinstance(dimension, dict) for dimension in data):
+        rules = [element_set(dimension) for dimension in data]
+        return dict(enumerate(rules)), rules
+    raise ValueError("Rules must be an object of high-level elements or a list of them: {}".format(path))
+
+
+def read_queries(path: str) -> List[str]:
+    """Queries of a file, one per line, blank lines and lines starting with # are skipped"""
+    with open(path, encoding="utf-8") as f:
+        return [line.strip() for line in f if line.strip() and not line.lstrip().startswith("#")]
+
+
+class QueryProfile:
+    """EXPLAIN of a query: its postfix expression, evaluated tree and engine stats"""
+
+    def __init__(self, query: str, expression: List[str], tree: ExplainNode, stats: QueryStats):
+        self.query = query
+        self.expression = expression
+        self.tree = tree
+        self.stats = stats
+
+    def format(self, max_elements: int = 10) -> str:
+        lines = ["EXPLAIN " + self.query, "postfix: " + " ".join(self.expression)]
+        lines.extend(_format_node(self.tree, max_elements))
+        stages = " ".join("{}={:.3f}ms".format(name, elapsed) for name, elapsed in self.stats.stages.items())
+        lines.append("engine {}: total={:.3f}ms {}".format(self.stats.mode, self.stats.total_ms, stages))
+        lines.append("candidates={} postings={} scored={} results={}".format(
+            self.stats.candidates, self.stats.postings, self.stats.scored, self.stats.results))
+        return "\n".join(lines)
+
+    def to_dict(self):
+        return {"query": self.query, "expression": self.expression,
+                "tree": self.tree.to_dict(), "stats": self.stats.to_dict()}
+
+
+def format_statistics(statistics: IndexStatistics, max_elements: int = 10) -> str:
+    """Posting list lengths, high-level elements and the most frequent low-level elements"""
+    lines = ["documents={} elements={}".format(statistics.num_documents, len(statistics))]
+    lines.append("posting lengths: " + " ".join(
+        "{}={:g}".format(name, value) for name, value in statistics.posting_lengths().items()))
+    header = "{:<40} {:>8} {:>12} {:>10} {:>10}".format("element", "df", "total mass", "mean", "max")
+    row = "{:<40} {:>8} {:>12.4f} {:>10.4f} {:>10.4f}"
+    for title, elements in (("high-level elements", statistics.high_level_elements()),
+                            ("low-level elements", statistics.elements())):
+        ranked = sorted(elements.items(), key=lambda item: -item[1]["df"])
+        lines.extend(["", title, header])
+        for name, element in ranked[:max_elements if title.startswith("low") else None]:
+            lines.append(row.format(name, element["df"], element["total_mass"], element["mean_mass"], element["max_value"]))
+    return "\n".join(lines)
+
+
+def _format_node(node: ExplainNode, max_elements: int, depth: int = 0) -> List[str]:
+    indent = "  " * depth
+    line = "{:<40} candidates={:<8} time={:.3f}ms".format(indent + node.token, len(node.doc_ids), node.time_ms)
+    if not node.is_leaf:
+        lines = [line + " self={:.3f}ms".format(node.self_time_ms)]
+        for child in node.children:
+            lines.extend(_format_node(child, max_elements, depth + 1))
+        return lines
+    sizes = sorted(((size, index) for index, size in node.postings.items() if size is not None), reverse=True)
+    lines = [line + " elements={}/{} postings={}".format(
+        len(sizes), len(node.postings), sum(size for size, _ in sizes))]
+    for size, index in sizes[:max_elements]:
+        lines.append("{}    {:<36} {}".format(indent, index, size))
+    if len(sizes) > max_elements:
+        lines.append("{}    ... {} more".format(indent, len(sizes) - max_elements))
+    return lines
+
+
+class QueryProfiler:
+    """
+    Explain expression queries over an index of histograms
+
+    Parameters
+    ----------
+    mode        search engine mode whose stages are reported
+    kwargs      passed to SearchEngine, e.g. rules for "dll" or expression_cache
+    """
+
+    def __init__(
+            self, hists: List[Tuple[int, Histogram]], parser: Parser, evaluator: Evaluator,
+            mode: str = "classic", **kwargs):
+        self._parser = parser
+        self._evaluator = evaluator
+        self._storage = dict()
+        self.statistics = IndexStatistics(evaluator.high_level_leaves())
+        for hist_id, hist in hists:
+            for index in hist.elements():
+                self._storage.setdefault(index, set()).add(hist_id)
+            self.statistics.add(hist_id, hist)
+        self._search_engine = SearchEngine(hists, parser, evaluator, mode=mode, **kwargs)
+
+    def explain(self, query: Union[str, E], top_n: Union[int, None] = 10) -> QueryProfile:
+        query = query if isinstance(query, E) else E(query)
+        expression = ["(" + ", ".join(e) + ")" if isinstance(e, tuple) else e for e in self._parser.parse_string(query.value)]
+        tree = self._evaluator.explain_expression(expression, self._storage)
+        _, stats = self._search_engine.retrieve(query, top_n=top_n, return_stats=True)
+        return QueryProfile(query.value, expression, tree, stats)
+
+
+def create_arg_parser(description: str, index_required: bool = True) -> argparse.ArgumentParser:
+    """Arguments of the profiler CLI, the index and the rules are optional for synthetic corpora"""
+    arg_parser = argparse.ArgumentParser(description=description)
+    arg_parser.add_argument("queries", nargs="*", help="expression queries")
+    arg_parser.add_argument("--queries", dest="queries_file", help="file of queries, one per line")
+    arg_parser.add_argument("--index", required=index_required, help="segment directory, .hmc or pickle file")
+    arg_parser.add_argument("--rules", required=index_required, help="JSON file of high-level elements")
+    arg_parser.add_argument("--mode", choices=["classic", "parallel", "dll"], default="classic")
+    arg_parser.add_argument("--top-n", type=int, default=10)
+    arg_parser.add_argument("--elements", type=int, default=10, help="number of listed elements per leaf")
+    arg_parser.add_argument("--statistics", action="store_true", help="print statistics of the index")
+    arg_parser.add_argument("--json", action="store_true", help="print profiles as JSON lines")
+    return arg_parser
+
+
+def run(args, hists: List[Tuple[int, Histogram]], parser: Parser, elements, rules):
+    """Print the statistics and the profiles of the queries of parsed arguments"""
+    queries = list(args.queries) + (read_queries(args.queries_file) if args.queries_file else [])
+    if not queries and not args.statistics:
+        raise ValueError("No queries given.")
+    evaluator = Evaluator(operations, expressionOperations, high_level_elements=elements)
+    profiler = QueryProfiler(hists, parser, evaluator, mode=args.mode, rules=rules)
+    if args.statistics:
+        print(format_statistics(profiler.statistics, args.elements) + "\n")
+    for query in queries:
+        profile = profiler.explain(query, top_n=args.top_n)
+        print(json.dumps(profile.to_dict()) if args.json else profile.format(args.elements) + "\n")
+
+
+def main(args=None):
+    arg_parser = create_arg_parser(__doc__.strip().splitlines()[2])
+    args = arg_parser.parse_args(args)
+    if not args.queries and not args.queries_file and not args.statistics:
+        arg_parser.error("no queries given")
+    parser = Parser()
+    elements, rules = load_rules(args.rules, parser)
+    run(args, load_index(args.index), parser, elements, rules)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,11 +1,19 @@
+import heapq
+import itertools
+import time
 from abc import ABC, abstractmethod
-from typing import Union, List, Tuple
+from typing import Union, List, Tuple, Dict, Set, Callable
 
+import numpy as np
 from joblib import Parallel, delayed
 
-from himpy.executor import Parser, Evaluator
+from himpy.executor import Parser, Evaluator, ExpressionCache, QueryPlanner
 from himpy.histogram import Histogram
 from himpy.utils import E
+from .similarity import ElementSimilarity, QuadraticFormSimilarity, Similarity, get_similarity
+from .statistics import IndexStatistics
+from .tracing import NULL_STATS, QueryStats, SlowQueryLog
+from .vectorization import HistogramVectorizer, kmeans
 import ctypes
 import platform
 
@@ -16,6 +24,12 @@ elif platform.uname()[0] == "Linux":
 else:
     lib_name = "./library.dylib"
 
+try:
+    # compiled extension of library.cpp, see invertedindex_module.cpp
+    import _invertedindex
+except ImportError:
+    _invertedindex = None
+
 
 class BaseSearchEngine(ABC):
     @abstractmethod
@@ -23,97 +37,343 @@ class BaseSearchEngine(ABC):
             self, query: Union[E, Histogram],
             top_n: Union[int, None],
             last_n: Union[int, None],
-            threshold: float):
+            threshold: float,
+            stats: Union[QueryStats, None]):
         pass
 
 
 class DefaultSearchEngine(BaseSearchEngine):
     """Simple search engine based on iterating over entire datasets."""
 
-    def __init__(self, hists: List[Tuple[int, Histogram]], parser: Parser, evaluator: Evaluator):
+    def __init__(
+            self, hists: List[Tuple[int, Histogram]], parser: Parser, evaluator: Evaluator,
+            similarity: Union[str, Similarity] = "intersection"):
         self._hists = hists
         self._parser = parser
         self._evaluator = evaluator
+        self._similarity = get_similarity(similarity)
 
     def retrieve(
             self, query: Union[E, Histogram],
             top_n: Union[int, None] = 10,
             last_n: Union[int, None] = None,
-            threshold: float = 0.001):
+            threshold: float = 0.001,
+            stats: Union[QueryStats, None] = None):
+        stats = stats or NULL_STATS
         img_rank = list()
         if hasattr(query, "value") and isinstance(query.value, str):
             """Searching by expression"""
-            expression = ["(" + ", ".join(e) + ")" if isinstance(e, tuple) else e for e in self._parser.parse_string(query.value)]
-            scores = [(doc_id, self._evaluator.eval(expression, hist).sum()) for doc_id, hist in self._hists]
-            img_rank = sorted(
-                [(doc_id, score) for doc_id, score in scores if score > threshold],
-                key=lambda x: -x[1]
-            )
+            with stats.stage("parse"):
+                expression = ["(" + ", ".join(e) + ")" if isinstance(e, tuple) else e for e in self._parser.parse_string(query.value)]
+            with stats.stage("scoring"):
+                scores = [(doc_id, self._evaluator.eval(expression, hist).sum()) for doc_id, hist in self._hists]
+            stats.add(candidates=len(scores), scored=len(scores))
+            with stats.stage("sorting"):
+                img_rank = sorted(
+                    [(doc_id, score) for doc_id, score in scores if score > threshold],
+                    key=lambda x: -x[1]
+                )
         elif isinstance(query, Histogram):
             """Searching by data histogram"""
-            img_rank = sorted(
-                [(doc_id, (query * hist).sum()) for doc_id, hist in self._hists],
-                key=lambda x: -x[1]
-            )
+            with stats.stage("scoring"):
+                scores = [(doc_id, self._similarity(query, hist)) for doc_id, hist in self._hists]
+            stats.add(candidates=len(scores), scored=len(scores))
+            with stats.stage("sorting"):
+                img_rank = sorted(scores, key=lambda x: -x[1])
         if isinstance(last_n, int):
             return img_rank[:top_n], img_rank[-last_n:]
 
         return img_rank[:top_n]
 
 
-class InvertedIndex(BaseSearchEngine):
-    """Search engine based on inverted indexes of histogram elements."""
+class MaterializedViews:
+    """
+    Masses of high-level elements per document computed at ingest time
+
+    Parameters
+    ----------
+    leaves      {leaf: set of low-level element ids}, e.g. Evaluator.high_level_leaves()
+    """
+
+    union_operations = ("+", "|")
+
+    def __init__(self, leaves: Dict[str, Set[str]]):
+        self._leaves = leaves
+        self._element_leaves = Evaluator.element_leaves(leaves)
+        self._masses = dict()
+
+    def add(self, doc_id: int, hist: Histogram):
+        masses = dict()
+        for index, h_element in hist:
+            for leaf in self._element_leaves.get(index, ()):
+                masses[leaf] = masses.get(leaf, 0.0) + h_element.value
+        self._masses[doc_id] = masses
+
+    def union_leaves(self, expression: List[str]) -> Union[List[str], None]:
+        """
+        Leaves of a postfix expression that is a union of materialized leaves
+
+        Returns None if the expression has other operations, unknown leaves or leaves
+        sharing low-level elements, as then its score is not a sum of leaf masses.
+        """
+        leaves = [token for token in expression if token not in self.union_operations]
+        if not leaves or any(leaf not in self._leaves for leaf in leaves):
+            return None
+        if len(leaves) != len(expression) // 2 + 1:
+            return None
+        indexes_set = set()
+        for leaf in leaves:
+            if not indexes_set.isdisjoint(self._leaves[leaf]):
+                return None
+            indexes_set.update(self._leaves[leaf])
+        return leaves
+
+    def score(self, doc_id: int, leaves: List[str]) -> float:
+        masses = self._masses[doc_id]
+        return sum(masses.get(leaf, 0.0) for leaf in leaves)
+
+    def __contains__(self, leaf):
+        return leaf in self._leaves
 
-    def __init__(self, hists: List[Tuple[int, Histogram]], parser: Parser, evaluator: Evaluator):
+
+class InvertedIndex(BaseSearchEngine):
+    """
+    Search engine based on inverted indexes of histogram elements.
+
+    Query histograms can be truncated to their largest elements for candidate generation,
+    candidates are scored with the full query unless truncated_scoring is set.
+
+    Parameters
+    ----------
+    query_elements      number of largest query elements whose posting lists are read
+    query_mass          fraction of the query mass covered by the read posting lists, e.g. 0.9
+    truncated_scoring   score candidates with the truncated query
+    similarity          name of a measure of utils.similarity or a Similarity of query by histogram
+    statistics          keep statistics of high-level elements in the catalog, set with planning,
+                        low-level elements are always kept
+    """
+
+    def __init__(
+            self, hists: List[Tuple[int, Histogram]], parser: Parser, evaluator: Evaluator,
+            expression_cache: Union[ExpressionCache, None] = None, materialize: bool = False,
+            pruning: bool = False, impact_ordered: bool = False, planning: bool = False,
+            query_elements: Union[int, None] = None, query_mass: Union[float, None] = None,
+            truncated_scoring: bool = False, similarity: Union[str, Similarity] = "intersection",
+            statistics: bool = False):
+        if planning and expression_cache is not None:
+            raise ValueError("QueryPlanner does not use the expression cache, set either planning or expression_cache")
         self._parser = parser
         self._evaluator = evaluator
+        self._expression_cache = expression_cache
+        self._views = MaterializedViews(evaluator.high_level_leaves()) if materialize else None
+        self._pruning = pruning
+        self._impacts = dict() if impact_ordered else None
+        self._query_elements = query_elements
+        self._query_mass = query_mass
+        self._truncated_scoring = truncated_scoring
+        self._similarity = get_similarity(similarity)
         self._storage = dict()
         self._hists = dict()
+        self._statistics = IndexStatistics(evaluator.high_level_leaves() if statistics or planning else None)
         for hist_id, hist in hists:
             self._hists[hist_id] = hist
             for index in hist.elements():
                 self._storage.setdefault(index, set()).add(hist_id)
+            self._statistics.add(hist_id, hist)
+            if self._views is not None:
+                self._views.add(hist_id, hist)
+            if self._impacts is not None:
+                for index, h_element in hist:
+                    self._impacts.setdefault(index, list()).append((h_element.value, hist_id))
+        self._sorted_storage = {index: sorted(doc_ids) for index, doc_ids in self._storage.items()} \
+            if pruning else None
+        if self._impacts is not None:
+            for impact_list in self._impacts.values():
+                impact_list.sort(reverse=True)
+        self._planner = QueryPlanner(evaluator, self._statistics) if planning else None
+
+    @property
+    def statistics(self) -> IndexStatistics:
+        return self._statistics
 
     def retrieve(
             self, query: Union[E, Histogram],
             top_n: Union[int, None] = 10,
             last_n: Union[int, None] = None,
-            threshold: float = 0.001):
+            threshold: float = 0.001,
+            stats: Union[QueryStats, None] = None):
+        stats = stats or NULL_STATS
         scores = []
         doc_ids_set = set()
         if hasattr(query, "value") and isinstance(query.value, str):
             """Searching by expression"""
             # expression = self._parser.parse_string(query.value)
-            expression = ["(" + ", ".join(e) + ")" if isinstance(e, tuple) else e for e in self._parser.parse_string(query.value)]
-            doc_ids_set = self._evaluator.eval_expression(expression, self._storage)
-            for doc_id in doc_ids_set:
-                scores.append((doc_id, self._evaluator.eval(expression, self._hists[doc_id]).sum()))
+            with stats.stage("parse"):
+                expression = ["(" + ", ".join(e) + ")" if isinstance(e, tuple) else e for e in self._parser.parse_string(query.value)]
+            if self._pruning and isinstance(top_n, int) and last_n is None:
+                indexes_set = self._evaluator.union_elements(expression)
+                if indexes_set is not None:
+                    with stats.stage("scoring"):
+                        return self._retrieve_top_n(indexes_set, top_n, threshold, stats)
+            with stats.stage("candidates"):
+                doc_ids_set = self._eval_expression(expression, stats.count_postings(self._storage))
+            stats.add(candidates=len(doc_ids_set), scored=len(doc_ids_set))
+            with stats.stage("scoring"):
+                leaves = self._views.union_leaves(expression) if self._views is not None else None
+                if leaves is not None:
+                    for doc_id in doc_ids_set:
+                        scores.append((doc_id, self._views.score(doc_id, leaves)))
+                else:
+                    for doc_id in doc_ids_set:
+                        scores.append((doc_id, self._evaluator.eval(expression, self._hists[doc_id]).sum()))
 
         elif isinstance(query, Histogram):
             """Searching by data histogram"""
-            indexes_set = query.elements()
-            for index in indexes_set:
-                if index in self._storage:
-                    doc_ids_set.update(self._storage[index])
-            for doc_id in doc_ids_set:
-                scores.append((doc_id, (query * self._hists[doc_id]).sum()))
-
-        docs_ranked = sorted(
-            [(doc_id, score) for doc_id, score in scores if score > threshold],
-            key=lambda x: -x[1]
-        )
+            with stats.stage("parse"):
+                candidate_query, query = self._truncate_query(query)
+            if self._impacts is not None and self._similarity.min_bound and isinstance(top_n, int) and last_n is None:
+                with stats.stage("scoring"):
+                    return self._retrieve_top_n_by_histogram(query, top_n, threshold, stats, candidate_query)
+            with stats.stage("candidates"):
+                storage = stats.count_postings(self._storage)
+                indexes_set = candidate_query.elements()
+                for index in indexes_set:
+                    if index in storage:
+                        doc_ids_set.update(storage[index])
+            stats.add(candidates=len(doc_ids_set), scored=len(doc_ids_set))
+            with stats.stage("scoring"):
+                for doc_id in doc_ids_set:
+                    scores.append((doc_id, self._similarity(query, self._hists[doc_id])))
+
+        with stats.stage("sorting"):
+            docs_ranked = sorted(
+                [(doc_id, score) for doc_id, score in scores if score > threshold],
+                key=lambda x: -x[1]
+            )
 
         if isinstance(last_n, int):
             return docs_ranked[:top_n], docs_ranked[-last_n:]
         return docs_ranked[:top_n]
 
+    def _eval_expression(self, expression, storage):
+        if self._planner is not None:
+            return self._planner.eval_expression(expression, storage)
+        return self._evaluator.eval_expression(expression, storage, cache=self._expression_cache)
+
+    def _truncate_query(self, query: Histogram) -> Tuple[Histogram, Histogram]:
+        """Query of candidate generation and query of scoring"""
+        if self._query_elements is None and self._query_mass is None:
+            return query, query
+        truncated = query.truncate(self._query_elements, self._query_mass)
+        return truncated, truncated if self._truncated_scoring else query
+
+    def _retrieve_top_n(self, indexes_set, top_n, threshold, stats=NULL_STATS):
+        """
+        MaxScore retrieval of a union of elements
+
+        Posting lists are ordered by their maximum values. The ones at the front whose
+        summed maximums cannot beat the current top are not iterated, only looked up
+        for documents found through the rest of the posting lists.
+        """
+        if top_n <= 0:
+            return []
+        max_value = self._statistics.max_value
+        indexes = sorted((index for index in indexes_set if index in self._storage), key=max_value)
+        posting_lists = [self._sorted_storage[index] for index in indexes]
+        upper_bounds = list(itertools.accumulate(max_value(index) for index in indexes))
+        positions = [0] * len(indexes)
+        top = []
+
+        def cannot_enter(score):
+            return score <= (top[0][0] if len(top) >= top_n else threshold)
+
+        first_essential = 0
+        while first_essential < len(indexes) and cannot_enter(upper_bounds[first_essential]):
+            first_essential += 1
+        while first_essential < len(indexes):
+            doc_id = min((posting_lists[i][positions[i]] for i in range(first_essential, len(indexes))
+                          if positions[i] < len(posting_lists[i])), default=None)
+            if doc_id is None:
+                break
+            hist = self._hists[doc_id]
+            score = 0.0
+            for i in range(first_essential, len(indexes)):
+                if positions[i] < len(posting_lists[i]) and posting_lists[i][positions[i]] == doc_id:
+                    score += hist[indexes[i]].value
+                    positions[i] += 1
+            for i in reversed(range(first_essential)):
+                if cannot_enter(score + upper_bounds[i]):
+                    break
+                if indexes[i] in hist:
+                    score += hist[indexes[i]].value
+            else:
+                if not cannot_enter(score):
+                    heapq.heappush(top, (score, doc_id))
+                    if len(top) > top_n:
+                        heapq.heappop(top)
+                    while first_essential < len(indexes) and cannot_enter(upper_bounds[first_essential]):
+                        first_essential += 1
+            stats.add(candidates=1, scored=1)
+        stats.add(postings=sum(positions))
+        return [(doc_id, score) for score, doc_id in sorted(top, reverse=True)]
+
+    def _retrieve_top_n_by_histogram(self, query, top_n, threshold, stats=NULL_STATS, candidate_query=None):
+        """
+        Threshold algorithm over impact-ordered posting lists
+
+        The posting lists of the query elements are read in parallel in descending
+        order of values. Documents are scored as soon as they are seen, and reading
+        stops when no unseen document can score above the current top. Only posting
+        lists of candidate_query are read if given, the stop is then approximate.
+        """
+        if top_n <= 0:
+            return []
+        candidate_query = query if candidate_query is None else candidate_query
+        impact_lists = [(h_element.value, self._impacts[index]) for index, h_element in candidate_query
+                        if index in self._impacts]
+        seen = set()
+        top = []
+
+        def cannot_enter(score):
+            return score <= (top[0][0] if len(top) >= top_n else threshold)
+
+        for depth in itertools.count():
+            upper_bound = 0.0
+            is_exhausted = True
+            for query_value, impact_list in impact_lists:
+                if depth >= len(impact_list):
+                    continue
+                is_exhausted = False
+                stats.add(postings=1)
+                value, doc_id = impact_list[depth]
+                upper_bound += min(query_value, value)
+                if doc_id not in seen:
+                    seen.add(doc_id)
+                    score = self._similarity(query, self._hists[doc_id])
+                    if not cannot_enter(score):
+                        heapq.heappush(top, (score, doc_id))
+                        if len(top) > top_n:
+                            heapq.heappop(top)
+            if is_exhausted or cannot_enter(upper_bound):
+                break
+        stats.add(candidates=len(seen), scored=len(seen))
+        return [(doc_id, score) for score, doc_id in sorted(top, reverse=True)]
+
 
 class InvertedIndexParallel(BaseSearchEngine):
     """Search engine based on inverted indexes of histogram elements in multiple process."""
 
-    def __init__(self, hists: List[Tuple[int, Histogram]], parser: Parser, evaluator: Evaluator):
+    def __init__(
+            self, hists: List[Tuple[int, Histogram]], parser: Parser, evaluator: Evaluator,
+            expression_cache: Union[ExpressionCache, None] = None, planning: bool = False,
+            similarity: Union[str, Similarity] = "intersection"):
+        if planning and expression_cache is not None:
+            raise ValueError("QueryPlanner does not use the expression cache, set either planning or expression_cache")
         self._parser = parser
         self._evaluator = evaluator
+        self._expression_cache = expression_cache
+        self._similarity = get_similarity(similarity)
+        self._planner = QueryPlanner(evaluator) if planning else None
         self._storage = dict()
         self._hists = dict()
         for hist_id, hist in hists:
@@ -121,51 +381,302 @@ class InvertedIndexParallel(BaseSearchEngine):
             for index in hist.elements():
                 self._storage.setdefault(index, set()).add(hist_id)
 
+    def _eval_expression(self, expression, storage):
+        if self._planner is not None:
+            return self._planner.eval_expression(expression, storage)
+        return self._evaluator.eval_expression(expression, storage, cache=self._expression_cache)
+
     def _eval_parallel(self, expression, doc_id):
         return doc_id, self._evaluator.eval(expression, self._hists[doc_id]).sum()
 
     def _eval_parallel_hist(self, query, doc_id):
-        return doc_id, (query * self._hists[doc_id]).sum()
+        return doc_id, self._similarity(query, self._hists[doc_id])
 
     def retrieve(
             self, query: Union[E, Histogram],
             top_n: Union[int, None] = 10,
             last_n: Union[int, None] = None,
-            threshold: float = 0.001):
+            threshold: float = 0.001,
+            stats: Union[QueryStats, None] = None):
+        stats = stats or NULL_STATS
         scores = []
         doc_ids_set = set()
         if hasattr(query, "value") and isinstance(query.value, str):
             """Searching by expression"""
-            expression = ["(" + ", ".join(e) + ")" if isinstance(e, tuple) else e for e in self._parser.parse_string(query.value)]
-            doc_ids_set = self._evaluator.eval_expression(expression, self._storage)
-            scores = Parallel(n_jobs=-1, require='sharedmem')(delayed(self._eval_parallel)(expression, doc_id) for doc_id in doc_ids_set)
+            with stats.stage("parse"):
+                expression = ["(" + ", ".join(e) + ")" if isinstance(e, tuple) else e for e in self._parser.parse_string(query.value)]
+            with stats.stage("candidates"):
+                doc_ids_set = self._eval_expression(expression, stats.count_postings(self._storage))
+            with stats.stage("scoring"):
+                scores = Parallel(n_jobs=-1, require='sharedmem')(delayed(self._eval_parallel)(expression, doc_id) for doc_id in doc_ids_set)
 
         elif isinstance(query, Histogram):
             """Searching by data histogram"""
-            indexes_set = query.elements()
-            for index in indexes_set:
-                if index in self._storage:
-                    doc_ids_set.update(self._storage[index])
-            scores = Parallel(n_jobs=-1, require='sharedmem')(delayed(self._eval_parallel_hist)(query, doc_id) for doc_id in doc_ids_set)
+            with stats.stage("candidates"):
+                storage = stats.count_postings(self._storage)
+                indexes_set = query.elements()
+                for index in indexes_set:
+                    if index in storage:
+                        doc_ids_set.update(storage[index])
+            with stats.stage("scoring"):
+                scores = Parallel(n_jobs=-1, require='sharedmem')(delayed(self._eval_parallel_hist)(query, doc_id) for doc_id in doc_ids_set)
+        stats.add(candidates=len(doc_ids_set), scored=len(doc_ids_set))
+
+        with stats.stage("sorting"):
+            docs_ranked = sorted(
+                [(doc_id, score) for doc_id, score in scores if score > threshold],
+                key=lambda x: -x[1]
+            )
+
+        if isinstance(last_n, int):
+            return docs_ranked[:top_n], docs_ranked[-last_n:]
+        return docs_ranked[:top_n]
+
+
+class HistogramSearchEngine(BaseSearchEngine):
+    """
+    Base class of search engines for query by histogram
+
+    Expression queries are answered by an InvertedIndex of the same histograms, subclasses
+    rank documents by a query histogram in _rank_by_histogram.
+    """
+
+    def __init__(self, hists: List[Tuple[int, Histogram]], parser: Parser, evaluator: Evaluator):
+        self._expression_index = InvertedIndex(hists, parser, evaluator)
+        self._doc_ids = np.array([hist_id for hist_id, _ in hists])
+
+    @property
+    def statistics(self) -> IndexStatistics:
+        return self._expression_index.statistics
+
+    @abstractmethod
+    def _rank_by_histogram(self, query: Histogram, threshold: float, stats: QueryStats) -> List[Tuple[int, float]]:
+        """(doc id, score) pairs with scores above the threshold in descending order of scores"""
+        pass
+
+    @staticmethod
+    def _rank(scores: List[Tuple[int, float]], threshold: float, stats: QueryStats) -> List[Tuple[int, float]]:
+        with stats.stage("sorting"):
+            return sorted(
+                [(doc_id, score) for doc_id, score in scores if score > threshold],
+                key=lambda x: -x[1]
+            )
+
+    def retrieve(
+            self, query: Union[E, Histogram],
+            top_n: Union[int, None] = 10,
+            last_n: Union[int, None] = None,
+            threshold: float = 0.001,
+            stats: Union[QueryStats, None] = None):
+        if hasattr(query, "value") and isinstance(query.value, str):
+            """Searching by expression"""
+            return self._expression_index.retrieve(query, top_n, last_n, threshold, stats)
 
-        docs_ranked = sorted(
-            [(doc_id, score) for doc_id, score in scores if score > threshold],
-            key=lambda x: -x[1]
-        )
+        stats = stats or NULL_STATS
+        docs_ranked = []
+        if isinstance(query, Histogram):
+            """Searching by data histogram"""
+            docs_ranked = self._rank_by_histogram(query, threshold, stats)
 
         if isinstance(last_n, int):
             return docs_ranked[:top_n], docs_ranked[-last_n:]
         return docs_ranked[:top_n]
 
 
+class ApproximateIndex(HistogramSearchEngine):
+    """
+    Search engine with approximate nearest neighbour search for query by histogram.
+
+    Histograms are embedded as Hellinger vectors (square roots of element values) and
+    grouped by k-means into an inverted file (IVF). A query probes the nearest lists,
+    shortlists documents by the Bhattacharyya coefficient and re-ranks the shortlist
+    with histogram intersection. Expression queries are answered by an InvertedIndex.
+
+    Parameters
+    ----------
+    n_lists         number of k-means lists, sqrt of the number of documents by default
+    n_probe         number of lists scanned per query
+    shortlist       number of documents re-ranked with the exact score
+    n_iter          number of k-means iterations
+    random_state    seed of the k-means initialization
+    similarity      measure of utils.similarity of the re-ranking
+    """
+
+    def __init__(
+            self, hists: List[Tuple[int, Histogram]], parser: Parser, evaluator: Evaluator,
+            n_lists: Union[int, None] = None, n_probe: int = 8, shortlist: int = 200,
+            n_iter: int = 20, random_state=None, similarity: Union[str, Similarity] = "intersection"):
+        super().__init__(hists, parser, evaluator)
+        self._similarity = get_similarity(similarity)
+        self._hists = dict(hists)
+        self._n_probe = n_probe
+        self._shortlist = shortlist
+        self._vectorizer = HistogramVectorizer(transform="sqrt")
+        self._vectors = self._vectorizer.fit_transform([hist for _, hist in hists])
+        n_lists = n_lists or max(1, int(np.sqrt(len(hists))))
+        self._centroids, labels = kmeans(self._vectors, n_lists, n_iter=n_iter, random_state=random_state)
+        order = np.argsort(labels, kind="stable")
+        self._lists = np.split(order, np.cumsum(np.bincount(labels, minlength=len(self._centroids)))[:-1])
+
+    @property
+    def n_probe(self):
+        return self._n_probe
+
+    @n_probe.setter
+    def n_probe(self, value: int):
+        self._n_probe = value
+
+    def _rank_by_histogram(self, query: Histogram, threshold: float, stats: QueryStats) -> List[Tuple[int, float]]:
+        scores = []
+        with stats.stage("candidates"):
+            query_vector = self._vectorizer.transform(query)[0]
+            centroid_distances = (self._centroids ** 2).sum(axis=1) - 2 * self._centroids @ query_vector
+            probes = np.argsort(centroid_distances)[:self._n_probe]
+            rows = np.concatenate([self._lists[probe] for probe in probes])
+            similarities = self._vectors[rows] @ query_vector
+            stats.add(postings=len(rows))
+            if len(rows) > self._shortlist:
+                rows = rows[np.argpartition(-similarities, self._shortlist - 1)[:self._shortlist]]
+        stats.add(candidates=len(rows), scored=len(rows))
+        with stats.stage("scoring"):
+            for doc_id in self._doc_ids[rows].tolist():
+                scores.append((doc_id, self._similarity(query, self._hists[doc_id])))
+        return self._rank(scores, threshold, stats)
+
+
+class CoarseToFineIndex(HistogramSearchEngine):
+    """
+    Two-stage search engine for query by histogram.
+
+    Histograms are projected onto high-level elements (expression leaves, e.g. "(top, green)"):
+    the value of a leaf is the sum of values of its low-level elements. The first stage ranks
+    all documents by intersection of the projected histograms in a single vectorized pass,
+    the second re-ranks the shortlist with the full histogram intersection.
+    Expression queries are answered by an InvertedIndex.
+
+    Parameters
+    ----------
+    shortlist       number of documents re-ranked with the exact score
+    leaves          {leaf: set of low-level element ids}, evaluator.high_level_leaves() by default
+    similarity      measure of utils.similarity of both stages, batch scores of the first one
+                    (the intersection for measures that are not elementwise)
+    """
+
+    def __init__(
+            self, hists: List[Tuple[int, Histogram]], parser: Parser, evaluator: Evaluator,
+            shortlist: int = 200, leaves: Union[Dict[str, Set[str]], None] = None,
+            similarity: Union[str, Similarity] = "intersection"):
+        super().__init__(hists, parser, evaluator)
+        self._similarity = get_similarity(similarity)
+        self._coarse_similarity = self._similarity if self._similarity.elementwise else get_similarity("intersection")
+        self._hists = dict(hists)
+        self._shortlist = shortlist
+        leaves = leaves if leaves is not None else evaluator.high_level_leaves()
+        self._leaves = list(leaves)
+        self._vectorizer = HistogramVectorizer().fit([hist for _, hist in hists])
+        self._projection = np.zeros((len(self._vectorizer.vocabulary), len(self._leaves)), dtype=np.float32)
+        for column, indexes_set in enumerate(leaves.values()):
+            for index in indexes_set:
+                row = self._vectorizer.vocabulary.get(index)
+                if row is not None:
+                    self._projection[row, column] = 1.0
+        self._projected = self._project([hist for _, hist in hists])
+
+    def _project(self, hists, batch_size=4096):
+        """Histograms of high-level elements, shape (n_hists, n_leaves)"""
+        projected = np.empty((len(hists), len(self._leaves)), dtype=np.float32)
+        for start in range(0, len(hists), batch_size):
+            projected[start:start + batch_size] = self._vectorizer.transform(
+                hists[start:start + batch_size]) @ self._projection
+        return projected
+
+    def _rank_by_histogram(self, query: Histogram, threshold: float, stats: QueryStats) -> List[Tuple[int, float]]:
+        scores = []
+        with stats.stage("candidates"):
+            coarse_scores = self._coarse_similarity.batch(self._projected, self._project([query])[0])
+            rows = np.flatnonzero(coarse_scores > threshold)
+            stats.add(postings=len(self._projected))
+            if len(rows) > self._shortlist:
+                rows = rows[np.argpartition(-coarse_scores[rows], self._shortlist - 1)[:self._shortlist]]
+        stats.add(candidates=len(rows), scored=len(rows))
+        with stats.stage("scoring"):
+            for doc_id in self._doc_ids[rows].tolist():
+                scores.append((doc_id, self._similarity(query, self._hists[doc_id])))
+        return self._rank(scores, threshold, stats)
+
+
+class CrossBinIndex(HistogramSearchEngine):
+    """
+    Search engine for query by histogram with the cross-bin quadratic-form similarity.
+
+    Histograms are kept as compressed sparse rows over the element vocabulary with their
+    h A h norms computed at ingest. A query is spread over similar elements (A q) and all
+    documents are scored at once by the sparse product of the rows with it, so documents
+    with adjacent cells or close colors match without widening the query.
+    Expression queries are answered by an InvertedIndex.
+
+    Parameters
+    ----------
+    element_similarity  ElementSimilarity, e.g. ElementSimilarity.product(position, color)
+    """
+
+    def __init__(
+            self, hists: List[Tuple[int, Histogram]], parser: Parser, evaluator: Evaluator,
+            element_similarity: ElementSimilarity):
+        super().__init__(hists, parser, evaluator)
+        self._vectorizer = HistogramVectorizer(dtype=np.float64).fit([hist for _, hist in hists])
+        self._similarity = QuadraticFormSimilarity(element_similarity).fit(self._vectorizer.vocabulary)
+        self._matrix = self._vectorizer.transform_sparse([hist for _, hist in hists])
+        self._norms = np.sqrt(self._similarity.self_similarity(self._matrix))
+
+    def _rank_by_histogram(self, query: Histogram, threshold: float, stats: QueryStats) -> List[Tuple[int, float]]:
+        with stats.stage("candidates"):
+            spread = self._similarity.spread(query)
+            query_norm = np.sqrt(sum(spread[element] * h_element.value for element, h_element in query))
+            vocabulary = self._vectorizer.vocabulary
+            spread_vector = np.zeros(len(vocabulary))
+            for element, value in spread.items():
+                if element in vocabulary:
+                    spread_vector[vocabulary[element]] = value
+        with stats.stage("scoring"):
+            norms = self._norms * query_norm
+            scores = np.divide(self._matrix.dot(spread_vector), norms, out=np.zeros(len(norms)), where=norms > 0)
+        stats.add(candidates=len(scores), postings=len(self._matrix.data), scored=len(scores))
+        with stats.stage("sorting"):
+            rows = np.flatnonzero(scores > threshold)
+            rows = rows[np.argsort(-scores[rows], kind="stable")]
+            return list(zip(self._doc_ids[rows].tolist(), scores[rows].tolist()))
+
+
+class CQueryStats(ctypes.Structure):
+    """QueryStats of library.h filled by the retrieve functions"""
+    _fields_ = [
+        ("candidates_ms", ctypes.c_double),
+        ("scoring_ms", ctypes.c_double),
+        ("sorting_ms", ctypes.c_double),
+        ("candidates", ctypes.c_longlong),
+        ("postings", ctypes.c_longlong),
+        ("scored", ctypes.c_longlong),
+    ]
+
+
+# functions of CDLL run without the GIL, retrieve calls of concurrent threads share the index
 libinvertedindex = ctypes.cdll.LoadLibrary(lib_name)
 libinvertedindex.createInvertedIndex.restype = ctypes.c_void_p
 libinvertedindex.deleteInvertedIndex.argtypes = [ctypes.c_void_p]
 libinvertedindex.addDocument.argtypes = [ctypes.c_void_p, ctypes.c_int, ctypes.c_void_p]
-libinvertedindex.retrieveByQuery.argtypes = [ctypes.c_void_p, ctypes.c_void_p, ctypes.c_int, ctypes.c_bool, ctypes.c_double, ctypes.POINTER(ctypes.c_int)]
+libinvertedindex.retrieveByQuery.argtypes = [ctypes.c_void_p, ctypes.c_void_p, ctypes.c_int, ctypes.c_bool, ctypes.c_double, ctypes.POINTER(ctypes.c_int), ctypes.POINTER(CQueryStats)]
 libinvertedindex.retrieveByQuery.restype = ctypes.c_void_p
-libinvertedindex.retrieveByHistogram.argtypes = [ctypes.c_void_p, ctypes.c_void_p, ctypes.c_int, ctypes.c_bool, ctypes.c_double, ctypes.POINTER(ctypes.c_int)]
+libinvertedindex.retrieveByQueryTopK.argtypes = [ctypes.c_void_p, ctypes.c_void_p, ctypes.c_int, ctypes.c_double, ctypes.POINTER(ctypes.c_int), ctypes.POINTER(CQueryStats)]
+libinvertedindex.retrieveByQueryTopK.restype = ctypes.c_void_p
+libinvertedindex.retrieveByHistogram.argtypes = [ctypes.c_void_p, ctypes.c_void_p, ctypes.c_int, ctypes.c_bool, ctypes.c_double, ctypes.POINTER(ctypes.c_int), ctypes.POINTER(CQueryStats)]
 libinvertedindex.retrieveByHistogram.restype = ctypes.c_void_p
+libinvertedindex.retrieveByHistogramTopK.argtypes = [ctypes.c_void_p, ctypes.c_void_p, ctypes.c_int, ctypes.c_double, ctypes.POINTER(ctypes.c_int), ctypes.POINTER(CQueryStats)]
+libinvertedindex.retrieveByHistogramTopK.restype = ctypes.c_void_p
+libinvertedindex.buildImpactOrder.argtypes = [ctypes.c_void_p]
+libinvertedindex.setSimilarity.argtypes = [ctypes.c_void_p, ctypes.c_int]
+libinvertedindex.setSimilarity.restype = ctypes.c_bool
+libinvertedindex.setNumThreads.argtypes = [ctypes.c_void_p, ctypes.c_uint]
 
 libinvertedindex.addOneDimensionalRules.argtypes = [ctypes.c_void_p, ctypes.c_void_p]
 libinvertedindex.addMultiDimensionalRules.argtypes = [ctypes.c_void_p, ctypes.c_void_p]
@@ -221,69 +732,253 @@ def decodeVectorIntDouble(data, size) -> list[tuple[int, float]]:
 
 
 class InvertedIndexCpp(BaseSearchEngine):
-    """Search engine based on inverted indexes of histogram elements using DLL library."""
+    """
+    Search engine based on inverted indexes of histogram elements using DLL library.
+
+    Retrieve calls score candidates in threads (the hardware concurrency or threads), set
+    threads=1 when many Python threads query the engine concurrently.
+    """
 
-    def __init__(self, hists: List[Tuple[int, Histogram]], parser: Parser, rules):
+    def __init__(
+            self, hists: List[Tuple[int, Histogram]], parser: Parser, rules,
+            pruning: bool = False, impact_ordered: bool = False, similarity: Union[str, Similarity] = "intersection",
+            threads: Union[int, None] = None):
         self._parser = parser
+        self._pruning = pruning
+        self._impact_ordered = impact_ordered
+        similarity = get_similarity(similarity)
+        if similarity.code is None:
+            raise ValueError("Similarity {} has no native implementation".format(similarity.name))
         self._index = libinvertedindex.createInvertedIndex()
-        if isinstance(rules, list) or isinstance(rules, list):
-            self._is_multi = True
-            self._is_single = False
+        libinvertedindex.setSimilarity(self._index, similarity.code)
+        if threads:
+            libinvertedindex.setNumThreads(self._index, threads)
+        self._is_multi = isinstance(rules, list)
+        self._is_single = not self._is_multi
+        self.add_rules(rules)
+        for hist_id, hist in hists:
+            self.add_document(hist_id, hist)
+        if impact_ordered:
+            libinvertedindex.buildImpactOrder(self._index)
+
+    def add_rules(self, rules):
+        """
+        Add high-level elements, waiting for retrieve calls of other threads to finish
+
+        One-dimensional rules {name: low-level elements} replace the ones of the same name,
+        a list of rules adds one dimension per rule.
+        """
+        if isinstance(rules, list):
             for rule in rules:
                 cpp_vec = encodeVectorPairStringVectorString(rule)
                 libinvertedindex.addMultiDimensionalRules(self._index, cpp_vec)
         else:
-            self._is_multi = False
-            self._is_single = True
             cpp_vec = encodeVectorPairStringVectorString(rules)
             libinvertedindex.addOneDimensionalRules(self._index, cpp_vec)
-        for hist_id, hist in hists:
-            cpp_map = encodeMapStringDouble(hist.to_dict())
-            libinvertedindex.addDocument(self._index, hist_id, cpp_map)
-            libinvertedindex.deleteMapStringDouble(cpp_map)
 
-    def retrieve(self, query: Union[E, Histogram], top_n: Union[int, None] = 10, last_n: Union[int, None] = None, threshold: float = 0.001):
+    def add_document(self, hist_id: int, hist: Histogram):
+        """Add a histogram, waiting for retrieve calls of other threads to finish"""
+        cpp_map = encodeMapStringDouble(hist.to_dict())
+        libinvertedindex.addDocument(self._index, hist_id, cpp_map)
+        libinvertedindex.deleteMapStringDouble(cpp_map)
+
+    def retrieve(
+            self, query: Union[E, Histogram], top_n: Union[int, None] = 10, last_n: Union[int, None] = None,
+            threshold: float = 0.001, stats: Union[QueryStats, None] = None):
         size = ctypes.c_int()
+        cpp_stats = CQueryStats() if stats is not None else None
+        stats = stats or NULL_STATS
         result = []
         if hasattr(query, "value") and isinstance(query.value, str):
             """Searching by expression"""
-            expression = ["(" + ", ".join(e) + ")" if isinstance(e, tuple) else e for e in self._parser.parse_string(query.value)]
-            cpp_expr = encodeVectorString(expression)
-            if top_n:
-                result = libinvertedindex.retrieveByQuery(self._index, cpp_expr, top_n, False, threshold, size)
+            with stats.stage("parse"):
+                expression = ["(" + ", ".join(e) + ")" if isinstance(e, tuple) else e for e in self._parser.parse_string(query.value)]
+                cpp_expr = encodeVectorString(expression)
+            if top_n is not None and self._pruning:
+                result = libinvertedindex.retrieveByQueryTopK(self._index, cpp_expr, top_n, threshold, size, cpp_stats)
+            elif top_n is not None:
+                result = libinvertedindex.retrieveByQuery(self._index, cpp_expr, top_n, False, threshold, size, cpp_stats)
             else:
-                result = libinvertedindex.retrieveByQuery(self._index, cpp_expr, last_n, True, threshold, size)
+                result = libinvertedindex.retrieveByQuery(self._index, cpp_expr, last_n, True, threshold, size, cpp_stats)
             libinvertedindex.deleteVectorString(cpp_expr)
         elif isinstance(query, Histogram):
             """Searching by data histogram"""
-            cpp_map = encodeMapStringDouble(query.to_dict())
-            if top_n:
-                result = libinvertedindex.retrieveByHistogram(self._index, cpp_map, top_n, False, threshold, size)
+            with stats.stage("parse"):
+                cpp_map = encodeMapStringDouble(query.to_dict())
+            if top_n is not None and self._impact_ordered:
+                result = libinvertedindex.retrieveByHistogramTopK(self._index, cpp_map, top_n, threshold, size, cpp_stats)
+            elif top_n is not None:
+                result = libinvertedindex.retrieveByHistogram(self._index, cpp_map, top_n, False, threshold, size, cpp_stats)
             else:
-                result = libinvertedindex.retrieveByHistogram(self._index, cpp_map, last_n, True, threshold, size)
+                result = libinvertedindex.retrieveByHistogram(self._index, cpp_map, last_n, True, threshold, size, cpp_stats)
             libinvertedindex.deleteMapStringDouble(cpp_map)
-        return decodeVectorIntDouble(result, size)
+        if cpp_stats is not None:
+            for name in ("candidates", "scoring", "sorting"):
+                stats.add_time(name, getattr(cpp_stats, name + "_ms"))
+            stats.add(candidates=cpp_stats.candidates, postings=cpp_stats.postings, scored=cpp_stats.scored)
+        with stats.stage("decode"):
+            return decodeVectorIntDouble(result, size)
     
     def __del__(self):
-        libinvertedindex.deleteInvertedIndex(self._index)
+        if getattr(self, "_index", None):
+            libinvertedindex.deleteInvertedIndex(self._index)
+
+
+class InvertedIndexNative(BaseSearchEngine):
+    """
+    Search engine based on inverted indexes of histogram elements using the compiled extension
+
+    The same index as InvertedIndexCpp without per-call marshalling through ctypes, retrieval
+    releases the GIL so threads sharing the engine query in parallel.
+    """
+
+    def __init__(
+            self, hists: List[Tuple[int, Histogram]], parser: Parser, rules,
+            pruning: bool = False, impact_ordered: bool = False, similarity: Union[str, Similarity] = "intersection",
+            threads: Union[int, None] = None):
+        if _invertedindex is None:
+            raise ImportError("The _invertedindex extension is not built, see README.")
+        self._parser = parser
+        self._pruning = pruning
+        self._impact_ordered = impact_ordered
+        similarity = get_similarity(similarity)
+        if similarity.code is None:
+            raise ValueError("Similarity {} has no native implementation".format(similarity.name))
+        self._index = _invertedindex.InvertedIndex()
+        self._index.set_similarity(similarity.code)
+        if threads:
+            self._index.set_threads(threads)
+        self.add_rules(rules)
+        for hist_id, hist in hists:
+            self.add_document(hist_id, hist)
+        if impact_ordered:
+            self._index.build_impact_order()
+
+    def add_rules(self, rules):
+        """Add high-level elements like InvertedIndexCpp.add_rules"""
+        if isinstance(rules, list):
+            for rule in rules:
+                self._index.add_multidimensional_rules(rule)
+        else:
+            self._index.add_one_dimensional_rules(rules)
+
+    def add_document(self, hist_id: int, hist: Histogram):
+        """Add a histogram, waiting for retrieve calls of other threads to finish"""
+        self._index.add_document(hist_id, *self._encode(hist))
+
+    @staticmethod
+    def _encode(hist: Histogram):
+        data = hist.to_dict()
+        return list(data), np.fromiter(data.values(), dtype=np.float64, count=len(data))
+
+    def retrieve(
+            self, query: Union[E, Histogram], top_n: Union[int, None] = 10, last_n: Union[int, None] = None,
+            threshold: float = 0.001, stats: Union[QueryStats, None] = None):
+        with_stats = stats is not None
+        stats = stats or NULL_STATS
+        count, from_end = (top_n, False) if top_n is not None else (last_n, True)
+        if hasattr(query, "value") and isinstance(query.value, str):
+            """Searching by expression"""
+            with stats.stage("parse"):
+                expression = ["(" + ", ".join(e) + ")" if isinstance(e, tuple) else e for e in self._parser.parse_string(query.value)]
+            result = self._index.retrieve_by_query(
+                expression, count, from_end, threshold, top_k=self._pruning, stats=with_stats)
+        elif isinstance(query, Histogram):
+            """Searching by data histogram"""
+            with stats.stage("parse"):
+                keys, values = self._encode(query)
+            result = self._index.retrieve_by_histogram(
+                keys, values, count, from_end, threshold, top_k=self._impact_ordered, stats=with_stats)
+        else:
+            return []
+        if not with_stats:
+            return result
+        result, native_stats = result
+        for name in ("candidates", "scoring", "sorting"):
+            stats.add_time(name, native_stats[name + "_ms"])
+        stats.add(candidates=native_stats["candidates"], postings=native_stats["postings"], scored=native_stats["scored"])
+        return result
 
 
 class SearchEngine:
-    def __init__(self, hists: List[Tuple[int, Histogram]], parser: Parser, evaluator: Evaluator, mode="default", rules=None):
+    """
+    Facade over the search engine modes
+
+    Additional keyword arguments are passed to the engine of the selected mode,
+    e.g. expression_cache or planning (a QueryPlanner, not together with a cache) for "classic" and "parallel",
+    materialize, query_elements and query_mass (query histogram truncation) and statistics (of
+    high-level elements in SearchEngine.statistics) for "classic",
+    pruning and impact_ordered for "classic", "dll" and "native" (the compiled extension),
+    threads (per retrieve call) for "dll" and "native", n_probe and shortlist for "ann",
+    shortlist and leaves for "coarse", or element_similarity for "crossbin". Other modes take
+    similarity, a measure of utils.similarity of query by histogram.
+
+    Retrieve calls are traced when stats are requested or callbacks are set, every callback
+    is called with the QueryStats of each call, e.g. to export metrics. Queries slower than
+    slow_query_ms are logged by the "utils.tracing" logger, see utils.profiler to explain them.
+    """
+
+    def __init__(
+            self, hists: List[Tuple[int, Histogram]], parser: Parser, evaluator: Evaluator,
+            mode="default", rules=None, callbacks: Union[List[Callable[[QueryStats], None]], None] = None,
+            slow_query_ms: Union[float, None] = None, **kwargs):
+        self._mode = mode
+        self._callbacks = list(callbacks or ())
+        if slow_query_ms is not None:
+            self._callbacks.append(SlowQueryLog(slow_query_ms))
         if mode == "classic":
-            self._search_engine = InvertedIndex(hists, parser, evaluator)
+            self._search_engine = InvertedIndex(hists, parser, evaluator, **kwargs)
         elif mode == "dll":
-            self._search_engine = InvertedIndexCpp(hists, parser, rules)
+            self._search_engine = InvertedIndexCpp(hists, parser, rules, **kwargs)
+        elif mode == "native":
+            self._search_engine = InvertedIndexNative(hists, parser, rules, **kwargs)
         elif mode == "parallel":
-            self._search_engine = InvertedIndexParallel(hists, parser, evaluator)
+            self._search_engine = InvertedIndexParallel(hists, parser, evaluator, **kwargs)
+        elif mode == "ann":
+            self._search_engine = ApproximateIndex(hists, parser, evaluator, **kwargs)
+        elif mode == "coarse":
+            self._search_engine = CoarseToFineIndex(hists, parser, evaluator, **kwargs)
+        elif mode == "crossbin":
+            self._search_engine = CrossBinIndex(hists, parser, evaluator, **kwargs)
         elif mode == "default":
-            self._search_engine = DefaultSearchEngine(hists, parser, evaluator)
+            self._search_engine = DefaultSearchEngine(hists, parser, evaluator, **kwargs)
         else:
             raise NotImplemented("Not implemented yet.")
 
+    @property
+    def statistics(self) -> Union[IndexStatistics, None]:
+        """Statistics catalog of the index, None for modes without one"""
+        return getattr(self._search_engine, "statistics", None)
+
+    def add_callback(self, callback: Callable[[QueryStats], None]):
+        self._callbacks.append(callback)
+
+    def remove_callback(self, callback: Callable[[QueryStats], None]):
+        self._callbacks.remove(callback)
+
     def retrieve(
             self, query: Union[E, Histogram],
             top_n: Union[int, None] = 10,
             last_n: Union[int, None] = None,
-            threshold: float = 0.001):
-        return self._search_engine.retrieve(query, top_n, last_n, threshold)
+            threshold: float = 0.001,
+            return_stats: bool = False):
+        """
+        Ranked (doc id, score) pairs of a query
+
+        Returns (ranked pairs, QueryStats) if return_stats is set
+        """
+        if not return_stats and not self._callbacks:
+            return self._search_engine.retrieve(query, top_n, last_n, threshold)
+        if isinstance(query, Histogram):
+            stats = QueryStats(self._mode, "histogram", "<histogram of {} elements>".format(len(query)))
+        else:
+            stats = QueryStats(self._mode, "expression", str(query))
+        start_time = time.perf_counter()
+        result = self._search_engine.retrieve(query, top_n, last_n, threshold, stats)
+        stats.total_ms = (time.perf_counter() - start_time) * 1000
+        stats.results = len(result[0]) if isinstance(result, tuple) else len(result)
+        for callback in self._callbacks:
+            callback(stats)
+        if return_stats:
+            return result, stats
+        return result
@@ -0,0 +1,288 @@
+import itertools
+from typing import Callable, Dict, Tuple, Union
+
+import numpy as np
+
+from himpy.histogram import Histogram
+from .vectorization import CSRMatrix
+
+
+"""
+Similarity Measures of Histograms
+
+Measures of normalized histograms in [0, 1], 1 for equal histograms and 0 for histograms
+without common elements, so candidates of a query are the documents sharing its elements.
+
+    intersection    sum of min(a, b)
+    l1              1 - sum |a - b| / 2
+    chi2            1 - sum (a - b)^2 / (a + b) / 2
+    bhattacharyya   sum sqrt(a * b)
+    hellinger       1 - sqrt(1 - bhattacharyya)
+    cosine          sum a * b / (|a| * |b|)
+
+Cross-bin measures also match similar elements, e.g. adjacent grid cells or close colors,
+see QuadraticFormSimilarity.
+"""
+
+
+class Similarity:
+    """
+    Similarity measure of a query histogram and a document histogram
+
+    Parameters
+    ----------
+    name        name in the registry
+    pairwise    score of two histograms: pairwise(query, hist) -> float
+    batch       scores of dense vectors (e.g. of HistogramVectorizer): batch(X, q) -> shape (n_samples,)
+    code        id of the measure in library.cpp
+    min_bound   min(query value, value) bounds the score of an element, impact-ordered
+                posting lists stop early by this bound
+    elementwise batch scores vectors over any elements, e.g. projected histograms
+    """
+
+    def __init__(
+            self, name: str, pairwise: Callable[[Histogram, Histogram], float],
+            batch: Callable[[np.ndarray, np.ndarray], np.ndarray], code: Union[int, None] = None,
+            min_bound: bool = False, elementwise: bool = True):
+        self.name = name
+        self.pairwise = pairwise
+        self.batch = batch
+        self.code = code
+        self.min_bound = min_bound
+        self.elementwise = elementwise
+
+    def __call__(self, query: Histogram, hist: Histogram) -> float:
+        return self.pairwise(query, hist)
+
+    def __repr__(self):
+        return "Similarity({})".format(self.name)
+
+
+def _common(query: Histogram, hist: Histogram):
+    """(query value, value) pairs of common elements"""
+    elements_1, elements_2 = query.hist_elements(), hist.hist_elements()
+    if len(elements_1) > len(elements_2):
+        return [(elements_1[key].value, h_element.value) for key, h_element in elements_2.items() if key in elements_1]
+    return [(h_element.value, elements_2[key].value) for key, h_element in elements_1.items() if key in elements_2]
+
+
+"""
+Pairwise Similarity
+"""
+
+
+def intersection(query: Histogram, hist: Histogram) -> float:
+    return (query * hist).sum()
+
+
+def l1(query: Histogram, hist: Histogram) -> float:
+    # |a - b| = a + b - 2 * min(a, b), elements of a single histogram add their values
+    return 1.0 - (query.sum() + hist.sum()) / 2 + sum(min(a, b) for a, b in _common(query, hist))
+
+
+def chi2(query: Histogram, hist: Histogram) -> float:
+    # (a - b)^2 / (a + b) = a + b - 4ab / (a + b), elements of a single histogram add their values
+    return 1.0 - (query.sum() + hist.sum()) / 2 + sum(2 * a * b / (a + b) for a, b in _common(query, hist) if a + b)
+
+
+def bhattacharyya(query: Histogram, hist: Histogram) -> float:
+    return sum(np.sqrt(a * b) for a, b in _common(query, hist))
+
+
+def hellinger(query: Histogram, hist: Histogram) -> float:
+    return 1.0 - np.sqrt(max(0.0, 1.0 - bhattacharyya(query, hist)))
+
+
+def cosine(query: Histogram, hist: Histogram) -> float:
+    norm = np.sqrt(sum(h_element.value ** 2 for _, h_element in query) * sum(h_element.value ** 2 for _, h_element in hist))
+    return sum(a * b for a, b in _common(query, hist)) / norm if norm else 0.0
+
+
+"""
+Batch Similarity
+"""
+
+
+def intersection_batch(X: np.ndarray, q: np.ndarray) -> np.ndarray:
+    return np.minimum(X, q).sum(axis=1)
+
+
+def l1_batch(X: np.ndarray, q: np.ndarray) -> np.ndarray:
+    return 1.0 - np.abs(X - q).sum(axis=1) / 2
+
+
+def chi2_batch(X: np.ndarray, q: np.ndarray) -> np.ndarray:
+    sums = X + q
+    with np.errstate(divide="ignore", invalid="ignore"):
+        terms = np.where(sums > 0, (X - q) ** 2 / sums, 0.0)
+    return 1.0 - terms.sum(axis=1) / 2
+
+
+def bhattacharyya_batch(X: np.ndarray, q: np.ndarray) -> np.ndarray:
+    return np.sqrt(X) @ np.sqrt(q)
+
+
+def hellinger_batch(X: np.ndarray, q: np.ndarray) -> np.ndarray:
+    return 1.0 - np.sqrt(np.maximum(0.0, 1.0 - bhattacharyya_batch(X, q)))
+
+
+def cosine_batch(X: np.ndarray, q: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(X, axis=1) * np.linalg.norm(q)
+    return np.divide(X @ q, norms, out=np.zeros(len(X), dtype=np.result_type(X, q)), where=norms > 0)
+
+
+"""
+Registry
+"""
+
+
+SIMILARITIES = {
+    "intersection": Similarity("intersection", intersection, intersection_batch, code=0, min_bound=True),
+    "l1": Similarity("l1", l1, l1_batch, code=1),
+    "chi2": Similarity("chi2", chi2, chi2_batch, code=2),
+    "bhattacharyya": Similarity("bhattacharyya", bhattacharyya, bhattacharyya_batch, code=3),
+    "hellinger": Similarity("hellinger", hellinger, hellinger_batch, code=4),
+    "cosine": Similarity("cosine", cosine, cosine_batch, code=5),
+}
+
+
+def register_similarity(similarity: Similarity):
+    """Add a measure to the registry, measures without a code are not available in the "dll" mode"""
+    SIMILARITIES[similarity.name] = similarity
+
+
+def get_similarity(similarity: Union[str, Similarity]) -> Similarity:
+    if isinstance(similarity, Similarity):
+        return similarity
+    if similarity not in SIMILARITIES:
+        raise ValueError("Unknown similarity: {}, available: {}".format(similarity, ", ".join(SIMILARITIES)))
+    return SIMILARITIES[similarity]
+
+
+"""
+Cross-bin Similarity
+"""
+
+
+class ElementSimilarity:
+    """
+    Sparse symmetric similarity of elements, 1 for an element and itself
+
+    Parameters
+    ----------
+    weights     {(element id, element id): similarity} of distinct elements,
+                e.g. color_element_similarity() of utils.feature_extraction
+    """
+
+    def __init__(self, weights: Union[Dict[Tuple[str, str], float], None] = None):
+        self._neighbours = dict()
+        for (element_1, element_2), weight in (weights or dict()).items():
+            if element_1 != element_2 and weight > 0:
+                self._neighbours.setdefault(element_1, dict())[element_2] = weight
+                self._neighbours.setdefault(element_2, dict())[element_1] = weight
+
+    @staticmethod
+    def product(*factors: 'ElementSimilarity', separator: str = ", ") -> 'ProductElementSimilarity':
+        """Similarity of multidimensional elements, e.g. "12, e31", as the product of similarities of parts"""
+        return ProductElementSimilarity(factors, separator)
+
+    def neighbours(self, element: str) -> Dict[str, float]:
+        """Similar elements including the element itself: {element id: similarity}"""
+        neighbours = {element: 1.0}
+        neighbours.update(self._neighbours.get(element, ()))
+        return neighbours
+
+    def matrix(self, vocabulary: Dict[str, int]) -> CSRMatrix:
+        """Similarity matrix of the vocabulary {element id: column}, e.g. of HistogramVectorizer"""
+        rows = [dict() for _ in range(len(vocabulary))]
+        for element, column in vocabulary.items():
+            rows[column] = {vocabulary[neighbour]: weight for neighbour, weight in self.neighbours(element).items()
+                            if neighbour in vocabulary}
+        return CSRMatrix.from_rows(rows, len(vocabulary), dtype=np.float64)
+
+    def __call__(self, element_1: str, element_2: str) -> float:
+        return self.neighbours(element_1).get(element_2, 0.0)
+
+
+class ProductElementSimilarity(ElementSimilarity):
+    """Similarity of multidimensional elements, the product of similarities of their parts"""
+
+    def __init__(self, factors, separator: str = ", "):
+        super(ProductElementSimilarity, self).__init__()
+        self._factors = tuple(factors)
+        self._separator = separator
+        self._cache = dict()
+
+    def neighbours(self, element: str) -> Dict[str, float]:
+        neighbours = self._cache.get(element)
+        if neighbours is None:
+            parts = element.split(self._separator)
+            if len(parts) != len(self._factors):
+                return {element: 1.0}
+            neighbours = dict()
+            for combination in itertools.product(*(factor.neighbours(part).items()
+                                                   for factor, part in zip(self._factors, parts))):
+                neighbours[self._separator.join(part for part, _ in combination)] = float(
+                    np.prod([weight for _, weight in combination]))
+            self._cache[element] = neighbours
+        return neighbours
+
+
+class QuadraticFormSimilarity(Similarity):
+    """
+    Cross-bin similarity q A h / sqrt(q A q * h A h) of an element similarity matrix A
+
+    Similar elements of the query and the document add to the score, without similar
+    distinct elements it is the cosine similarity. Batch scores need the vocabulary of
+    the vectors, see fit.
+
+    Parameters
+    ----------
+    element_similarity  ElementSimilarity, e.g. ElementSimilarity.product(position, color)
+    """
+
+    def __init__(self, element_similarity: ElementSimilarity, name: str = "quadratic"):
+        super(QuadraticFormSimilarity, self).__init__(name, self._pairwise, self._batch, elementwise=False)
+        self.element_similarity = element_similarity
+        self.matrix = None
+
+    def fit(self, vocabulary: Dict[str, int]) -> 'QuadraticFormSimilarity':
+        self.matrix = self.element_similarity.matrix(vocabulary)
+        return self
+
+    def spread(self, hist: Histogram) -> Dict[str, float]:
+        """A h: {element id: sum of values of similar elements weighted by similarity}"""
+        spread = dict()
+        for element, h_element in hist:
+            for neighbour, weight in self.element_similarity.neighbours(element).items():
+                spread[neighbour] = spread.get(neighbour, 0.0) + weight * h_element.value
+        return spread
+
+    def self_similarity(self, X: Union[np.ndarray, CSRMatrix], batch_size: int = 256) -> np.ndarray:
+        """h A h of every row of X, dense vectors or compressed sparse rows"""
+        if self.matrix is None:
+            raise Exception("Use the fit method at first.")
+        if isinstance(X, CSRMatrix):
+            return X.quadratic_form(self.matrix)
+        result = np.empty(len(X), dtype=np.float64)
+        for start in range(0, len(X), batch_size):
+            batch = X[start:start + batch_size]
+            result[start:start + batch_size] = (batch.T * self.matrix.dot_dense(batch.T)).sum(axis=0)
+        return result
+
+    def _pairwise(self, query: Histogram, hist: Histogram) -> float:
+        spread = self.spread(query)
+        numerator = sum(spread.get(element, 0.0) * h_element.value for element, h_element in hist)
+        if numerator <= 0:
+            return 0.0
+        query_norm = sum(spread[element] * h_element.value for element, h_element in query)
+        hist_spread = self.spread(hist)
+        hist_norm = sum(hist_spread[element] * h_element.value for element, h_element in hist)
+        return numerator / np.sqrt(query_norm * hist_norm)
+
+    def _batch(self, X: np.ndarray, q: np.ndarray) -> np.ndarray:
+        if self.matrix is None:
+            raise Exception("Use the fit method at first.")
+        spread = self.matrix.dot(q)
+        norms = self.self_similarity(X) * (q @ spread)
+        return np.divide(X @ spread, np.sqrt(norms), out=np.zeros(len(X)), where=norms > 0)
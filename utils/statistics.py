@@ -0,0 +1,129 @@
+from typing import Dict, Set, Union
+
+import numpy as np
+
+from himpy.executor import Evaluator
+from himpy.histogram import Histogram
+
+
+"""
+Index Statistics
+"""
+
+
+class IndexStatistics:
+    """
+    Catalog of statistics of indexed histograms updated as documents are added
+
+    For every low-level element and every high-level element (expression leaf, e.g. "green"
+    or "(any, red)") it keeps the document frequency, the total mass and the maximum value.
+    The mass of a high-level element in a document is the sum of values of its elements.
+
+    Statistics of low-level elements are cheap, the ones of high-level elements add the
+    masses of every leaf of every element at ingest and are only kept for given leaves.
+
+    Parameters
+    ----------
+    leaves      {leaf: set of low-level element ids}, e.g. Evaluator.high_level_leaves()
+    """
+
+    def __init__(self, leaves: Union[Dict[str, Set[str]], None] = None):
+        self._leaves = leaves or dict()
+        self._element_leaves = Evaluator.element_leaves(self._leaves)
+        self._elements = dict()
+        self._high_level_elements = {leaf: [0, 0.0, 0.0] for leaf in self._leaves}
+        self.num_documents = 0
+
+    def add(self, doc_id: int, hist: Histogram):
+        elements = self._elements
+        for index, h_element in hist:
+            value = h_element.value
+            element = elements.get(index)
+            if element is None:
+                element = elements[index] = [0, 0.0, 0.0]
+            element[0] += 1
+            element[1] += value
+            if value > element[2]:
+                element[2] = value
+        if self._element_leaves:
+            self._add_high_level(hist)
+        self.num_documents += 1
+
+    def _add_high_level(self, hist: Histogram):
+        element_leaves = self._element_leaves
+        masses = dict()
+        for index, h_element in hist:
+            for leaf in element_leaves.get(index, ()):
+                masses[leaf] = masses.get(leaf, 0.0) + h_element.value
+        for leaf, mass in masses.items():
+            element = self._high_level_elements[leaf]
+            element[0] += 1
+            element[1] += mass
+            if mass > element[2]:
+                element[2] = mass
+
+    def document_frequency(self, index: str) -> int:
+        """Number of documents with a low-level element, the length of its posting list"""
+        element = self._elements.get(index)
+        return element[0] if element else 0
+
+    def total_mass(self, index: str) -> float:
+        element = self._elements.get(index)
+        return element[1] if element else 0.0
+
+    def max_value(self, index: str) -> float:
+        element = self._elements.get(index)
+        return element[2] if element else 0.0
+
+    def leaf_document_frequency(self, leaf: str) -> Union[int, None]:
+        """Number of documents with any element of a high-level element, None for unknown leaves"""
+        element = self._high_level_elements.get(leaf)
+        return element[0] if element else None
+
+    def leaf_max_value(self, leaf: str) -> Union[float, None]:
+        """Maximum mass of a high-level element in a document, None for unknown leaves"""
+        element = self._high_level_elements.get(leaf)
+        return element[2] if element else None
+
+    def element(self, index: str) -> Dict[str, float]:
+        """Statistics of a low-level element: df, total_mass, mean_mass per document and max_value"""
+        return self._describe(self._elements.get(index, (0, 0.0, 0.0)))
+
+    def high_level_element(self, leaf: str) -> Dict[str, float]:
+        """Statistics of a high-level element: df, total_mass, mean_mass per document and max_value"""
+        if leaf not in self._high_level_elements:
+            raise KeyError(leaf)
+        return self._describe(self._high_level_elements[leaf])
+
+    def elements(self) -> Dict[str, Dict[str, float]]:
+        return {index: self._describe(element) for index, element in self._elements.items()}
+
+    def high_level_elements(self) -> Dict[str, Dict[str, float]]:
+        return {leaf: self._describe(element) for leaf, element in self._high_level_elements.items()}
+
+    def posting_lengths(self, percentiles=(50, 90, 99)) -> Dict[str, float]:
+        """Distribution of posting list lengths over low-level elements"""
+        lengths = np.array([element[0] for element in self._elements.values()], dtype=np.int64)
+        if not len(lengths):
+            return {"count": 0}
+        distribution = {"count": len(lengths), "total": int(lengths.sum()), "mean": float(lengths.mean()),
+                        "min": int(lengths.min()), "max": int(lengths.max())}
+        for percentile, value in zip(percentiles, np.percentile(lengths, percentiles)):
+            distribution["p{}".format(percentile)] = float(value)
+        return distribution
+
+    def summary(self) -> Dict[str, Union[int, Dict[str, float]]]:
+        return {"num_documents": self.num_documents, "num_elements": len(self._elements),
+                "posting_lengths": self.posting_lengths()}
+
+    @staticmethod
+    def _describe(element) -> Dict[str, float]:
+        df, total_mass, max_value = element
+        return {"df": df, "total_mass": float(total_mass), "mean_mass": float(total_mass / df) if df else 0.0,
+                "max_value": float(max_value)}
+
+    def __contains__(self, index):
+        return index in self._elements
+
+    def __len__(self):
+        return len(self._elements)
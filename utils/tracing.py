@@ -0,0 +1,136 @@
+import logging
+import time
+from contextlib import contextmanager, nullcontext
+from typing import Any, Dict, Union
+
+
+"""
+Query Tracing
+
+Stages of a retrieve call:
+
+    parse       parsing and encoding of the query
+    candidates  candidate generation, e.g. eval_expression over posting lists
+    scoring     scoring of candidate documents
+    sorting     filtering by threshold and ranking
+"""
+
+
+class QueryStats:
+    """
+    Per-stage wall times and counters of a retrieve call
+
+    Attributes
+    ----------
+    mode        search engine mode
+    query_type  "expression" or "histogram"
+    query       text of an expression query or the number of elements of a histogram query
+    stages      {stage: wall time in milliseconds}
+    total_ms    wall time of the whole call, set by SearchEngine
+    candidates  number of candidate documents
+    postings    number of posting list entries touched
+    scored      number of scored documents
+    results     number of returned documents
+    """
+
+    def __init__(
+            self, mode: Union[str, None] = None, query_type: Union[str, None] = None, query: Union[str, None] = None):
+        self.mode = mode
+        self.query_type = query_type
+        self.query = query
+        self.stages = dict()
+        self.total_ms = 0.0
+        self.candidates = 0
+        self.postings = 0
+        self.scored = 0
+        self.results = 0
+
+    @contextmanager
+    def stage(self, name: str):
+        start_time = time.perf_counter()
+        try:
+            yield self
+        finally:
+            self.add_time(name, (time.perf_counter() - start_time) * 1000)
+
+    def add_time(self, name: str, elapsed_ms: float):
+        self.stages[name] = self.stages.get(name, 0.0) + elapsed_ms
+
+    def add(self, candidates: int = 0, postings: int = 0, scored: int = 0):
+        self.candidates += candidates
+        self.postings += postings
+        self.scored += scored
+
+    def count_postings(self, storage):
+        """Storage of posting lists that counts entries of the accessed ones"""
+        return CountingPostings(storage, self)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "mode": self.mode, "query_type": self.query_type, "query": self.query, "total_ms": self.total_ms,
+            "stages": dict(self.stages), "candidates": self.candidates, "postings": self.postings,
+            "scored": self.scored, "results": self.results}
+
+    def __repr__(self):
+        stages = ", ".join("{}={:.3f}ms".format(name, elapsed) for name, elapsed in self.stages.items())
+        return "QueryStats(mode={}, total={:.3f}ms, {}, candidates={}, postings={}, scored={}, results={})".format(
+            self.mode, self.total_ms, stages, self.candidates, self.postings, self.scored, self.results)
+
+
+class NullStats:
+    """Stats of an untraced call, all methods are no-ops"""
+
+    def stage(self, name: str):
+        return nullcontext(self)
+
+    def add_time(self, name: str, elapsed_ms: float):
+        pass
+
+    def add(self, candidates: int = 0, postings: int = 0, scored: int = 0):
+        pass
+
+    def count_postings(self, storage):
+        return storage
+
+
+NULL_STATS = NullStats()
+
+
+class CountingPostings:
+    """Read-only view of {element id: set of doc ids} adding sizes of accessed posting lists to stats"""
+
+    def __init__(self, storage, stats: QueryStats):
+        self._storage = storage
+        self._stats = stats
+
+    def __getitem__(self, index):
+        doc_ids = self._storage[index]
+        self._stats.postings += len(doc_ids)
+        return doc_ids
+
+    def __contains__(self, index):
+        return index in self._storage
+
+    def __len__(self):
+        return len(self._storage)
+
+    def __iter__(self):
+        return iter(self._storage)
+
+
+class SlowQueryLog:
+    """
+    Callback logging queries slower than threshold_ms with their stats
+
+    Usage:
+        SearchEngine(hists, parser, evaluator, mode="classic", slow_query_ms=100)
+    """
+
+    def __init__(self, threshold_ms: float, logger: Union[logging.Logger, None] = None, level: int = logging.WARNING):
+        self.threshold_ms = threshold_ms
+        self._logger = logger or logging.getLogger(__name__)
+        self._level = level
+
+    def __call__(self, stats: QueryStats):
+        if stats.total_ms >= self.threshold_ms:
+            self._logger.log(self._level, "Slow query %s: %r", stats.query, stats)
@@ -0,0 +1,200 @@
+import numpy as np
+
+from himpy.histogram import Histogram
+
+
+"""
+Dense Vectors of Histograms
+"""
+
+
+class HistogramVectorizer:
+    """
+    Map histograms to dense vectors over the element vocabulary
+
+    Parameters
+    ----------
+    transform   None to keep element values or "sqrt" for the Hellinger embedding,
+                in which the inner product of two vectors is the Bhattacharyya coefficient
+    dtype       dtype of the vectors
+    """
+
+    def __init__(self, transform=None, dtype=np.float32):
+        if transform not in (None, "sqrt"):
+            raise ValueError("Unsupported transform: {}".format(transform))
+        self._transform = transform
+        self._dtype = dtype
+        self._vocabulary = None
+
+    @property
+    def vocabulary(self):
+        """Dictionary {element id: column}"""
+        return self._vocabulary
+
+    def fit(self, X, y=None):
+        elements = set()
+        for hist in X:
+            elements.update(hist.elements())
+        self._vocabulary = {element: i for i, element in enumerate(sorted(elements, key=str))}
+        return self
+
+    def transform(self, X):
+        if self._vocabulary is None:
+            raise Exception("Use the fit method at first.")
+        hists = [X] if isinstance(X, Histogram) else X
+        vectors = np.zeros((len(hists), len(self._vocabulary)), dtype=self._dtype)
+        for i, hist in enumerate(hists):
+            for element, h_element in hist:
+                column = self._vocabulary.get(element)
+                if column is not None:
+                    vectors[i, column] = h_element.value
+        if self._transform == "sqrt":
+            np.sqrt(vectors, out=vectors)
+        return vectors
+
+    def fit_transform(self, X, y=None):
+        return self.fit(X, y).transform(X)
+
+    def transform_sparse(self, X) -> 'CSRMatrix':
+        """Compressed sparse rows of histograms, values of the transform"""
+        if self._vocabulary is None:
+            raise Exception("Use the fit method at first.")
+        hists = [X] if isinstance(X, Histogram) else X
+        rows = [{self._vocabulary[element]: h_element.value for element, h_element in hist
+                 if element in self._vocabulary} for hist in hists]
+        matrix = CSRMatrix.from_rows(rows, len(self._vocabulary), dtype=self._dtype)
+        if self._transform == "sqrt":
+            np.sqrt(matrix.data, out=matrix.data)
+        return matrix
+
+
+"""
+Sparse Matrices
+"""
+
+
+class CSRMatrix:
+    """
+    Compressed sparse rows matrix
+
+    Values of row i are data[indptr[i]:indptr[i + 1]] in columns indices[indptr[i]:indptr[i + 1]].
+    """
+
+    def __init__(self, indptr: np.ndarray, indices: np.ndarray, data: np.ndarray, shape):
+        self.indptr = indptr
+        self.indices = indices
+        self.data = data
+        self.shape = tuple(shape)
+        self._row_ids = None
+
+    @classmethod
+    def from_rows(cls, rows, n_columns: int, dtype=np.float32) -> 'CSRMatrix':
+        """Matrix of rows given as dictionaries {column: value}"""
+        indptr = np.zeros(len(rows) + 1, dtype=np.int64)
+        np.cumsum([len(row) for row in rows], out=indptr[1:])
+        indices = np.empty(indptr[-1], dtype=np.int64)
+        data = np.empty(indptr[-1], dtype=dtype)
+        for i, row in enumerate(rows):
+            order = sorted(row)
+            indices[indptr[i]:indptr[i + 1]] = order
+            data[indptr[i]:indptr[i + 1]] = [row[column] for column in order]
+        return cls(indptr, indices, data, (len(rows), n_columns))
+
+    @property
+    def row_ids(self) -> np.ndarray:
+        """Row of every stored value"""
+        if self._row_ids is None:
+            self._row_ids = np.repeat(np.arange(self.shape[0]), np.diff(self.indptr))
+        return self._row_ids
+
+    def dot(self, v: np.ndarray) -> np.ndarray:
+        """Product with a dense vector, shape (n_rows,)"""
+        return np.bincount(self.row_ids, weights=self.data * v[self.indices], minlength=self.shape[0])
+
+    def dot_dense(self, X: np.ndarray) -> np.ndarray:
+        """Product with a dense matrix, shape (n_rows, X.shape[1])"""
+        result = np.zeros((self.shape[0], X.shape[1]), dtype=np.result_type(self.data, X))
+        filled = np.diff(self.indptr) > 0
+        if filled.any():
+            # Segments of empty rows are empty, so starts of filled rows delimit all values
+            result[filled] = np.add.reduceat(self.data[:, None] * X[self.indices], self.indptr[:-1][filled], axis=0)
+        return result
+
+    def quadratic_form(self, matrix: 'CSRMatrix', batch_size: int = 1024) -> np.ndarray:
+        """x A x of every row x for a square matrix A, shape (n_rows,)"""
+        result = np.empty(self.shape[0], dtype=np.result_type(self.data, matrix.data))
+        matrix_lengths = np.diff(matrix.indptr)
+        for start in range(0, self.shape[0], batch_size):
+            batch = self.rows(start, min(start + batch_size, self.shape[0]))
+            # Every stored value x_i is paired with every stored A_ij of its column
+            lengths = matrix_lengths[batch.indices]
+            entries = np.repeat(np.arange(len(batch.indices)), lengths)
+            offsets = np.arange(len(entries)) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+            positions = np.repeat(matrix.indptr[batch.indices], lengths) + offsets
+            rows = batch.row_ids[entries]
+            values = batch.data[entries] * matrix.data[positions] * batch.toarray()[rows, matrix.indices[positions]]
+            result[start:start + len(batch)] = np.bincount(rows, weights=values, minlength=len(batch))
+        return result
+
+    def rows(self, start: int, stop: int) -> 'CSRMatrix':
+        indptr = self.indptr[start:stop + 1]
+        return CSRMatrix(indptr - indptr[0], self.indices[indptr[0]:indptr[-1]], self.data[indptr[0]:indptr[-1]],
+                         (len(indptr) - 1, self.shape[1]))
+
+    def toarray(self) -> np.ndarray:
+        dense = np.zeros(self.shape, dtype=self.data.dtype)
+        dense[self.row_ids, self.indices] = self.data
+        return dense
+
+    def __len__(self):
+        return self.shape[0]
+
+
+"""
+Clustering
+"""
+
+
+def kmeans(X, n_clusters, n_iter=20, random_state=None, batch_size=4096):
+    """
+    Lloyd's k-means
+
+    Parameters
+    ----------
+    X               vectors, shape (n_samples, n_features)
+    n_clusters      number of clusters
+    n_iter          number of iterations
+    random_state    seed or numpy.random.Generator used to pick initial centroids
+    batch_size      number of vectors assigned at once, bounds memory of distances
+
+    Returns
+    -------
+    centroids, shape (n_clusters, n_features), and cluster of every vector
+    """
+    rng = np.random.default_rng(random_state)
+    n_clusters = min(n_clusters, len(X))
+    centroids = X[rng.choice(len(X), size=n_clusters, replace=False)].astype(np.float64)
+    labels = np.zeros(len(X), dtype=np.intp)
+    for _ in range(n_iter):
+        labels = assign_clusters(X, centroids, batch_size)
+        counts = np.bincount(labels, minlength=n_clusters)
+        starts = np.cumsum(counts) - counts
+        empty = counts == 0
+        # Sum vectors of every cluster over contiguous segments of sorted labels
+        sums = np.add.reduceat(X[np.argsort(labels, kind="stable")], starts[~empty], axis=0)
+        centroids[~empty] = sums / counts[~empty, None]
+        # Re-seed empty clusters with random vectors
+        centroids[empty] = X[rng.choice(len(X), size=int(empty.sum()), replace=False)]
+    return centroids.astype(X.dtype), assign_clusters(X, centroids, batch_size)
+
+
+def assign_clusters(X, centroids, batch_size=4096):
+    """Index of the nearest (euclidean) centroid of every vector"""
+    labels = np.empty(len(X), dtype=np.intp)
+    centroid_norms = (centroids ** 2).sum(axis=1)
+    for start in range(0, len(X), batch_size):
+        batch = X[start:start + batch_size]
+        # |x - c|^2 without |x|^2 that is the same for every centroid
+        distances = centroid_norms[None, :] - 2 * batch @ centroids.T
+        labels[start:start + batch_size] = distances.argmin(axis=1)
+    return labels